@@ -1,36 +1,121 @@
+import os
+import tempfile
+from concurrent.futures import (
+    Executor,
+    ThreadPoolExecutor,
+    ProcessPoolExecutor
+)
+from contextlib import nullcontext
+from dataclasses import asdict, replace
+from itertools import repeat
 import pandas as pd
 import numpy as np
-from scipy import stats
-from sklearn.metrics import (
-     roc_curve,
-     roc_auc_score,
-     precision_recall_curve,
-     auc
-)
 from .model import (
     VEQueryCriteria,
-    VEAnalysisResult
+    VEAnalysisResult,
+    UserAnalysisState
 )
 from .repository import (
      VariantEffectScoreRepository,
      VariantEffectLabelRepository,
      VariantEffectSourceRepository,
-     VARIANT_PK_COLUMNS
+     VariantRepository,
+     VARIANT_PK_COLUMNS,
+     VARIANT_KEY_COLUMN,
+     has_allele_frequency_criteria,
+     query_region_files
+)
+from .pd_util import filter_dataframe_by_list, lazy_copy
+from .util import str_or_list_to_list
+from .snapshot import AnalysisSnapshotStore
+from .user_scores import (
+    read_user_score_chunks,
+    USER_SCORE_COLUMNS,
+    DEFAULT_CHUNK_SIZE
+)
+from .result_cache import AnalysisResultCache
+from .storage import file_stats
+from .metrics import (
+    SortedScores,
+    sort_scores,
+    roc_curves,
+    pr_curves,
+    mann_whitney_u,
+    partition_sources,
+    save_sorted_scores,
+    load_sorted_scores,
+    BootstrapOptions,
+    bootstrap_auc_intervals,
+    delong_covariance,
+    delong_pairwise_tests
 )
-from .pd_util import filter_dataframe_by_list
 
 VARIANT_EFFECT_SCORE_COLS = ["SCORE_SOURCE"] +\
     VARIANT_PK_COLUMNS + ["RANK_SCORE"]
+ANALYSIS_SCORE_COLS = VARIANT_EFFECT_SCORE_COLS + [VARIANT_KEY_COLUMN]
+USER_SCORE_COLS = VARIANT_PK_COLUMNS + [VARIANT_KEY_COLUMN, "RANK_SCORE"]
+USER_SCORE_LABEL_COLS = [VARIANT_KEY_COLUMN, "RANK_SCORE", "BINARY_LABEL"]
+
+THREAD_EXECUTOR = "thread"
+PROCESS_EXECUTOR = "process"
+EXECUTOR_CLASSES = {
+    THREAD_EXECUTOR: ThreadPoolExecutor,
+    PROCESS_EXECUTOR: ProcessPoolExecutor
+}
+# The sorted scores are passed to worker processes as files in this
+# directory, when it exists, which is backed by shared memory on linux.
+SHARED_MEMORY_DIR = "/dev/shm"
 
 
 class VEAnalyzer:
 
     def __init__(self, variant_effect_score_repo: VariantEffectScoreRepository,
                  variant_effect_label_repo: VariantEffectLabelRepository,
-                 variant_effect_source_repo: VariantEffectSourceRepository):
+                 variant_effect_source_repo: VariantEffectSourceRepository,
+                 variant_repo: VariantRepository,
+                 executor: str | Executor = None,
+                 max_workers: int = None,
+                 snapshot_store: AnalysisSnapshotStore = None,
+                 result_cache: AnalysisResultCache = None):
+        """
+        Parameters
+        ----------
+        executor : str or Executor, optional
+            If specified the metrics of the variant effect sources of
+            an analysis are computed in parallel, the sources being
+            split into one group per worker. Either "thread" for a
+            thread pool, "process" for a process pool or an existing
+            concurrent.futures Executor. The pool is created for each
+            analysis unless an Executor is passed. A process pool
+            reads the sorted scores from memory mapped files rather
+            than receiving a copy of them.
+        max_workers : int, optional
+            Number of workers of the pool. Defaults to the number of
+            cpus.
+        snapshot_store : AnalysisSnapshotStore, optional
+            If specified the results of analyses of the system veps
+            alone, i.e. without user scores and with no query criteria
+            other than a filter name, are persisted in it and served
+            from it while the repository files are unchanged.
+        result_cache : AnalysisResultCache, optional
+            If specified the results of compute_metrics are cached in
+            it keyed by a fingerprint of the user scores, query
+            criteria and other parameters, and returned from it when
+            called again with the same ones.
+        """
         self._variant_effect_score_repo = variant_effect_score_repo
         self._variant_effect_label_repo = variant_effect_label_repo
         self._variant_effect_source_repo = variant_effect_source_repo
+        self._variant_repo = variant_repo
+        if (isinstance(executor, str) and
+                executor not in EXECUTOR_CLASSES):
+            raise Exception(
+                f"{executor} is not a supported executor. It must be " +
+                f"one of {list(EXECUTOR_CLASSES.keys())}")
+        self._executor = executor
+        self._max_workers = max_workers
+        self._snapshot_store = snapshot_store
+        self._result_cache = result_cache
 
     def get_analysis_scores_and_labels(
             self,
@@ -44,6 +129,28 @@ class VEAnalyzer:
             vep_min_overlap_percent: float = 0,
             variant_vep_retention_percent: float = 0) -> pd.DataFrame:
 
+        return self._join_scores_and_labels(
+            task_code, user_ve_scores, user_vep_name, column_name_map,
+            variant_effect_sources, include_variant_effect_sources,
+            variant_query_criteria, vep_min_overlap_percent,
+            variant_vep_retention_percent)[0]
+
+    def _join_scores_and_labels(
+            self, task_code: str, user_ve_scores: pd.DataFrame,
+            user_vep_name: str, column_name_map: dict,
+            variant_effect_sources: list[str],
+            include_variant_effect_sources: bool,
+            variant_query_criteria: VEQueryCriteria,
+            vep_min_overlap_percent: float,
+            variant_vep_retention_percent: float
+    ) -> tuple[pd.DataFrame, np.ndarray, pd.DataFrame]:
+        """
+        Returns the scores and labels of the analysis, see
+        get_analysis_scores_and_labels, and if user scores were
+        specified the sorted ids of the labeled variants they were
+        restricted to and the user scores of those variants.
+        """
+
         if vep_min_overlap_percent is None:
             vep_min_overlap_percent = 0
         if variant_vep_retention_percent is None:
@@ -56,23 +163,31 @@ class VEAnalyzer:
             variant_effect_sources = None
 
         # Get the full universe of variants for query criteria. The universe
-        # is limited to those for which we have labels.
-        variant_universe_pks_df = self._variant_effect_label_repo.get(
-                task_code, variant_query_criteria)[VARIANT_PK_COLUMNS]
+        # is limited to those for which we have labels. All joins below are
+        # done on the integer VARIANT_ID rather than on the 5 column
+        # variant primary key. The labels of the analysis are taken from
+        # the universe labels so the criteria are only evaluated once.
+        universe_labels_df = self._variant_effect_label_repo.get(
+                task_code, variant_query_criteria)
+        variant_universe_ids_df = universe_labels_df[[VARIANT_KEY_COLUMN]]
 
         # if user has specified variant scores then restrict user
         # variants to those in the universe(i.e. those for which we have
         # labels) and then reset the universe to the filtered user variant list
+        label_variant_ids = None
         if user_ve_scores is not None:
+            label_variant_ids = np.sort(
+                variant_universe_ids_df[VARIANT_KEY_COLUMN].to_numpy())
             if column_name_map is not None and len(column_name_map) > 0:
                 user_ve_scores = user_ve_scores.rename(
                     columns=column_name_map)
-            user_ve_scores = user_ve_scores.merge(variant_universe_pks_df,
-                                                  how="inner",
-                                                  on=VARIANT_PK_COLUMNS)
+            user_ve_scores = self._variant_repo.key_index.assign(
+                user_ve_scores)
+            user_ve_scores = filter_dataframe_by_list(
+                user_ve_scores, variant_universe_ids_df, VARIANT_KEY_COLUMN)
             user_ve_scores = user_ve_scores.assign(
                 SCORE_SOURCE=user_vep_name)
-            variant_universe_pks_df = user_ve_scores[VARIANT_PK_COLUMNS]
+            variant_universe_ids_df = user_ve_scores[[VARIANT_KEY_COLUMN]]
 
         if (user_ve_scores is not None and
                 not include_variant_effect_sources and
@@ -80,157 +195,134 @@ class VEAnalyzer:
             # We only do the analysis against the user scores.
             # We don't use any system veps.
             analysis_ve_scores_df = \
-                user_ve_scores[VARIANT_EFFECT_SCORE_COLS]
-            analysis_labels_df = self._variant_effect_label_repo.get(
-                task_code, VEQueryCriteria(
-                    variant_ids=user_ve_scores[VARIANT_PK_COLUMNS]))
+                user_ve_scores[ANALYSIS_SCORE_COLS]
+            analysis_labels_df = filter_dataframe_by_list(
+                universe_labels_df, user_ve_scores, VARIANT_KEY_COLUMN)
         else:
-            # We include system veps in the analysis
-            # get the system vep scores based upon selection critera
-            system_ve_scores_df = self._variant_effect_score_repo.get(
-                task_code, variant_effect_sources,
-                include_variant_effect_sources,
-                variant_query_criteria)
-            
-            # First restrict the set of system vep scores to the variants
-            # in the universe. Then compute how many variants there are for
+            # We include system veps in the analysis. The system vep
+            # scores of the variants in the universe are taken from the
+            # variants x veps score matrix of the task.
+            score_matrix = self._variant_effect_score_repo.get_score_matrix(
+                task_code)
+            rows = score_matrix.row_positions(
+                variant_universe_ids_df[VARIANT_KEY_COLUMN])
+            columns = score_matrix.column_positions(
+                variant_effect_sources, include_variant_effect_sources)
+            scores = score_matrix.scores[np.ix_(rows, columns)]
+            scored = ~np.isnan(scores)
+
+            # Compute how many variants in the universe there are for
             # each vep. Then we only keep the vep scores for veps where
             # the variant count is above the vep_min_overlap_count
-            vep_min_overlap_count = (len(variant_universe_pks_df) *
+            vep_min_overlap_count = (len(variant_universe_ids_df) *
                                      vep_min_overlap_percent * 0.01)
-            system_ve_scores_df = filter_dataframe_by_list(
-                system_ve_scores_df, variant_universe_pks_df,
-                VARIANT_PK_COLUMNS)
-            retained_veps = []
-            system_ve_scores_count_by_vep = system_ve_scores_df.groupby(
-                "SCORE_SOURCE").size()
-            retained_veps = system_ve_scores_count_by_vep[
-                system_ve_scores_count_by_vep >= vep_min_overlap_count
-                ].index
-            system_ve_scores_df = filter_dataframe_by_list(
-                system_ve_scores_df, retained_veps, 'SCORE_SOURCE')
+            count_by_vep = scored.sum(axis=0)
+            retained_veps = ((count_by_vep > 0) &
+                             (count_by_vep >= vep_min_overlap_count))
+            columns = columns[retained_veps]
+            scores = scores[:, retained_veps]
+            scored = scored[:, retained_veps]
 
             # Now for each variant we compute how many veps for which we have
             # scores. We then retain only those variants where the number of
             # veps is above variant_vep_retention_count
             variant_vep_retention_count = (
-                len(retained_veps) * variant_vep_retention_percent * 0.01)
+                len(columns) * variant_vep_retention_percent * 0.01)
+            count_by_var = scored.sum(axis=1)
+            retained = ((count_by_var > 0) &
+                        (count_by_var >= variant_vep_retention_count))
+            rows = rows[retained]
+            scores = scores[retained]
+            scored = scored[retained]
+            retained_variants = pd.DataFrame(
+                {VARIANT_KEY_COLUMN: score_matrix.variant_ids[rows]})
+            analysis_labels_df = filter_dataframe_by_list(
+                universe_labels_df, retained_variants, VARIANT_KEY_COLUMN)
 
-            system_ve_scores_count_by_var = system_ve_scores_df.groupby(
-                VARIANT_PK_COLUMNS).size()
-            retained_variants = (system_ve_scores_count_by_var[
-                system_ve_scores_count_by_var >= variant_vep_retention_count].
-                    reset_index())
+            # Back to one row per vep score, ordered by vep
+            score_columns, score_rows = np.nonzero(scored.T)
+            system_ve_scores_df = pd.DataFrame(
+                {"SCORE_SOURCE": pd.Categorical.from_codes(
+                    score_columns, categories=score_matrix.sources[columns]),
+                 VARIANT_KEY_COLUMN: score_matrix.variant_ids[
+                     rows[score_rows]],
+                 "RANK_SCORE": scores[score_rows, score_columns]
+                 }).merge(
+                     analysis_labels_df[VARIANT_PK_COLUMNS +
+                                        [VARIANT_KEY_COLUMN]],
+                     how="inner", on=VARIANT_KEY_COLUMN)
 
             # If user specified scores append them to the system ones. Then
             # merge in the labels for all of the variants.
             if user_ve_scores is not None:
                 analysis_ve_scores_df = pd.concat([
-                    system_ve_scores_df[VARIANT_EFFECT_SCORE_COLS],
-                    user_ve_scores[VARIANT_EFFECT_SCORE_COLS]])
+                    system_ve_scores_df[ANALYSIS_SCORE_COLS],
+                    filter_dataframe_by_list(
+                        user_ve_scores[ANALYSIS_SCORE_COLS],
+                        retained_variants, VARIANT_KEY_COLUMN)])
             else:
                 analysis_ve_scores_df = system_ve_scores_df[
-                    VARIANT_EFFECT_SCORE_COLS]
-            analysis_ve_scores_df = filter_dataframe_by_list(
-                analysis_ve_scores_df,
-                retained_variants,
-                VARIANT_PK_COLUMNS)
-            analysis_labels_df = self._variant_effect_label_repo.get(
-                task_code, VEQueryCriteria(variant_ids=retained_variants))
+                    ANALYSIS_SCORE_COLS]
         analysis_ve_scores_labels_df = analysis_ve_scores_df.merge(
-            analysis_labels_df, how="inner", on=VARIANT_PK_COLUMNS)
-        return analysis_ve_scores_labels_df
+            analysis_labels_df.drop(columns=VARIANT_PK_COLUMNS),
+            how="inner", on=VARIANT_KEY_COLUMN)
+        return analysis_ve_scores_labels_df, label_variant_ids, \
+            user_ve_scores
 
+    @staticmethod
     def _compute_pr(
-            self, grouped_ve_scores_labels,
+            sorted_scores: SortedScores
     ) -> tuple[pd.DataFrame, pd.DataFrame]:
 
-        aucs = []
-        precision_recall_score_sources = []
-        precisions = []
-        recalls = []
-        thresholds_list = []
-        for score_source, scores_labels_df in grouped_ve_scores_labels:
-            prs, recs, thresholds = precision_recall_curve(
-                scores_labels_df['BINARY_LABEL'],
-                scores_labels_df['RANK_SCORE'])
-            aucs.append(auc(recs, prs))
-            precision_recall_score_sources.extend([score_source] *
-                                                  len(thresholds))
-            precisions.extend(prs[:-1])
-            recalls.extend(recs[:-1])
-            thresholds_list.extend(thresholds)
-        pr_df = pd.DataFrame({"SCORE_SOURCE":
-                              grouped_ve_scores_labels.groups.keys(),
+        aucs, codes, precisions, recalls, thresholds = pr_curves(
+            sorted_scores)
+        pr_df = pd.DataFrame({"SCORE_SOURCE": sorted_scores.sources,
                               "PR_AUC": aucs})
         pr_curve_coords_df = pd.DataFrame(
-            {"SCORE_SOURCE": precision_recall_score_sources,
+            {"SCORE_SOURCE": sorted_scores.source_array(codes),
              "PRECISION": precisions,
              "RECALL": recalls,
-             "THRESHOLD": thresholds_list
+             "THRESHOLD": thresholds
              })
         return pr_df, pr_curve_coords_df
 
+    @staticmethod
     def _compute_roc(
-            self, grouped_ve_scores_labels,
+            sorted_scores: SortedScores
     ) -> tuple[pd.DataFrame, pd.DataFrame]:
 
-        aucs = []
-        fpr_tpr_score_sources = []
-        false_positive_rates = []
-        true_positive_rates = []
-        thresholds_list = []
-        exceps = []
-        for score_source, scores_labels_df in grouped_ve_scores_labels:
-            try:
-                if (len(scores_labels_df) ==
-                        sum(scores_labels_df['BINARY_LABEL']) or
-                        sum(scores_labels_df['BINARY_LABEL']) == 0):
-                    raise Exception("Cannot compute roc metrics because all "
-                                    "labels have same value")
-                auc = roc_auc_score(scores_labels_df['BINARY_LABEL'],
-                                    scores_labels_df['RANK_SCORE'])
-                fpr, tpr, thresholds = roc_curve(
-                    scores_labels_df['BINARY_LABEL'],
-                    scores_labels_df['RANK_SCORE'])
-                aucs.append(auc)
-                fpr_tpr_score_sources.extend([score_source] * len(fpr))
-                false_positive_rates.extend(fpr)
-                true_positive_rates.extend(tpr)
-                thresholds_list.extend(thresholds)
-                exceps.append(np.nan)
-            except Exception as e:
-                aucs.append(np.nan)
-                exceps.append(str(e))
-
-        roc_df = pd.DataFrame({"SCORE_SOURCE": grouped_ve_scores_labels.
-                               groups.keys(),
+        aucs, exceps, codes, false_positive_rates, true_positive_rates, \
+            thresholds = roc_curves(sorted_scores)
+        roc_df = pd.DataFrame({"SCORE_SOURCE": sorted_scores.sources,
                                "ROC_AUC": aucs,
                                "EXCEPTION": exceps
                                })
         roc_curve_coords_df = pd.DataFrame(
-            {"SCORE_SOURCE": fpr_tpr_score_sources,
+            {"SCORE_SOURCE": sorted_scores.source_array(codes),
              "FALSE_POSITIVE_RATE": false_positive_rates,
              "TRUE_POSITIVE_RATE": true_positive_rates,
-             "THRESHOLD": thresholds_list
+             "THRESHOLD": thresholds
              })
         return roc_df, roc_curve_coords_df
 
     @staticmethod
-    def _compute_general_metrics(group) -> pd.Series:
-        return pd.Series(
-            {"NUM_VARIANTS": len(group),
-             "NUM_POSITIVE_LABELS": group["BINARY_LABEL"].sum(),
-             "NUM_NEGATIVE_LABELS": (group["BINARY_LABEL"] ^ 1).sum()
+    def _compute_general_metrics(sorted_scores: SortedScores
+                                 ) -> pd.DataFrame:
+        return pd.DataFrame(
+            {"SCORE_SOURCE": sorted_scores.sources,
+             "NUM_VARIANTS": sorted_scores.counts,
+             "NUM_POSITIVE_LABELS": sorted_scores.num_positives,
+             "NUM_NEGATIVE_LABELS": sorted_scores.num_negatives
              })
 
     def _add_info_to_metric_dataframes(self, *dfs):  # -> list(pd.DataFrame):
         return_dfs = []
+        source_df = self._variant_effect_source_repo.get_all()[
+            ["CODE", "NAME"]]
         for df in dfs:
             if df is not None:
-                df = df.merge(self._variant_effect_source_repo.get_all()[
-                    ["CODE", "NAME"]], how="left", left_on="SCORE_SOURCE",
-                            right_on="CODE")
+                df = df.merge(source_df, how="left", left_on="SCORE_SOURCE",
+                              right_on="CODE")
                 df.loc[df["NAME"].isna(), "NAME"] = \
                     df.loc[df["NAME"].isna(), "SCORE_SOURCE"]
                 df.rename(columns={"NAME": "SOURCE_NAME"}, inplace=True)
@@ -238,58 +330,75 @@ class VEAnalyzer:
             return_dfs.append(df)
         return return_dfs
 
+    @staticmethod
     def _compute_mwu(
-            self, grouped_ve_scores_labels,
+            sorted_scores: SortedScores
     ) -> pd.DataFrame:
 
-        neg_log10_mwu_pvals = []
-        exceps = []
-        for score_source, scores_labels_df in grouped_ve_scores_labels:
-            try:
-                positive_scores = np.array(scores_labels_df.query(
-                    'BINARY_LABEL == 1')['RANK_SCORE'])
-                negative_scores = np.array(scores_labels_df.query(
-                    'BINARY_LABEL == 0')['RANK_SCORE'])
-                if 0 in [len(positive_scores), len(negative_scores)]:
-                    raise Exception(
-                        "Cannot compute mann-whitney u values " +
-                        "because all labels have same value")
-                neg_log10_mwu_pval = -np.log10(stats.mannwhitneyu(
-                    negative_scores, positive_scores).pvalue)
-                neg_log10_mwu_pvals.append(neg_log10_mwu_pval)
-                exceps.append(np.nan)
-            except Exception as e:
-                neg_log10_mwu_pvals.append(np.nan)
-                exceps.append(str(e))
-
-        mwu_df = pd.DataFrame({"SCORE_SOURCE": grouped_ve_scores_labels.
-                               groups.keys(),
+        u_statistics, pvalues, exceps = mann_whitney_u(sorted_scores)
+        with np.errstate(divide="ignore"):
+            neg_log10_mwu_pvals = -np.log10(pvalues)
+        mwu_df = pd.DataFrame({"SCORE_SOURCE": sorted_scores.sources,
                                "NEG_LOG10_MWU_PVAL": neg_log10_mwu_pvals,
                                "EXCEPTION": exceps
                                })
         return mwu_df
 
+    def _executor_context(self):
+        if isinstance(self._executor, Executor):
+            # Owned by the caller who shuts it down
+            return nullcontext(self._executor)
+        return EXECUTOR_CLASSES[self._executor](self._max_workers)
+
+    def _compute_source_metrics(
+            self, sorted_scores: SortedScores, metrics: list[str],
+            bootstrap: BootstrapOptions = None
+    ) -> list[pd.DataFrame]:
+        """
+        Computes the metrics of the sources of sorted_scores, in
+        parallel if an executor was specified. See
+        compute_source_metrics for the dataframes returned.
+        """
+        if self._executor is None or sorted_scores.num_sources < 2:
+            return compute_source_metrics(sorted_scores, metrics, bootstrap)
+        parts = partition_sources(sorted_scores,
+                                  self._max_workers or os.cpu_count())
+        with self._executor_context() as executor:
+            if isinstance(executor, ProcessPoolExecutor):
+                with tempfile.TemporaryDirectory(
+                        prefix="aigct_scores_",
+                        dir=(SHARED_MEMORY_DIR if
+                             os.path.isdir(SHARED_MEMORY_DIR) else None),
+                        ignore_cleanup_errors=True) as folder:
+                    save_sorted_scores(sorted_scores, folder)
+                    results = list(executor.map(
+                        _compute_mapped_source_metrics, repeat(folder),
+                        [first for first, _ in parts],
+                        [last for _, last in parts], repeat(metrics),
+                        repeat(bootstrap)))
+            else:
+                results = list(executor.map(
+                    lambda part: compute_source_metrics(
+                        sorted_scores.subset(*part), metrics, bootstrap),
+                    parts))
+        # The groups are in source order so concatenating their results
+        # gives the same dataframes as computing them sequentially.
+        return [_concat_metric_dataframes(dfs) for dfs in zip(*results)]
+
     def _compute_metrics(
             self, task_code: str, ve_scores_labels_df: pd.DataFrame,
-            metrics: list[str], list_variants: bool = False
+            metrics: list[str], list_variants: bool = False,
+            bootstrap: BootstrapOptions = None
     ):
 
-        grouped_ve_scores_labels = ve_scores_labels_df.groupby("SCORE_SOURCE")
-        general_metrics_df = grouped_ve_scores_labels.apply(
-            self._compute_general_metrics, include_groups=False).reset_index()
-        roc_df = None
-        roc_curve_coords_df = None
-        pr_df = None
-        pr_curve_coords_df = None
-        mwu_df = None
-        if "roc" in metrics:
-            roc_df, roc_curve_coords_df = self._compute_roc(
-                grouped_ve_scores_labels)
-        if "pr" in metrics:
-            pr_df, pr_curve_coords_df = self._compute_pr(
-                grouped_ve_scores_labels)
-        if "mwu" in metrics:
-            mwu_df = self._compute_mwu(grouped_ve_scores_labels)
+        # The scores of all of the sources are sorted once and all of
+        # the metrics are computed from the sorted scores.
+        sorted_scores = sort_scores(ve_scores_labels_df["SCORE_SOURCE"],
+                                    ve_scores_labels_df["RANK_SCORE"],
+                                    ve_scores_labels_df["BINARY_LABEL"])
+        general_metrics_df, roc_df, pr_df, mwu_df, roc_curve_coords_df, \
+            pr_curve_coords_df = self._compute_source_metrics(
+                sorted_scores, metrics, bootstrap)
         if list_variants:
             included_variants_df = ve_scores_labels_df[["SCORE_SOURCE"] +
                                                        VARIANT_PK_COLUMNS]
@@ -314,7 +423,10 @@ class VEAnalyzer:
             vep_min_overlap_percent: float = 0,
             variant_vep_retention_percent: float = 0,
             metrics: str | list[str] = ["roc", "pr", "mwu"],
-            list_variants: bool = False) -> VEAnalysisResult:
+            list_variants: bool = False,
+            bootstrap_resamples: int = 0,
+            confidence_level: float = 0.95,
+            bootstrap_seed: int = 0) -> VEAnalysisResult:
         """
         Generates performance metrics for an optional user supplied set of
         vep scores and for system supplied vep's. If the user doesn't provide
@@ -380,6 +492,16 @@ class VEAnalyzer:
             that were included in the analysis in the return result
             object. There is a separate list for the user variants
             as well as for each system vep.
+        bootstrap_resamples: int
+            If greater than 0, percentile bootstrap confidence intervals
+            of the ROC and PR AUCs are computed from this many
+            resamples of the scores of each vep, e.g. 2000, and added
+            to roc_metrics and pr_metrics.
+        confidence_level: float
+            Confidence level of the bootstrap confidence intervals
+        bootstrap_seed: int
+            Seed of the bootstrap resamples. Results are reproducible
+            for a given seed.
 
         Returns
         -------
@@ -387,31 +509,543 @@ class VEAnalyzer:
             Object containing computed metrics
         """
 
-        scores_and_labels_df = self.get_analysis_scores_and_labels(
-            task_code,
-            user_ve_scores,
-            user_vep_name,
-            column_name_map,
-            variant_effect_sources,
-            include_variant_effect_sources,
-            variant_query_criteria,
-            vep_min_overlap_percent,
-            variant_vep_retention_percent)
-
         if type(metrics) is str:
             metrics = [metrics]
+        bootstrap = None
+        if bootstrap_resamples:
+            bootstrap = BootstrapOptions(bootstrap_resamples,
+                                         confidence_level, bootstrap_seed)
+
+        def analyze() -> VEAnalysisResult:
+            return self._analyze(
+                task_code, user_ve_scores, user_vep_name, column_name_map,
+                variant_effect_sources, include_variant_effect_sources,
+                variant_query_criteria, vep_min_overlap_percent,
+                variant_vep_retention_percent, metrics, list_variants,
+                bootstrap)
+
+        def analyze_or_snapshot() -> VEAnalysisResult:
+            snapshot_params = self._snapshot_params(
+                task_code, user_ve_scores, user_vep_name,
+                variant_effect_sources, include_variant_effect_sources,
+                variant_query_criteria, vep_min_overlap_percent,
+                variant_vep_retention_percent, metrics, list_variants,
+                bootstrap)
+            if snapshot_params is None:
+                return analyze()
+            return self._snapshot_store.get_or_compute(
+                task_code, snapshot_params, analyze)
+
+        if self._result_cache is None:
+            return analyze_or_snapshot()
+        return self._result_cache.get_or_compute(
+            task_code, self._result_cache_params(
+                user_ve_scores, user_vep_name, column_name_map,
+                variant_effect_sources, include_variant_effect_sources,
+                variant_query_criteria, vep_min_overlap_percent,
+                variant_vep_retention_percent, metrics, list_variants,
+                bootstrap),
+            analyze_or_snapshot)
+
+    def _result_cache_params(
+            self, user_ve_scores: pd.DataFrame, user_vep_name: str,
+            column_name_map: dict, variant_effect_sources: list[str],
+            include_variant_effect_sources: bool,
+            variant_query_criteria: VEQueryCriteria,
+            vep_min_overlap_percent: float,
+            variant_vep_retention_percent: float, metrics: list[str],
+            list_variants: bool, bootstrap: BootstrapOptions) -> dict:
+        """
+        Returns the parameters of an analysis that its result cache
+        fingerprint is computed from. Equivalent values of a parameter,
+        e.g. None and an empty list, are given the same value. The BED
+        files referenced by the query criteria are represented by their
+        stats so that editing one invalidates the result.
+        """
+        if user_ve_scores is not None and len(user_ve_scores) == 0:
+            user_ve_scores = None
+        if (variant_effect_sources is not None and
+                len(variant_effect_sources) > 0):
+            variant_effect_sources = sorted(set(
+                str_or_list_to_list(variant_effect_sources)))
+        else:
+            variant_effect_sources = None
+        return {"user_ve_scores": user_ve_scores,
+                "user_vep_name": user_vep_name,
+                "column_name_map": column_name_map or None,
+                "variant_effect_sources": variant_effect_sources,
+                "include_variant_effect_sources":
+                    bool(include_variant_effect_sources),
+                "variant_query_criteria": variant_query_criteria,
+                "region_files": None if variant_query_criteria is None
+                else file_stats(query_region_files(variant_query_criteria)),
+                "vep_min_overlap_percent": vep_min_overlap_percent or 0,
+                "variant_vep_retention_percent":
+                    variant_vep_retention_percent or 0,
+                "metrics": sorted(set(metrics)),
+                "list_variants": bool(list_variants),
+                "bootstrap": bootstrap}
+
+    def _snapshot_params(
+            self, task_code: str, user_ve_scores: pd.DataFrame,
+            user_vep_name: str, variant_effect_sources: list[str],
+            include_variant_effect_sources: bool,
+            variant_query_criteria: VEQueryCriteria,
+            vep_min_overlap_percent: float,
+            variant_vep_retention_percent: float, metrics: list[str],
+            list_variants: bool, bootstrap: BootstrapOptions) -> dict:
+        """
+        Returns the parameters identifying the snapshot of an analysis
+        or None if the analysis is not eligible for a snapshot.
+        """
+        if self._snapshot_store is None or (
+                user_ve_scores is not None and len(user_ve_scores) > 0):
+            return None
+        filter_name = None
+        if variant_query_criteria is not None:
+            if (variant_query_criteria.gene_symbols is not None or
+                    variant_query_criteria.variant_ids is not None or
+                    has_allele_frequency_criteria(variant_query_criteria) or
+                    variant_query_criteria.regions is not None or
+                    variant_query_criteria.filter_expression is not None):
+                return None
+            filter_name = variant_query_criteria.filter_name
+        if (variant_effect_sources is not None and
+                len(variant_effect_sources) > 0):
+            variant_effect_sources = sorted(set(
+                str_or_list_to_list(variant_effect_sources)))
+        else:
+            variant_effect_sources = None
+        return {"task_code": task_code,
+                "user_vep_name": user_vep_name,
+                "variant_effect_sources": variant_effect_sources,
+                "include_variant_effect_sources":
+                    bool(include_variant_effect_sources),
+                "filter_name": filter_name,
+                "vep_min_overlap_percent": vep_min_overlap_percent or 0,
+                "variant_vep_retention_percent":
+                    variant_vep_retention_percent or 0,
+                "metrics": sorted(set(metrics)),
+                "list_variants": bool(list_variants),
+                "bootstrap": None if bootstrap is None else asdict(bootstrap)}
+
+    def _analyze(
+            self, task_code: str, user_ve_scores: pd.DataFrame,
+            user_vep_name: str, column_name_map: dict,
+            variant_effect_sources: list[str],
+            include_variant_effect_sources: bool,
+            variant_query_criteria: VEQueryCriteria,
+            vep_min_overlap_percent: float,
+            variant_vep_retention_percent: float, metrics: list[str],
+            list_variants: bool,
+            bootstrap: BootstrapOptions) -> VEAnalysisResult:
+
+        scores_and_labels_df, label_variant_ids, analysis_user_ve_scores = \
+            self._join_scores_and_labels(
+                task_code,
+                user_ve_scores,
+                user_vep_name,
+                column_name_map,
+                variant_effect_sources,
+                include_variant_effect_sources,
+                variant_query_criteria,
+                vep_min_overlap_percent,
+                variant_vep_retention_percent)
         general_metrics_df, roc_df, pr_df, mwu_df, roc_curve_coords_df, \
             pr_curve_coords_df, included_variants_df = \
             self._compute_metrics(task_code, scores_and_labels_df,
-                                  metrics, list_variants)
-        num_variants = len(
-            scores_and_labels_df[VARIANT_PK_COLUMNS].drop_duplicates())
+                                  metrics, list_variants, bootstrap)
+        num_variants = scores_and_labels_df[VARIANT_KEY_COLUMN].nunique()
         num_user_variants = None if user_ve_scores is None else \
             len(user_ve_scores)
+        user_analysis = None
+        if analysis_user_ve_scores is not None:
+            user_scores_labels_df = scores_and_labels_df[
+                scores_and_labels_df["SCORE_SOURCE"] == user_vep_name]
+            user_analysis = UserAnalysisState(
+                task_code, user_vep_name, column_name_map,
+                variant_effect_sources, include_variant_effect_sources,
+                variant_query_criteria, vep_min_overlap_percent,
+                variant_vep_retention_percent, metrics, list_variants,
+                bootstrap, label_variant_ids,
+                analysis_user_ve_scores[USER_SCORE_COLS].reset_index(
+                    drop=True),
+                user_scores_labels_df[USER_SCORE_LABEL_COLS].reset_index(
+                    drop=True))
         return VEAnalysisResult(
             num_variants,
             num_user_variants, user_vep_name,
             general_metrics_df, roc_df,
             pr_df, mwu_df, roc_curve_coords_df,
-            pr_curve_coords_df, included_variants_df)
-        
+            pr_curve_coords_df, included_variants_df, user_analysis)
+
+    def update_user_metrics(
+            self,
+            previous_result: VEAnalysisResult,
+            changed_user_ve_scores: pd.DataFrame) -> VEAnalysisResult:
+        """
+        Updates the result of an analysis that included user scores
+        when some of the user scores have changed, e.g. when a new
+        version of the user model rescored some of the variants. Only
+        the changed rows need to be passed.
+
+        If the changes only alter the scores of variants that were
+        already scored, the set of variants of the analysis and hence
+        the metrics of the system veps are unchanged. Only the metrics
+        and curves of the user vep are recomputed, from the previous
+        user scores and labels with the changed scores substituted,
+        and those of the system veps are taken from previous_result.
+        If the changes score new variants that are in the universe of
+        labeled variants of the analysis, the analysis is rerun in
+        full with the previous parameters. Changed variants outside
+        the universe are ignored, as they would be by compute_metrics.
+
+        Parameters
+        ----------
+        previous_result : VEAnalysisResult
+            Result of compute_metrics, or of a previous call to this
+            method, for an analysis that included user scores
+        changed_user_ve_scores : DataFrame
+            The changed user scores, with the same columns as the
+            user_ve_scores passed to compute_metrics. The column_name_map
+            passed to compute_metrics is applied to it.
+
+        Returns
+        -------
+        VEAnalysisResult
+            The result compute_metrics would return for the previous
+            user scores updated with changed_user_ve_scores.
+        """
+        state = previous_result.user_analysis
+        if state is None:
+            raise Exception("The previous result is not that of an "
+                            "analysis of user scores")
+        changes_df = changed_user_ve_scores
+        if state.column_name_map is not None and \
+                len(state.column_name_map) > 0:
+            changes_df = changes_df.rename(columns=state.column_name_map)
+        changes_df = self._variant_repo.key_index.assign(changes_df)
+        # Later rows of a variant take precedence, variants outside the
+        # universe of the analysis are ignored
+        changes_df = changes_df.drop_duplicates(VARIANT_KEY_COLUMN,
+                                                keep="last")
+        changes_df = changes_df[np.isin(
+            changes_df[VARIANT_KEY_COLUMN].to_numpy(),
+            state.label_variant_ids)]
+        changed_scores = changes_df.set_index(VARIANT_KEY_COLUMN)[
+            "RANK_SCORE"]
+
+        user_ve_scores = state.user_ve_scores.assign(
+            RANK_SCORE=_replace_scores(state.user_ve_scores,
+                                       changed_scores))
+        new_variants_df = changes_df[~changes_df[VARIANT_KEY_COLUMN].isin(
+            user_ve_scores[VARIANT_KEY_COLUMN])]
+        num_user_variants = previous_result.num_user_variants + \
+            len(new_variants_df)
+        if len(new_variants_df) > 0:
+            user_ve_scores = pd.concat(
+                [user_ve_scores, new_variants_df[USER_SCORE_COLS]],
+                ignore_index=True)
+            result = self._analyze(
+                state.task_code, user_ve_scores, state.user_vep_name, None,
+                state.variant_effect_sources,
+                state.include_variant_effect_sources,
+                state.variant_query_criteria, state.vep_min_overlap_percent,
+                state.variant_vep_retention_percent, state.metrics,
+                state.list_variants, state.bootstrap)
+            return replace(
+                result, num_user_variants=num_user_variants,
+                user_analysis=replace(result.user_analysis,
+                                      column_name_map=state.column_name_map))
+
+        user_scores_labels_df = state.user_ve_scores_labels.assign(
+            RANK_SCORE=_replace_scores(state.user_ve_scores_labels,
+                                       changed_scores))
+        sorted_scores = sort_scores(
+            np.full(len(user_scores_labels_df), state.user_vep_name,
+                    dtype=object),
+            user_scores_labels_df["RANK_SCORE"],
+            user_scores_labels_df["BINARY_LABEL"])
+        user_metric_dfs = compute_source_metrics(
+            sorted_scores, state.metrics, state.bootstrap)
+        user_metric_dfs[:4] = self._add_info_to_metric_dataframes(
+            *user_metric_dfs[:4])
+        general_metrics_df, roc_df, pr_df, mwu_df, roc_curve_coords_df, \
+            pr_curve_coords_df = [
+                _replace_source_rows(previous_df, user_df,
+                                     state.user_vep_name)
+                for previous_df, user_df in zip(
+                    [previous_result.general_metrics,
+                     previous_result.roc_metrics,
+                     previous_result.pr_metrics,
+                     previous_result.mwu_metrics,
+                     previous_result.roc_curve_coordinates,
+                     previous_result.pr_curve_coordinates],
+                    user_metric_dfs)]
+        included_variants_df = None
+        if previous_result.variants_included is not None:
+            included_variants_df = lazy_copy(
+                previous_result.variants_included)
+        return VEAnalysisResult(
+            previous_result.num_variants_included, num_user_variants,
+            state.user_vep_name, general_metrics_df, roc_df, pr_df, mwu_df,
+            roc_curve_coords_df, pr_curve_coords_df, included_variants_df,
+            replace(state, user_ve_scores=user_ve_scores,
+                    user_ve_scores_labels=user_scores_labels_df))
+
+    def read_user_scores(
+            self,
+            task_code: str,
+            user_scores_file: str,
+            column_name_map: dict = None,
+            variant_query_criteria: VEQueryCriteria = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            vcf_info_key: str = None,
+            threads: int = None) -> pd.DataFrame:
+        """
+        Reads the user scores of the labeled variants of a task from a
+        file. The file is read in chunks and the rows of each chunk of
+        variants without a label, which compute_metrics would discard,
+        are dropped as it is read. The memory used is thus bounded by
+        the number of labeled variants rather than the size of the
+        file.
+
+        Parameters
+        ----------
+        task_code : str
+            Task code
+        user_scores_file : str
+            Path of a csv, tsv, parquet or vcf file, see the
+            user_scores module. Other than a vcf file it is expected to
+            have the columns of the user_ve_scores of compute_metrics.
+        column_name_map : dict, optional
+            If the column names in the file are not the expected names,
+            then this maps the column names to the expected names.
+        variant_query_criteria : VEQueryCriteria, optional
+            If specified only the scores of the labeled variants
+            meeting the criteria are kept.
+        chunk_size : int, optional
+            Number of rows read at a time
+        vcf_info_key : str, optional
+            If user_scores_file is a vcf file, the key of the INFO
+            field holding the score.
+        threads : int, optional
+            Number of threads decompressing a bgzipped vcf file
+
+        Returns
+        -------
+        DataFrame
+            The user scores with the columns GENOME_ASSEMBLY,
+            CHROMOSOME, POSITION, REFERENCE_NUCLEOTIDE,
+            ALTERNATE_NUCLEOTIDE, RANK_SCORE, VARIANT_ID.
+        """
+        label_variant_ids = self._variant_effect_label_repo.get(
+            task_code, variant_query_criteria)[VARIANT_KEY_COLUMN].to_numpy()
+        key_index = self._variant_repo.key_index
+        user_scores_dfs = []
+        for chunk_df in read_user_score_chunks(user_scores_file,
+                                               column_name_map, chunk_size,
+                                               vcf_info_key, threads):
+            variant_ids = key_index.lookup(chunk_df)
+            labeled = np.isin(variant_ids, label_variant_ids)
+            user_scores_dfs.append(chunk_df[labeled].assign(
+                **{VARIANT_KEY_COLUMN: variant_ids[labeled]}))
+        if len(user_scores_dfs) == 0:
+            return pd.DataFrame(
+                columns=USER_SCORE_COLUMNS + [VARIANT_KEY_COLUMN])
+        return pd.concat(user_scores_dfs, ignore_index=True)
+
+    def compute_metrics_from_file(
+            self,
+            task_code: str,
+            user_scores_file: str,
+            user_vep_name: str = "USER",
+            column_name_map: dict = None,
+            variant_query_criteria: VEQueryCriteria = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            vcf_info_key: str = None,
+            threads: int = None,
+            **kwargs) -> VEAnalysisResult:
+        """
+        Same as compute_metrics but reads the user scores from a file
+        with read_user_scores so that files too large to be held in
+        memory can be analyzed. The other parameters are those of
+        compute_metrics. num_user_variants of the result is the number
+        of user scores of labeled variants rather than the number of
+        rows of the file.
+        """
+        user_ve_scores = self.read_user_scores(
+            task_code, user_scores_file, column_name_map,
+            variant_query_criteria, chunk_size, vcf_info_key, threads)
+        return self.compute_metrics(
+            task_code, user_ve_scores, user_vep_name,
+            variant_query_criteria=variant_query_criteria, **kwargs)
+
+    def compare_veps(
+            self,
+            task_code: str,
+            user_ve_scores: pd.DataFrame = None,
+            user_vep_name: str = "USER",
+            column_name_map: dict = None,
+            variant_effect_sources: list[str] = None,
+            include_variant_effect_sources: bool = True,
+            variant_query_criteria: VEQueryCriteria = None,
+            vep_min_overlap_percent: float = 0) -> pd.DataFrame:
+        """
+        Compares the ROC AUCs of every pair of veps included in an
+        analysis using the DeLong test for correlated ROC curves. All
+        of the veps are compared on the same set of variants, those
+        scored by every vep included, so that the comparisons are
+        paired. Use variant_effect_sources or vep_min_overlap_percent
+        to leave out veps that score few variants and would otherwise
+        shrink the set.
+
+        The parameters are those of compute_metrics.
+
+        Returns
+        -------
+        DataFrame
+            One row per pair of veps with columns SCORE_SOURCE_1,
+            SCORE_SOURCE_2, SOURCE_NAME_1, SOURCE_NAME_2, ROC_AUC_1,
+            ROC_AUC_2, ROC_AUC_DIFF (ROC_AUC_1 - ROC_AUC_2), DELONG_Z,
+            DELONG_PVAL, NUM_VARIANTS, NUM_POSITIVE_LABELS,
+            NUM_NEGATIVE_LABELS. The user vep, if any, is always
+            SCORE_SOURCE_1 of its pairs.
+        """
+        scores_and_labels_df = self.get_analysis_scores_and_labels(
+            task_code,
+            user_ve_scores,
+            user_vep_name,
+            column_name_map,
+            variant_effect_sources,
+            include_variant_effect_sources,
+            variant_query_criteria,
+            vep_min_overlap_percent)
+        sources = sorted(scores_and_labels_df["SCORE_SOURCE"].unique(),
+                         key=lambda source: (source != user_vep_name
+                                             or user_ve_scores is None,
+                                             source))
+        source_codes = pd.Categorical(
+            scores_and_labels_df["SCORE_SOURCE"], categories=sources).codes
+        variant_codes, variant_ids = pd.factorize(
+            scores_and_labels_df[VARIANT_KEY_COLUMN])
+        scores = np.full((len(sources), len(variant_ids)), np.nan)
+        scores[source_codes, variant_codes] = \
+            scores_and_labels_df["RANK_SCORE"].to_numpy(dtype=np.float64)
+        labels = np.empty(len(variant_ids), dtype=np.int64)
+        labels[variant_codes] = scores_and_labels_df["BINARY_LABEL"]
+        shared = ~np.isnan(scores).any(axis=0)
+        scores = scores[:, shared]
+        labels = labels[shared]
+
+        aucs, covariance = delong_covariance(scores, labels)
+        first, second, differences, z_scores, pvalues = \
+            delong_pairwise_tests(aucs, covariance)
+        source_names = pd.Series(sources).map(
+            self._variant_effect_source_repo.get_all().set_index(
+                "CODE")["NAME"]).fillna(pd.Series(sources)).to_numpy()
+        sources = np.asarray(sources, dtype=object)
+        num_positives = int(labels.sum())
+        comparison_df = pd.DataFrame(
+            {"SCORE_SOURCE_1": sources[first],
+             "SCORE_SOURCE_2": sources[second],
+             "SOURCE_NAME_1": source_names[first],
+             "SOURCE_NAME_2": source_names[second],
+             "ROC_AUC_1": aucs[first],
+             "ROC_AUC_2": aucs[second],
+             "ROC_AUC_DIFF": differences,
+             "DELONG_Z": z_scores,
+             "DELONG_PVAL": pvalues,
+             "NUM_VARIANTS": len(labels),
+             "NUM_POSITIVE_LABELS": num_positives,
+             "NUM_NEGATIVE_LABELS": len(labels) - num_positives
+             })
+        return comparison_df
+
+
+def compute_source_metrics(sorted_scores: SortedScores,
+                           metrics: list[str],
+                           bootstrap: BootstrapOptions = None
+                           ) -> list[pd.DataFrame]:
+    """
+    Computes the metrics of the sources of sorted_scores. If bootstrap
+    is specified confidence interval columns are added to the roc and
+    pr dataframes.
+
+    Returns
+    -------
+    list[DataFrame]
+        general metrics, roc, pr, mwu, roc curve coordinates and
+        pr curve coordinates dataframes. Those of metrics that are not
+        requested are None.
+    """
+    general_metrics_df = VEAnalyzer._compute_general_metrics(sorted_scores)
+    roc_df = None
+    roc_curve_coords_df = None
+    pr_df = None
+    pr_curve_coords_df = None
+    mwu_df = None
+    if "roc" in metrics:
+        roc_df, roc_curve_coords_df = VEAnalyzer._compute_roc(sorted_scores)
+    if "pr" in metrics:
+        pr_df, pr_curve_coords_df = VEAnalyzer._compute_pr(sorted_scores)
+    if "mwu" in metrics:
+        mwu_df = VEAnalyzer._compute_mwu(sorted_scores)
+    if bootstrap is not None and (roc_df is not None or pr_df is not None):
+        roc_lower, roc_upper, pr_lower, pr_upper = bootstrap_auc_intervals(
+            sorted_scores, bootstrap)
+        if roc_df is not None:
+            roc_df.insert(2, "ROC_AUC_CI_LOWER", roc_lower)
+            roc_df.insert(3, "ROC_AUC_CI_UPPER", roc_upper)
+        if pr_df is not None:
+            pr_df.insert(2, "PR_AUC_CI_LOWER", pr_lower)
+            pr_df.insert(3, "PR_AUC_CI_UPPER", pr_upper)
+    return [general_metrics_df, roc_df, pr_df, mwu_df, roc_curve_coords_df,
+            pr_curve_coords_df]
+
+
+def _compute_mapped_source_metrics(folder: str, first: int, last: int,
+                                   metrics: list[str],
+                                   bootstrap: BootstrapOptions
+                                   ) -> list[pd.DataFrame]:
+    """
+    Run in a worker process. Computes the metrics of a range of sources
+    of the sorted scores saved in folder.
+    """
+    return compute_source_metrics(
+        load_sorted_scores(folder).subset(first, last), metrics, bootstrap)
+
+
+def _replace_scores(scores_df: pd.DataFrame,
+                    changed_scores: pd.Series) -> np.ndarray:
+    """
+    Returns the RANK_SCORE of each row of scores_df, replaced by the
+    score in changed_scores, indexed by VARIANT_ID, if it has one.
+    """
+    variant_ids = scores_df[VARIANT_KEY_COLUMN]
+    changed = variant_ids.isin(changed_scores.index).to_numpy()
+    scores = scores_df["RANK_SCORE"].to_numpy(dtype=np.float64, copy=True)
+    scores[changed] = changed_scores.loc[variant_ids[changed]].to_numpy()
+    return scores
+
+
+def _replace_source_rows(previous_df: pd.DataFrame, source_df: pd.DataFrame,
+                         source: str) -> pd.DataFrame:
+    """
+    Returns previous_df with its rows of source replaced by source_df,
+    keeping the rows ordered by source.
+    """
+    if previous_df is None:
+        return None
+    return _concat_metric_dataframes(
+        [previous_df[previous_df["SCORE_SOURCE"] != source], source_df]
+    ).sort_values("SCORE_SOURCE", kind="stable", ignore_index=True)
+
+
+def _concat_metric_dataframes(dfs: list[pd.DataFrame]) -> pd.DataFrame:
+    if dfs[0] is None:
+        return None
+    # Empty frames are skipped as their columns may have a different
+    # dtype than those of the others.
+    return pd.concat([df for df in dfs if len(df) > 0] or dfs[:1],
+                     ignore_index=True)
@@ -6,7 +6,8 @@ from .repository import (
     VariantRepository,
     VariantEffectSourceRepository,
     VariantTaskRepository,
-    TABLE_DEFS
+    TABLE_DEFS,
+    invalidate_caches
 )
 from .analyzer import VEAnalyzer
 from .query import VEBenchmarkQueryMgr
@@ -15,6 +16,8 @@ from .plotter import VEAnalysisPlotter
 from .exporter import VEAnalysisExporter
 from .util import Config
 from .repo_qc import VEDataValidator
+from .snapshot import AnalysisSnapshotStore
+from .result_cache import AnalysisResultCache, DEFAULT_MAX_ENTRIES
 
 import yaml
 import os
@@ -40,12 +43,15 @@ class VEBenchmarkContainer:
               conf_file):
             self.config = Config(yaml.safe_load(conf_file))
         self._repo_session_context = RepoSessionContext(
-            self.config.repository.root_dir, TABLE_DEFS)
+            self.config.repository.root_dir, TABLE_DEFS,
+            getattr(self.config.repository, "file_format", None),
+            getattr(self.config.repository, "memory_map", False),
+            getattr(self.config.repository, "cache_max_bytes", None))
         self._variant_task_repo = VariantTaskRepository(
             self._repo_session_context)
         self._variant_repo = VariantRepository(self._repo_session_context)
         self._variant_filter_repo = VariantFilterRepository(
-            self._repo_session_context)
+            self._repo_session_context, self._variant_repo)
         self._label_repo = VariantEffectLabelRepository(
             self._repo_session_context,
             self._variant_repo,
@@ -58,18 +64,33 @@ class VEBenchmarkContainer:
             self._repo_session_context,
             self._score_repo)
         self._variant_filter_repo = VariantFilterRepository(
-            self._repo_session_context
+            self._repo_session_context, self._variant_repo
         )
+        analysis_config = getattr(self.config, "analysis", None)
+        result_cache_config = getattr(analysis_config, "result_cache", None)
         self._analyzer = VEAnalyzer(
             self._score_repo,
             self._label_repo,
-            self._variant_effect_source_repo)
+            self._variant_effect_source_repo,
+            self._variant_repo,
+            getattr(analysis_config, "executor", None),
+            getattr(analysis_config, "max_workers", None),
+            AnalysisSnapshotStore(self._repo_session_context)
+            if getattr(analysis_config, "snapshots", False) else None,
+            AnalysisResultCache(
+                self._repo_session_context,
+                getattr(result_cache_config, "max_entries",
+                        DEFAULT_MAX_ENTRIES),
+                getattr(result_cache_config, "cache_dir", None),
+                getattr(result_cache_config, "max_disk_bytes", None))
+            if result_cache_config is not None else None)
         self._query_mgr = VEBenchmarkQueryMgr(self._label_repo,
                                               self._variant_repo,
                                               self._variant_task_repo,
                                               self._variant_effect_source_repo,
                                               self._score_repo,
-                                              self._variant_filter_repo)
+                                              self._variant_filter_repo,
+                                              self._repo_session_context)
         self._reporter = VEAnalysisReporter()
         self._plotter = VEAnalysisPlotter(self.config.plot)
         self._exporter = VEAnalysisExporter()
@@ -104,3 +125,11 @@ class VEBenchmarkContainer:
     @property
     def data_validator(self):
         return self._data_validator
+
+    def invalidate_caches(self):
+        """
+        Discards the cached repository tables so that they are reloaded
+        from the repository files on next access, e.g. after a new
+        release of the repository has been installed in root_dir.
+        """
+        invalidate_caches(self._repo_session_context)
@@ -0,0 +1,21 @@
+import argparse
+from aigct.install_util import convert_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Database")
+    parser.add_argument('--confdir', type=str,
+                        help='Config file directory')
+    parser.add_argument('--format', type=str, default="parquet",
+                        help='Target file format: parquet or arrow')
+    args = parser.parse_args()
+
+    if not args.confdir:
+        raise Exception(
+            "Must specify --confdir argument")
+
+    convert_db(args.confdir, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ import io
 import os
 from .file_util import create_folder, unique_file_name
 from .container import VEBenchmarkContainer
+from .repository import convert_repository
 import aigct.config
 
 
@@ -67,6 +68,12 @@ def init_db(conf_dir: str = "./config"):
         archive.extractall(dir)
 
 
+def convert_db(conf_dir: str = "./config", file_format: str = "parquet"):
+    with open(os.path.join(conf_dir, "aigct.yaml"), "r") as conf_file:
+        config = yaml.safe_load(conf_file)
+    convert_repository(config["repository"]["root_dir"], file_format)
+
+
 def check_install(conf_dir: str = "./config"):
     container = VEBenchmarkContainer(os.path.join(conf_dir, "aigct.yaml"))
     outdir = container.config.output_dir
@@ -0,0 +1,149 @@
+"""
+Memory mapped copies of cached repository tables. A table is
+materialized once as a set of NumPy .npy files, one per column, under
+the repository root directory. Every process that loads the table maps
+the files read only rather than reading them into memory, so the pages
+holding the table are shared by all processes on a host through the
+operating system page cache.
+
+Numeric and boolean columns are stored as is. Categorical columns are
+stored as an array of integer codes that is mapped and a (small) array
+of categories that is read into memory. Any other column, i.e. a
+string column, is stored the same way but is converted back to its
+original dtype when it is loaded and is therefore not shared.
+"""
+
+import os
+import json
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from .storage import file_stats
+
+# Incremented whenever the layout of the files changes so that tables
+# materialized by an older version are rebuilt.
+MAPPED_CACHE_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+
+def _read_manifest(folder: str) -> dict:
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE), "r") as \
+                manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+
+def is_current(folder: str, source_files: list[str]) -> bool:
+    """
+    True if a mapped table has been materialized in folder from the
+    current version of source_files.
+    """
+    manifest = _read_manifest(folder)
+    return (manifest is not None and
+            manifest["version"] == MAPPED_CACHE_VERSION and
+            manifest["sources"] == file_stats(source_files))
+
+
+def write_mapped_table(data_frame: pd.DataFrame, folder: str,
+                       source_files: list[str]):
+    """
+    Materialize data_frame as a mapped table in folder, replacing any
+    table already there.
+
+    Parameters
+    ----------
+    data_frame : DataFrame
+        Table to materialize. Its index is not stored.
+    folder : str
+        Directory the files are written to.
+    source_files : list[str]
+        Files the table was read from. Their size and modification
+        time are recorded so that a table materialized from an older
+        version of the files is detected by is_current.
+    """
+    parent = os.path.dirname(folder)
+    os.makedirs(parent, exist_ok=True)
+    # The files are written to a private directory which is then
+    # renamed into place so that other processes never see a partially
+    # written table.
+    temp_folder = f"{folder}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(temp_folder, ignore_errors=True)
+    os.makedirs(temp_folder)
+    columns = []
+    for index, (column, values) in enumerate(data_frame.items()):
+        file_prefix = os.path.join(temp_folder, str(index))
+        if (isinstance(values.dtype, np.dtype) and
+                values.dtype.kind in "biuf"):
+            np.save(file_prefix + ".npy", values.to_numpy())
+            columns.append({"name": column, "kind": "numpy"})
+        else:
+            kind = "category"
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                kind = str(values.dtype)
+                values = values.astype("category")
+            np.save(file_prefix + ".npy", values.array.codes)
+            np.save(file_prefix + ".categories.npy",
+                    values.array.categories.to_numpy().astype(str))
+            columns.append({"name": column, "kind": kind})
+    with open(os.path.join(temp_folder, MANIFEST_FILE), "w") as \
+            manifest_file:
+        json.dump({"version": MAPPED_CACHE_VERSION,
+                   "sources": file_stats(source_files),
+                   "num_rows": len(data_frame),
+                   "columns": columns}, manifest_file)
+    old_folder = f"{folder}.{os.getpid()}.{threading.get_ident()}.old"
+    try:
+        _replace_folder(temp_folder, folder, old_folder)
+    except OSError:
+        # Another process materialized the table in between. Its table
+        # is kept if it is current, otherwise it is replaced.
+        if is_current(folder, source_files):
+            shutil.rmtree(temp_folder, ignore_errors=True)
+        else:
+            try:
+                _replace_folder(temp_folder, folder, old_folder)
+            finally:
+                shutil.rmtree(temp_folder, ignore_errors=True)
+    # Processes still mapping the files of the old table keep them
+    # until they are unmapped.
+    shutil.rmtree(old_folder, ignore_errors=True)
+
+
+def _replace_folder(new_folder: str, folder: str, old_folder: str):
+    """
+    Renames new_folder to folder. A folder already there is first moved
+    aside to old_folder, as a directory can only be renamed onto a
+    missing or, on POSIX systems, an empty directory.
+    """
+    if os.path.exists(folder):
+        shutil.rmtree(old_folder, ignore_errors=True)
+        os.replace(folder, old_folder)
+    os.replace(new_folder, folder)
+
+
+def read_mapped_table(folder: str) -> pd.DataFrame:
+    """
+    Returns a dataframe whose columns are read only memory maps of the
+    files of the mapped table in folder.
+    """
+    manifest = _read_manifest(folder)
+    if manifest is None:
+        raise Exception(f"No mapped table found in {folder}")
+    data = dict()
+    for index, column in enumerate(manifest["columns"]):
+        file_prefix = os.path.join(folder, str(index))
+        values = np.load(file_prefix + ".npy", mmap_mode="r")
+        if column["kind"] != "numpy":
+            categories = pd.Index(
+                np.load(file_prefix + ".categories.npy").tolist())
+            values = pd.Categorical.from_codes(
+                values, dtype=pd.CategoricalDtype(categories),
+                validate=False)
+            if column["kind"] != "category":
+                values = pd.Series(values).astype(column["kind"]).array
+        data[column["name"]] = values
+    return pd.DataFrame(data, index=pd.RangeIndex(manifest["num_rows"]),
+                        copy=False)
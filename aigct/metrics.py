@@ -0,0 +1,609 @@
+"""
+Vectorized binary classification metrics for all of the variant
+effect sources (VEPs) of an analysis at once. The scores of every
+source are sorted a single time, by source and by descending score
+within a source, and the metrics of all of the sources are derived
+from the cumulative true and false positive counts and the ranks of
+the sorted scores rather than by looping over the sources.
+
+The curves and areas computed are the same as those computed by
+sklearn.metrics roc_curve, roc_auc_score, precision_recall_curve and
+auc, and the Mann-Whitney U test the same as scipy.stats.mannwhitneyu,
+for each source separately.
+"""
+
+import os
+import zlib
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+SAME_LABEL_ROC_EXCEPTION = ("Cannot compute roc metrics because all "
+                            "labels have same value")
+SAME_LABEL_MWU_EXCEPTION = ("Cannot compute mann-whitney u values "
+                            "because all labels have same value")
+NAN_SCORE_EXCEPTION = "Input contains NaN"
+
+# Maximum number of resampled scores drawn at once by the bootstrap.
+# Bounds the memory used by a batch of resamples to a few hundred MB.
+BOOTSTRAP_BATCH_SIZE = 4 * 1024 * 1024
+
+
+@dataclass
+class SortedScores:
+    """
+    Scores and binary labels of a set of sources sorted by source and
+    by descending score within each source.
+
+    Attributes
+    ----------
+    sources : list
+        Distinct sources in sorted order. Sources are referred to by
+        their position in this list, their code.
+    codes : np.ndarray
+        Code of the source of each sorted score
+    scores : np.ndarray
+        Sorted scores as float64
+    labels : np.ndarray
+        Binary label (0 or 1) of each sorted score
+    starts : np.ndarray
+        Position of the first score of each source
+    ends : np.ndarray
+        Position one past the last score of each source
+    """
+    sources: list
+    codes: np.ndarray
+    scores: np.ndarray
+    labels: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+
+    @property
+    def num_sources(self) -> int:
+        return len(self.sources)
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self.ends - self.starts
+
+    @property
+    def num_positives(self) -> np.ndarray:
+        return np.bincount(self.codes, weights=self.labels,
+                           minlength=self.num_sources).astype(np.int64)
+
+    @property
+    def num_negatives(self) -> np.ndarray:
+        return self.counts - self.num_positives
+
+    @property
+    def has_nan(self) -> np.ndarray:
+        """True for each source that has a missing score"""
+        return np.bincount(self.codes, weights=np.isnan(self.scores),
+                           minlength=self.num_sources) > 0
+
+    def source_array(self, codes: np.ndarray) -> np.ndarray:
+        """Returns the sources of an array of source codes"""
+        return np.asarray(self.sources, dtype=object)[codes]
+
+    def subset(self, first: int, last: int) -> "SortedScores":
+        """
+        Returns the sorted scores of the sources with codes first up to
+        but not including last. The arrays are views of those of this
+        object and the codes start from 0.
+        """
+        start = self.starts[first] if first < last else 0
+        end = self.ends[last - 1] if first < last else 0
+        return SortedScores(
+            self.sources[first:last], self.codes[start:end] - first,
+            self.scores[start:end], self.labels[start:end],
+            self.starts[first:last] - start, self.ends[first:last] - start)
+
+
+def sort_scores(sources, scores, labels) -> SortedScores:
+    """
+    Sort the scores of a set of sources.
+
+    Parameters
+    ----------
+    sources : array like
+        Source of each score, e.g. the SCORE_SOURCE column
+    scores : array like
+        Scores, e.g. the RANK_SCORE column
+    labels : array like
+        Binary label of each score, e.g. the BINARY_LABEL column
+
+    Returns
+    -------
+    SortedScores
+    """
+    codes, uniques = pd.factorize(np.asarray(sources), sort=True)
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.int64)
+    order = np.lexsort((-scores, codes))
+    codes = codes[order]
+    source_codes = np.arange(len(uniques))
+    return SortedScores(
+        list(uniques), codes, scores[order], labels[order],
+        np.searchsorted(codes, source_codes, side="left"),
+        np.searchsorted(codes, source_codes, side="right"))
+
+
+def partition_sources(sorted_scores: SortedScores,
+                      num_parts: int) -> list[tuple[int, int]]:
+    """
+    Splits the sources into at most num_parts ranges of consecutive
+    codes holding about the same number of scores each, so that the
+    metrics of the ranges can be computed in parallel.
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        (first, last) code ranges in code order, see SortedScores.subset
+    """
+    num_sources = sorted_scores.num_sources
+    num_parts = max(1, min(num_parts, num_sources))
+    targets = len(sorted_scores.codes) * np.arange(1, num_parts) / num_parts
+    bounds = np.searchsorted(sorted_scores.ends, targets, side="left") + 1
+    bounds = np.unique(np.clip(np.concatenate(([0], bounds, [num_sources])),
+                               0, num_sources))
+    return [(int(first), int(last)) for first, last in
+            zip(bounds[:-1], bounds[1:])]
+
+
+SORTED_SCORES_ARRAYS = ["codes", "scores", "labels", "starts", "ends"]
+
+
+def save_sorted_scores(sorted_scores: SortedScores, folder: str):
+    """
+    Writes the arrays of sorted_scores to .npy files in folder so that
+    other processes can map them with load_sorted_scores rather than
+    receiving a pickled copy.
+    """
+    np.save(os.path.join(folder, "sources.npy"),
+            np.asarray(sorted_scores.sources, dtype=str))
+    for name in SORTED_SCORES_ARRAYS:
+        np.save(os.path.join(folder, name + ".npy"),
+                getattr(sorted_scores, name))
+
+
+def load_sorted_scores(folder: str) -> SortedScores:
+    """
+    Returns the sorted scores saved in folder by save_sorted_scores.
+    The arrays are read only memory maps of the files.
+    """
+    sources = np.load(os.path.join(folder, "sources.npy")).tolist()
+    return SortedScores(sources, *[
+        np.load(os.path.join(folder, name + ".npy"), mmap_mode="r")
+        for name in SORTED_SCORES_ARRAYS])
+
+
+def binary_clf_curves(sorted_scores: SortedScores) -> tuple:
+    """
+    Counts the true and false positives at each distinct score
+    threshold of each source. Equivalent to sklearn's
+    _binary_clf_curve for each source.
+
+    Returns
+    -------
+    tuple
+        codes, fps, tps, thresholds. One element per distinct score of
+        each source ordered by source and descending threshold.
+    """
+    codes = sorted_scores.codes
+    scores = sorted_scores.scores
+    # The last score of each run of equal scores within a source
+    last = np.ones(len(scores), dtype=bool)
+    last[:-1] = (scores[1:] != scores[:-1]) | (codes[1:] != codes[:-1])
+    threshold_idxs = np.flatnonzero(last)
+    threshold_codes = codes[threshold_idxs]
+    starts = sorted_scores.starts[threshold_codes]
+    cum_labels = np.cumsum(sorted_scores.labels)
+    # Positives counted in the sources before the source of each
+    # threshold
+    preceding = np.concatenate(([0], cum_labels))[starts]
+    tps = cum_labels[threshold_idxs] - preceding
+    fps = threshold_idxs - starts + 1 - tps
+    return threshold_codes, fps, tps, scores[threshold_idxs]
+
+
+def _segment_areas(codes: np.ndarray, x: np.ndarray, y: np.ndarray,
+                   num_sources: int) -> np.ndarray:
+    """
+    Trapezoidal area under the curve of each source where the points
+    of all of the sources are concatenated in codes, x and y.
+    """
+    same_source = codes[1:] == codes[:-1]
+    areas = (x[1:] - x[:-1]) * (y[1:] + y[:-1]) / 2.0
+    return np.bincount(codes[1:][same_source], weights=areas[same_source],
+                       minlength=num_sources).astype(np.float64)
+
+
+def _source_first(codes: np.ndarray) -> np.ndarray:
+    """Positions in codes where a new source begins"""
+    return np.flatnonzero(np.diff(codes, prepend=-1) != 0)
+
+
+def roc_curves(sorted_scores: SortedScores) -> tuple:
+    """
+    Computes the ROC AUC and ROC curve of each source. The curve is
+    that returned by sklearn.metrics.roc_curve with drop_intermediate
+    True. No curve is returned for a source whose labels all have the
+    same value or that has a missing score. Its AUC is NaN and its
+    exception explains why.
+
+    Returns
+    -------
+    tuple
+        aucs, exceptions - one element per source
+        curve_codes, fprs, tprs, thresholds - one element per point of
+        the curves of the sources ordered by source
+    """
+    num_positives = sorted_scores.num_positives
+    num_negatives = sorted_scores.num_negatives
+    has_nan = sorted_scores.has_nan
+    valid = (num_positives > 0) & (num_negatives > 0) & ~has_nan
+    exceptions = np.where(has_nan, NAN_SCORE_EXCEPTION,
+                          SAME_LABEL_ROC_EXCEPTION).astype(object)
+    exceptions[valid] = np.nan
+
+    codes, fps, tps, thresholds = binary_clf_curves(sorted_scores)
+    keep = valid[codes]
+    codes, fps, tps, thresholds = (codes[keep], fps[keep], tps[keep],
+                                   thresholds[keep])
+    # Drop thresholds that lie on a straight line between their
+    # neighbours, keeping the first and last threshold of each source
+    keep = np.ones(len(codes), dtype=bool)
+    interior = (codes[2:] == codes[:-2])
+    keep[1:-1] = ~interior | (np.diff(fps, 2) != 0) | (np.diff(tps, 2) != 0)
+    codes, fps, tps, thresholds = (codes[keep], fps[keep], tps[keep],
+                                   thresholds[keep])
+    # Add the (0, 0) point at an infinite threshold to each curve
+    first = _source_first(codes)
+    codes = np.insert(codes, first, codes[first])
+    fps = np.insert(fps, first, 0)
+    tps = np.insert(tps, first, 0)
+    thresholds = np.insert(thresholds, first, np.inf)
+
+    fprs = fps / num_negatives[codes]
+    tprs = tps / num_positives[codes]
+    aucs = _segment_areas(codes, fprs, tprs, sorted_scores.num_sources)
+    aucs[~valid] = np.nan
+    return aucs, exceptions, codes, fprs, tprs, thresholds
+
+
+def pr_curves(sorted_scores: SortedScores) -> tuple:
+    """
+    Computes the precision recall curve and the area under it of each
+    source. The curve is that returned by
+    sklearn.metrics.precision_recall_curve, excluding its final
+    (recall 0, precision 1) point which has no threshold, in order of
+    ascending threshold. The area is sklearn.metrics.auc of the full
+    curve.
+
+    Returns
+    -------
+    tuple
+        aucs - one element per source
+        curve_codes, precisions, recalls, thresholds - one element
+        per point of the curves of the sources ordered by source
+    """
+    if sorted_scores.has_nan.any():
+        raise Exception(NAN_SCORE_EXCEPTION)
+    num_positives = sorted_scores.num_positives
+    codes, fps, tps, thresholds = binary_clf_curves(sorted_scores)
+    precisions = tps / (tps + fps)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recalls = np.where(num_positives[codes] > 0,
+                           tps / num_positives[codes], 1.0)
+
+    # Area of the curve including its (recall 0, precision 1) point,
+    # computed in order of increasing recall
+    first = _source_first(codes)
+    aucs = _segment_areas(np.insert(codes, first, codes[first]),
+                          np.insert(recalls, first, 0.0),
+                          np.insert(precisions, first, 1.0),
+                          sorted_scores.num_sources)
+
+    # Reverse the points of each source to ascending threshold order
+    order = np.lexsort((-np.arange(len(codes)), codes))
+    return (aucs, codes[order], precisions[order], recalls[order],
+            thresholds[order])
+
+
+def mann_whitney_u(sorted_scores: SortedScores) -> tuple:
+    """
+    Computes the two sided Mann-Whitney U test of the scores of the
+    negative labels against those of the positive labels of each
+    source, i.e. scipy.stats.mannwhitneyu(negative_scores,
+    positive_scores). The ranks are the midranks of the sorted scores.
+    U of the positive scores equals the ROC AUC times the product of
+    the number of positive and negative labels.
+
+    The p value uses the normal approximation with tie and continuity
+    correction. For sources where scipy would use the exact
+    distribution instead, i.e. with no tied scores and 8 or fewer
+    positive or negative labels, or that have missing scores, scipy is
+    called.
+
+    Returns
+    -------
+    tuple
+        u_statistics, pvalues, exceptions - one element per source.
+        u_statistics are those of the negative scores.
+    """
+    codes = sorted_scores.codes
+    scores = sorted_scores.scores
+    num_positives = sorted_scores.num_positives
+    num_negatives = sorted_scores.num_negatives
+    counts = sorted_scores.counts
+    num_sources = sorted_scores.num_sources
+
+    # Runs of tied scores within a source
+    last = np.ones(len(scores), dtype=bool)
+    last[:-1] = (scores[1:] != scores[:-1]) | (codes[1:] != codes[:-1])
+    run_ends = np.flatnonzero(last)
+    run_starts = np.concatenate(([0], run_ends[:-1] + 1))
+    run_sizes = run_ends - run_starts + 1
+    run_codes = codes[run_ends]
+    cum_labels = np.concatenate(([0], np.cumsum(sorted_scores.labels)))
+    run_negatives = run_sizes - (cum_labels[run_ends + 1] -
+                                 cum_labels[run_starts])
+    # Scores are sorted in descending order so the ascending rank of
+    # the score at offset i within its source is count - i. Tied
+    # scores get the average of the ranks of the run.
+    source_starts = sorted_scores.starts[run_codes]
+    midranks = counts[run_codes] - (run_starts + run_ends -
+                                    2 * source_starts) / 2.0
+    negative_rank_sums = np.bincount(run_codes,
+                                     weights=midranks * run_negatives,
+                                     minlength=num_sources)
+    tie_terms = np.bincount(run_codes,
+                            weights=run_sizes.astype(np.float64) ** 3 -
+                            run_sizes, minlength=num_sources)
+    has_ties = np.bincount(run_codes, weights=run_sizes > 1,
+                           minlength=num_sources) > 0
+
+    n1 = num_negatives.astype(np.float64)
+    n2 = num_positives.astype(np.float64)
+    n = n1 + n2
+    u_statistics = negative_rank_sums - n1 * (n1 + 1) / 2
+    u = np.maximum(u_statistics, n1 * n2 - u_statistics)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_terms / (n * (n - 1))))
+        z = (u - n1 * n2 / 2 - 0.5) / s
+    pvalues = np.clip(2 * stats.norm.sf(z), 0.0, 1.0)
+
+    exceptions = np.full(num_sources, np.nan, dtype=object)
+    same_label = (num_positives == 0) | (num_negatives == 0)
+    exceptions[same_label] = SAME_LABEL_MWU_EXCEPTION
+    u_statistics[same_label] = np.nan
+    pvalues[same_label] = np.nan
+    use_scipy = ~same_label & (sorted_scores.has_nan |
+                               (~has_ties & ((num_negatives <= 8) |
+                                             (num_positives <= 8))))
+    for code in np.flatnonzero(use_scipy):
+        source_slice = slice(sorted_scores.starts[code],
+                             sorted_scores.ends[code])
+        source_scores = scores[source_slice]
+        source_labels = sorted_scores.labels[source_slice]
+        result = stats.mannwhitneyu(source_scores[source_labels == 0],
+                                    source_scores[source_labels == 1])
+        u_statistics[code] = result.statistic
+        pvalues[code] = result.pvalue
+    return u_statistics, pvalues, exceptions
+
+
+@dataclass
+class BootstrapOptions:
+    """
+    Options of the bootstrap confidence intervals of the ROC and PR
+    AUCs.
+
+    Attributes
+    ----------
+    num_resamples : int
+        Number of bootstrap resamples of the scores of each source
+    confidence_level : float
+        Confidence level of the percentile intervals, e.g. 0.95
+    seed : int
+        Seed of the random resamples. The resamples of a source depend
+        only on the seed and the name of the source.
+    """
+    num_resamples: int
+    confidence_level: float = 0.95
+    seed: int = 0
+
+
+def _bootstrap_source_aucs(scores: np.ndarray, labels: np.ndarray,
+                           num_resamples: int,
+                           rng: np.random.Generator) -> tuple:
+    """
+    ROC and PR AUCs of num_resamples resamples with replacement of the
+    scores and labels of one source sorted by descending score.
+
+    A resample of the sorted scores is sorted as well, so rather than
+    sorting each resample the number of times each run of tied scores
+    is drawn is counted. The cumulative counts over the runs are the
+    true and false positives at each threshold of the resample.
+    Resamples are processed in batches with one row per resample.
+    """
+    num_scores = len(scores)
+    last = np.ones(num_scores, dtype=bool)
+    last[:-1] = scores[1:] != scores[:-1]
+    # Run of tied scores of each score
+    runs = np.concatenate(([0], np.cumsum(last[:-1])))
+    num_runs = runs[-1] + 1
+    # Draws are counted per run and label in bin 2 * run + label
+    bins = 2 * runs + labels
+    roc_aucs = np.empty(num_resamples)
+    pr_aucs = np.empty(num_resamples)
+    batch_size = max(1, BOOTSTRAP_BATCH_SIZE // num_scores)
+    for start in range(0, num_resamples, batch_size):
+        num_rows = min(batch_size, num_resamples - start)
+        draws = rng.integers(0, num_scores, size=(num_rows, num_scores))
+        keys = (bins[draws] +
+                2 * num_runs * np.arange(num_rows)[:, None]).ravel()
+        counts = np.bincount(keys, minlength=2 * num_runs * num_rows
+                             ).reshape(num_rows, num_runs, 2)
+        negatives = counts[:, :, 0]
+        positives = counts[:, :, 1]
+        fps = np.cumsum(negatives, axis=1)
+        tps = np.cumsum(positives, axis=1)
+        num_positives = tps[:, -1]
+        num_negatives = fps[:, -1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Trapezoid between the ROC points before and after each
+            # run, the true positives before the run being tps -
+            # positives. Runs not drawn by a resample add no area.
+            roc_areas = (negatives * (2 * tps - positives)).sum(axis=1)
+            roc_aucs[start:start + num_rows] = roc_areas / (
+                2.0 * num_positives * num_negatives)
+            # Only runs with positives add area to the PR curve. The
+            # precision before the first drawn run is that of the
+            # (recall 0, precision 1) point.
+            drawn = tps + fps
+            precisions = np.where(drawn > 0, tps / drawn, 1.0)
+            previous = np.concatenate((np.ones((num_rows, 1)),
+                                       precisions[:, :-1]), axis=1)
+            pr_areas = (positives * (precisions + previous)).sum(axis=1)
+            pr_aucs[start:start + num_rows] = pr_areas / (
+                2.0 * num_positives)
+        # AUCs of resamples with a single label value are undefined
+        single_label = (num_positives == 0) | (num_negatives == 0)
+        roc_aucs[start:start + num_rows][single_label] = np.nan
+        pr_aucs[start:start + num_rows][num_positives == 0] = np.nan
+    return roc_aucs, pr_aucs
+
+
+def bootstrap_auc_intervals(sorted_scores: SortedScores,
+                            options: BootstrapOptions) -> tuple:
+    """
+    Computes percentile bootstrap confidence intervals of the ROC AUC
+    and PR AUC of each source. Resamples whose labels all have the
+    same value are ignored. The intervals of a source whose labels
+    all have the same value or that has a missing score are NaN.
+
+    Returns
+    -------
+    tuple
+        roc_lower, roc_upper, pr_lower, pr_upper - one element per
+        source
+    """
+    num_sources = sorted_scores.num_sources
+    intervals = np.full((4, num_sources), np.nan)
+    quantiles = [(1 - options.confidence_level) / 2,
+                 (1 + options.confidence_level) / 2]
+    valid = ((sorted_scores.num_positives > 0) &
+             (sorted_scores.num_negatives > 0) & ~sorted_scores.has_nan)
+    for code in np.flatnonzero(valid):
+        source_slice = slice(sorted_scores.starts[code],
+                             sorted_scores.ends[code])
+        rng = np.random.default_rng(
+            [options.seed,
+             zlib.crc32(str(sorted_scores.sources[code]).encode())])
+        roc_aucs, pr_aucs = _bootstrap_source_aucs(
+            sorted_scores.scores[source_slice],
+            sorted_scores.labels[source_slice],
+            options.num_resamples, rng)
+        with np.errstate(invalid="ignore"):
+            if not np.isnan(roc_aucs).all():
+                intervals[0:2, code] = np.nanquantile(roc_aucs, quantiles)
+            if not np.isnan(pr_aucs).all():
+                intervals[2:4, code] = np.nanquantile(pr_aucs, quantiles)
+    return tuple(intervals)
+
+
+def _row_midranks(values: np.ndarray) -> np.ndarray:
+    """
+    Midranks, starting from 1, of the values of each row of a 2
+    dimensional array, tied values getting the average of their ranks.
+    """
+    num_rows, num_columns = values.shape
+    order = np.argsort(values, axis=1, kind="stable")
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    run_start = np.ones((num_rows, num_columns), dtype=bool)
+    run_start[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    run_start = run_start.ravel()
+    run_starts = np.flatnonzero(run_start)
+    run_ends = np.append(run_starts[1:], len(run_start))
+    run_midranks = (run_starts % num_columns +
+                    (run_ends - run_starts - 1) / 2.0 + 1)
+    midranks = np.empty((num_rows, num_columns))
+    np.put_along_axis(
+        midranks, order,
+        run_midranks[np.cumsum(run_start) - 1].reshape(num_rows,
+                                                       num_columns),
+        axis=1)
+    return midranks
+
+
+def delong_covariance(scores: np.ndarray, labels: np.ndarray) -> tuple:
+    """
+    Computes the ROC AUCs of a set of sources scoring the same
+    variants and the DeLong covariance matrix of the AUCs using the
+    fast midrank algorithm of Sun and Xu (2014), which is O(n log n)
+    in the number of variants for each source.
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        Sources x variants array of scores. No score may be missing.
+    labels : np.ndarray
+        Binary label of each variant
+
+    Returns
+    -------
+    tuple
+        aucs - one element per source, covariance - sources x sources
+    """
+    labels = np.asarray(labels)
+    num_positives = int((labels == 1).sum())
+    num_negatives = len(labels) - num_positives
+    if num_positives < 2 or num_negatives < 2:
+        raise Exception("DeLong test requires at least 2 positive and " +
+                        "2 negative labels")
+    positive_scores = scores[:, labels == 1]
+    negative_scores = scores[:, labels != 1]
+    positive_ranks = _row_midranks(positive_scores)
+    negative_ranks = _row_midranks(negative_scores)
+    ranks = _row_midranks(np.concatenate((positive_scores,
+                                          negative_scores), axis=1))
+    aucs = (ranks[:, :num_positives].sum(axis=1) / num_positives /
+            num_negatives - (num_positives + 1.0) / (2.0 * num_negatives))
+    # Structural components: the fraction of negatives scored below
+    # each positive and of positives scored above each negative
+    positive_components = (ranks[:, :num_positives] -
+                           positive_ranks) / num_negatives
+    negative_components = 1.0 - (ranks[:, num_positives:] -
+                                 negative_ranks) / num_positives
+    covariance = (np.atleast_2d(np.cov(positive_components)) /
+                  num_positives +
+                  np.atleast_2d(np.cov(negative_components)) /
+                  num_negatives)
+    return aucs, covariance
+
+
+def delong_pairwise_tests(aucs: np.ndarray,
+                          covariance: np.ndarray) -> tuple:
+    """
+    Two sided DeLong tests of the difference of the AUCs of every pair
+    of sources given the result of delong_covariance.
+
+    Returns
+    -------
+    tuple
+        first, second, differences, z_scores, pvalues - one element per
+        pair of sources. first and second are the indexes of the
+        sources of each pair, first < second, and differences the AUC
+        of first minus that of second.
+    """
+    first, second = np.triu_indices(len(aucs), 1)
+    differences = aucs[first] - aucs[second]
+    variances = (covariance[first, first] + covariance[second, second] -
+                 2 * covariance[first, second])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_scores = np.where(variances > 0,
+                            differences / np.sqrt(variances), np.nan)
+    pvalues = 2 * stats.norm.sf(np.abs(z_scores))
+    return first, second, differences, z_scores, pvalues
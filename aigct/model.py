@@ -6,6 +6,7 @@ behavior associated with them.
 """
 
 from dataclasses import dataclass
+import numpy as np
 import pandas as pd
 from typing import List, Dict
 
@@ -84,6 +85,135 @@ class VariantFilter:
     filter_variants: pd.DataFrame
 
 
+class FilterExpression:
+    """
+    Base class of the expressions that combine named filters, gene
+    lists, regions, allele frequency ranges and variant lists into a
+    set of variants. Expressions combine with | (union), & (intersection)
+    and - (difference), e.g.
+
+        (NamedFilter("Oncogene") | GeneFilter(["MTOR"])) -
+        VariantIdFilter(training_variants_df)
+
+    An expression is evaluated against the variants of a task, see the
+    filter_expression attribute of VEQueryCriteria.
+    """
+
+    def __or__(self, other: "FilterExpression") -> "FilterExpression":
+        return FilterUnion([self, other])
+
+    def __and__(self, other: "FilterExpression") -> "FilterExpression":
+        return FilterIntersection([self, other])
+
+    def __sub__(self, other: "FilterExpression") -> "FilterExpression":
+        return FilterDifference(self, other)
+
+
+@dataclass
+class NamedFilter(FilterExpression):
+    """
+    The variants selected by a system filter of the task.
+
+    Attributes
+    ----------
+    filter_name : str
+        Name of the filter
+    """
+
+    filter_name: str
+
+
+@dataclass
+class GeneFilter(FilterExpression):
+    """
+    The variants of a list of genes.
+
+    Attributes
+    ----------
+    gene_symbols : list or Series
+        Gene symbols
+    """
+
+    gene_symbols: List[str] | pd.Series
+
+
+@dataclass
+class RegionFilter(FilterExpression):
+    """
+    The variants in genomic regions.
+
+    Attributes
+    ----------
+    regions : DataFrame, list or str
+        Regions as described for the regions attribute of
+        VEQueryCriteria.
+    """
+
+    regions: pd.DataFrame | List[str] | str
+
+
+@dataclass
+class AlleleFrequencyFilter(FilterExpression):
+    """
+    The variants whose allele frequency is in a range. See the
+    allele_frequency_min and related attributes of VEQueryCriteria.
+    A missing bound leaves the range open on that side.
+    """
+
+    minimum: float = None
+    maximum: float = None
+    minimum_inclusive: bool = True
+    maximum_inclusive: bool = True
+    sources: List[str] = None
+
+
+@dataclass
+class VariantIdFilter(FilterExpression):
+    """
+    The variants in a list of variant ids.
+
+    Attributes
+    ----------
+    variant_ids : DataFrame
+        Variant ids as described for the variant_ids attribute of
+        VEQueryCriteria.
+    column_name_map : Dict, optional
+        Maps the expected column names to the column names of
+        variant_ids.
+    """
+
+    variant_ids: pd.DataFrame
+    column_name_map: Dict = None
+
+
+@dataclass
+class FilterUnion(FilterExpression):
+    """
+    The variants in any of the operands.
+    """
+
+    operands: List[FilterExpression]
+
+
+@dataclass
+class FilterIntersection(FilterExpression):
+    """
+    The variants in all of the operands.
+    """
+
+    operands: List[FilterExpression]
+
+
+@dataclass
+class FilterDifference(FilterExpression):
+    """
+    The variants in left but not in right.
+    """
+
+    left: FilterExpression
+    right: FilterExpression
+
+
 @dataclass
 class VEQueryCriteria:
     """
@@ -122,6 +252,35 @@ class VEQueryCriteria:
     filter_name : str, optional
         The name of a system filter that can be used to limit the variants
         returned.
+    regions : DataFrame, list or str, optional
+        Genomic regions. Either a dataframe with CHROMOSOME, START and
+        END columns, where START and END are 1-based and inclusive, a
+        list of regions in the chromosome:start-end notation, e.g.
+        "chr7:140719327-140924929", or the path of a BED file. See the
+        regions module.
+    include_regions : bool, optional
+        If regions is provided, indicates whether to limit variants to
+        those in the regions or to exclude the variants in the regions.
+    allele_frequency_min : float, optional
+        Limit variants to those whose allele frequency is greater than,
+        or equal to if allele_frequency_min_inclusive, this value.
+    allele_frequency_max : float, optional
+        Limit variants to those whose allele frequency is less than,
+        or equal to if allele_frequency_max_inclusive, this value.
+        e.g. allele_frequency_max=1.0e-4 with
+        allele_frequency_max_inclusive=False for rare variants.
+    allele_frequency_min_inclusive : bool, optional
+        Whether allele_frequency_min is part of the range.
+    allele_frequency_max_inclusive : bool, optional
+        Whether allele_frequency_max is part of the range.
+    allele_frequency_sources : list, optional
+        Limit variants to those whose allele frequency comes from one
+        of these sources, i.e. ALLELE_FREQUENCY_SOURCE values.
+    filter_expression : FilterExpression, optional
+        Limit variants to the set described by a combination of named
+        filters, gene lists, regions, allele frequency ranges and
+        variant lists. See FilterExpression. Combined with the other
+        criteria, including filter_name, by intersection.
     """
 
     gene_symbols: List[str] | pd.DataFrame | pd.Series = None
@@ -132,6 +291,71 @@ class VEQueryCriteria:
     allele_frequency_operator: str = "="
     allele_frequency: float = None
     filter_name: str = None
+    regions: pd.DataFrame | List[str] | str = None
+    include_regions: bool = True
+    allele_frequency_min: float = None
+    allele_frequency_max: float = None
+    allele_frequency_min_inclusive: bool = True
+    allele_frequency_max_inclusive: bool = True
+    allele_frequency_sources: List[str] = None
+    filter_expression: FilterExpression = None
+
+
+@dataclass
+class UserAnalysisState:
+    """
+    The inputs of an analysis that included user scores which
+    VEAnalyzer.update_user_metrics needs to update its result when
+    some of the user scores change.
+
+    Attributes
+    ----------
+    task_code : str
+        Task code
+    user_vep_name : str
+        Name of user vep
+    column_name_map : Dict
+        Maps the column names of the user scores to the expected names
+    variant_effect_sources : list
+        System veps included in or excluded from the analysis
+    include_variant_effect_sources : bool
+        Whether variant_effect_sources were included or excluded
+    variant_query_criteria : VEQueryCriteria
+        Criteria limiting the variants of the analysis
+    vep_min_overlap_percent : float
+    variant_vep_retention_percent : float
+    metrics : list
+        Metrics computed, i.e. roc, pr, mwu
+    list_variants : bool
+    bootstrap : BootstrapOptions
+        Options of the bootstrap confidence intervals, if computed
+    label_variant_ids : ndarray
+        Sorted VARIANT_IDs of the labeled variants meeting
+        variant_query_criteria, i.e. the universe of variants that
+        the user scores were restricted to.
+    user_ve_scores : DataFrame
+        The user scores of the variants in the universe. Columns:
+        GENOME_ASSEMBLY, CHROMOSOME, POSITION, REFERENCE_NUCLEOTIDE,
+        ALTERNATE_NUCLEOTIDE, VARIANT_ID, RANK_SCORE
+    user_ve_scores_labels : DataFrame
+        The user scores and labels of the variants included in the
+        analysis. Columns: VARIANT_ID, RANK_SCORE, BINARY_LABEL
+    """
+
+    task_code: str
+    user_vep_name: str
+    column_name_map: Dict
+    variant_effect_sources: List[str]
+    include_variant_effect_sources: bool
+    variant_query_criteria: VEQueryCriteria
+    vep_min_overlap_percent: float
+    variant_vep_retention_percent: float
+    metrics: List[str]
+    list_variants: bool
+    bootstrap: object
+    label_variant_ids: np.ndarray
+    user_ve_scores: pd.DataFrame
+    user_ve_scores_labels: pd.DataFrame
 
 
 @dataclass
@@ -158,9 +382,13 @@ class VEAnalysisResult:
         ROC_AUC, EXCEPTION, SOURCE_NAME
         EXCEPTION would store an exception message in the event the
         roc could not be computed for that vep.
+        If bootstrap confidence intervals were requested it also has
+        ROC_AUC_CI_LOWER and ROC_AUC_CI_UPPER columns.
     pr_metrics : DataFrame, optional
         Precision/Recall metrics containing columns: SCORE_SOURCE,
         PR_AUC, SOURCE_NAME
+        If bootstrap confidence intervals were requested it also has
+        PR_AUC_CI_LOWER and PR_AUC_CI_UPPER columns.
     mwu_metrics : DataFrame, optional
         Mann-Whitney U metrics containing columns: SCORE_SOURCE,
         NEG_LOG10_MWU_PVAL, SOURCE_NAME
@@ -175,6 +403,10 @@ class VEAnalysisResult:
         Columns:
         SCORE_SOURCE, GENOME_ASSEMBLY, CHROMOSOME, POSITION,
         REFERENCE_NUCLEOTIDE, ALTERNATE_NUCLEOTIDE
+    user_analysis : UserAnalysisState, optional
+        If user scores were included in the analysis, the inputs
+        needed to update the result when some of them change. See
+        VEAnalyzer.update_user_metrics.
     """
 
     num_variants_included: int
@@ -187,6 +419,7 @@ class VEAnalysisResult:
     roc_curve_coordinates: pd.DataFrame
     pr_curve_coordinates: pd.DataFrame
     variants_included: pd.DataFrame
+    user_analysis: UserAnalysisState = None
 
 
 @dataclass
@@ -1,7 +1,45 @@
+import hashlib
+from dataclasses import fields, is_dataclass
+import numpy as np
 import pandas as pd
 from .util import str_or_list_to_list
 
 RELATIONAL_OPERATORS = ["==", "!=", ">", "<", ">=", "<="]
+PREDICATE_OPERATORS = RELATIONAL_OPERATORS + ["=", "in", "not in"]
+
+
+def copy_on_write_enabled() -> bool:
+    """
+    True if pandas copy on write is in effect. It is always on from
+    pandas 3 and can be turned on in pandas 2 by setting
+    pd.options.mode.copy_on_write = True.
+    """
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    return pd.options.mode.copy_on_write is True
+
+
+def lazy_copy(data_frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a copy of data_frame that the caller may modify without
+    affecting data_frame. When copy on write is in effect the copy
+    shares the memory of data_frame and a column is only copied if
+    either dataframe modifies it. Otherwise a deep copy is made.
+    """
+    return data_frame.copy(deep=not copy_on_write_enabled())
+
+
+def concatenate_ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Returns the concatenation of the integer ranges starts[i] up to
+    but not including ends[i], i.e. np.concatenate([np.arange(start,
+    end) for start, end in zip(starts, ends)]) without the loop.
+    Empty and negative ranges contribute nothing.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.maximum(np.asarray(ends, dtype=np.int64) - starts, 0)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
 
 
 def filter_dataframe_by_list(data_frame: pd.DataFrame,
@@ -11,6 +49,30 @@ def filter_dataframe_by_list(data_frame: pd.DataFrame,
                              filter_col_name_map: dict = None,
                              in_list: bool = True
                              ) -> pd.DataFrame:
+    """
+    Returns the rows of data_frame whose df_merge_columns values are in,
+    or if in_list is False are not in, filter_list. The filter is
+    evaluated as a boolean mask using hashed lookups rather than a merge
+    but returns the same rows, in the same order and with the same index
+    a merge would: a new RangeIndex for rows in the list and the
+    positions of the rows in data_frame for rows not in the list.
+    Missing values match missing values as they do in a merge.
+
+    Parameters
+    ----------
+    data_frame : DataFrame
+        Dataframe to filter
+    filter_list : DataFrame | list[str] | str | Series
+        Values to filter by. Must be a DataFrame if filtering by more
+        than one column.
+    df_merge_columns : list[str] | str
+        Columns of data_frame to filter on
+    filter_col_name_map : dict, optional
+        Maps df_merge_columns to the names of the corresponding columns
+        of filter_list if it is a DataFrame and they differ.
+    in_list : bool
+        Whether to keep the rows in the list or not in the list.
+    """
     df_merge_columns = str_or_list_to_list(df_merge_columns)
     if filter_col_name_map is None:
         filter_merge_columns = df_merge_columns
@@ -18,7 +80,14 @@ def filter_dataframe_by_list(data_frame: pd.DataFrame,
         filter_merge_columns = [filter_col_name_map[merge_col] for
                                 merge_col in df_merge_columns]
     if type(filter_list) is pd.DataFrame:
-        filter_df = filter_list[filter_merge_columns].drop_duplicates()
+        if len(df_merge_columns) == 1:
+            mask = data_frame[df_merge_columns[0]].isin(
+                filter_list[filter_merge_columns[0]]).to_numpy()
+        else:
+            filter_index = pd.MultiIndex.from_frame(
+                filter_list[filter_merge_columns].drop_duplicates())
+            mask = filter_index.get_indexer(pd.MultiIndex.from_frame(
+                data_frame[df_merge_columns])) >= 0
     else:
         if len(df_merge_columns) > 1:
             raise Exception("Cannot filter a dataframe by more than " +
@@ -27,18 +96,11 @@ def filter_dataframe_by_list(data_frame: pd.DataFrame,
                             "dataframe.")
         if type(filter_list) is str:
             filter_list = [filter_list]
-        filter_df = pd.DataFrame({df_merge_columns[0]: list(set(filter_list))})
+        mask = data_frame[df_merge_columns[0]].isin(
+            list(filter_list)).to_numpy()
     if in_list:
-        return data_frame.merge(filter_df[filter_merge_columns],
-                                left_on=df_merge_columns,
-                                right_on=filter_merge_columns,
-                                how="inner")[data_frame.columns]
-    data_frame_ret = data_frame.merge(filter_df[filter_merge_columns],
-                                      left_on=df_merge_columns,
-                                      right_on=filter_merge_columns,
-                                      how="left", indicator=True)
-    return data_frame_ret.query("_merge == 'left_only'").drop(
-        columns="_merge")[data_frame.columns]
+        return data_frame[mask].reset_index(drop=True)
+    return data_frame[~mask].set_axis(np.flatnonzero(~mask))
 
 
 def build_dataframe_where_clause(where_params: dict) -> str:
@@ -62,3 +124,89 @@ def build_dataframe_where_clause(where_params: dict) -> str:
     return clause
 
 
+def filter_dataframe_by_predicates(data_frame: pd.DataFrame,
+                                   predicates: list[tuple]) -> pd.DataFrame:
+    """
+    Returns the rows of data_frame satisfying all of the predicates.
+
+    Parameters
+    ----------
+    data_frame : DataFrame
+        Dataframe to filter
+    predicates : list[tuple]
+        List of (column, operator, value) tuples. operator is one of
+        PREDICATE_OPERATORS. For "in" and "not in" value is a list of
+        values. As with DataFrame.query, missing values never satisfy
+        "=", "<", "<=", ">" or ">=" but always satisfy "!=".
+    """
+    mask = pd.Series(True, index=data_frame.index)
+    for column, operator, value in predicates:
+        if operator not in PREDICATE_OPERATORS:
+            raise Exception(
+                f"{operator} is not a legal predicate operator. " +
+                f"It must be one of {PREDICATE_OPERATORS}")
+        col = data_frame[column]
+        if operator == "in":
+            mask &= col.isin(list(value))
+        elif operator == "not in":
+            mask &= ~col.isin(list(value))
+        elif operator in ["=", "=="]:
+            mask &= col == value
+        elif operator == "!=":
+            mask &= col != value
+        elif operator == ">":
+            mask &= col > value
+        elif operator == "<":
+            mask &= col < value
+        elif operator == ">=":
+            mask &= col >= value
+        else:
+            mask &= col <= value
+    return data_frame[mask]
+
+
+def _update_digest(digest, value):
+    """
+    Feeds a canonical representation of value into digest. Handles
+    the types found in the parameters of an analysis or a query:
+    scalars, lists, dicts, dataclasses, numpy arrays and pandas
+    objects. Each value is prefixed with its type so that e.g. "1" and
+    1 differ.
+    """
+    digest.update(type(value).__name__.encode())
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr([(str(column), str(dtype)) for column, dtype
+                            in value.dtypes.items()]).encode())
+        digest.update(pd.util.hash_pandas_object(
+            value, index=False).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        digest.update(repr((str(value.name), str(value.dtype))).encode())
+        digest.update(pd.util.hash_pandas_object(
+            value, index=False).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(repr((value.shape, str(value.dtype))).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=repr):
+            _update_digest(digest, key)
+            _update_digest(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(str(len(value)).encode())
+        for item in value:
+            _update_digest(digest, item)
+    elif is_dataclass(value):
+        for field in fields(value):
+            _update_digest(digest, field.name)
+            _update_digest(digest, getattr(value, field.name))
+    else:
+        digest.update(repr(value).encode())
+    digest.update(b";")
+
+
+def fingerprint(value) -> str:
+    """
+    Returns a digest of value that is the same for equal values.
+    """
+    digest = hashlib.sha256()
+    _update_digest(digest, value)
+    return digest.hexdigest()
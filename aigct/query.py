@@ -14,9 +14,12 @@ from .repository import (
     VariantEffectSourceRepository,
     VariantEffectScoreRepository,
     VariantFilterRepository,
-    VARIANT_PK_COLUMNS
+    RepoSessionContext,
+    VARIANT_KEY_COLUMN,
+    cache_memory_report
 )
 from .model import (
+    FilterExpression,
     VEQueryCriteria,
     VariantFilter
 )
@@ -43,6 +46,11 @@ def cleanup_variant_query_params(params: VEQueryCriteria):
     if params.column_name_map is not None:
         if len(params.column_name) == 0:
             params.column_name_map = None
+    if params.regions is not None and len(params.regions) == 0:
+        params.regions = None
+    if (params.allele_frequency_sources is not None and
+            len(params.allele_frequency_sources) == 0):
+        params.allele_frequency_sources = None
     if params.allele_frequency_operator is None:
         params.allele_frequency_operator = "="
     return params
@@ -59,7 +67,8 @@ class VEBenchmarkQueryMgr:
                  variant_task_repo: VariantTaskRepository,
                  variant_effect_source_repo: VariantEffectSourceRepository,
                  variant_effect_score_repo: VariantEffectScoreRepository,
-                 variant_filter_repo: VariantFilterRepository
+                 variant_filter_repo: VariantFilterRepository,
+                 session_context: RepoSessionContext = None
                  ):
         self._variant_effect_label_repo = variant_effect_label_repo
         self._variant_repo = variant_repo
@@ -67,6 +76,7 @@ class VEBenchmarkQueryMgr:
         self._variant_effect_source_repo = variant_effect_source_repo
         self._variant_effect_score_repo = variant_effect_score_repo
         self._variant_filter_repo = variant_filter_repo
+        self._session_context = session_context
 
     def get_tasks(self) -> pd.DataFrame:
         """Get all tasks"""
@@ -93,6 +103,51 @@ class VEBenchmarkQueryMgr:
         """
         return self._variant_repo.get(qry)
 
+    def get_variants_in_regions(self, regions: pd.DataFrame | list[str] | str,
+                                task_code: str = None) -> pd.DataFrame:
+        """
+        Fetch the variants in genomic regions.
+
+        Parameters
+        ----------
+        regions : DataFrame, list or str
+            Regions as described for the regions attribute of
+            VEQueryCriteria, e.g. the path of a BED file of a gene
+            panel.
+        task_code : str, optional
+            If specified only the variants with labels for the task
+            are returned, along with their labels.
+
+        Returns
+        -------
+        DataFrame
+        """
+        qry = VEQueryCriteria(regions=regions)
+        if task_code is None:
+            return self._variant_repo.get(qry)
+        return self._variant_effect_label_repo.get(task_code, qry)
+
+    def get_variants_by_filter_expression(
+            self, task_code: str,
+            filter_expression: FilterExpression) -> pd.DataFrame:
+        """
+        Fetch the labeled variants of a task in the set described by a
+        filter expression, e.g. the variants of a gene panel less those
+        used to train a vep.
+
+        Parameters
+        ----------
+        task_code : str
+        filter_expression : FilterExpression
+            See FilterExpression in model package.
+
+        Returns
+        -------
+        DataFrame
+        """
+        return self._variant_effect_label_repo.get(
+            task_code, VEQueryCriteria(filter_expression=filter_expression))
+
     def get_variant_effect_sources(self, task_code: str) -> pd.DataFrame:
         return self._variant_effect_source_repo.get_by_task(task_code)
 
@@ -138,10 +193,15 @@ class VEBenchmarkQueryMgr:
             task_code, qry)
         scores = self._variant_effect_score_repo.get(
             task_code, variant_effect_sources,
-            include_variant_effect_sources, qry)
-        scores_labels = scores.merge(variant_labels, how="inner",
-                                     on=VARIANT_PK_COLUMNS)
-        grouped_scores = scores_labels.groupby("SCORE_SOURCE")
+            include_variant_effect_sources, qry,
+            columns=[VARIANT_KEY_COLUMN, "SCORE_SOURCE"])
+        # Joined on the integer VARIANT_ID rather than on the 5 column
+        # variant primary key
+        scores_labels = scores.merge(
+            variant_labels[[VARIANT_KEY_COLUMN, "BINARY_LABEL"]],
+            how="inner", on=VARIANT_KEY_COLUMN)
+        grouped_scores = scores_labels.groupby("SCORE_SOURCE",
+                                               observed=True)
         return grouped_scores.apply(
             self._compute_variant_counts,
             include_groups=False).reset_index()
@@ -237,9 +297,9 @@ class VEBenchmarkQueryMgr:
             result_type="expand", axis=1
         )
         if by == 'chromosome':
-            grouped = label_df.groupby('CHROMOSOME')
+            grouped = label_df.groupby('CHROMOSOME', observed=True)
         else:
-            grouped = label_df.groupby('GENE_SYMBOL')
+            grouped = label_df.groupby('GENE_SYMBOL', observed=True)
         return grouped.agg(
                 NUM_POSITIVE_LABELS=pd.NamedAgg(column='POSITIVE_LABEL',
                                                 aggfunc='sum'),
@@ -280,3 +340,17 @@ class VEBenchmarkQueryMgr:
             each filter
         """
         return self._variant_filter_repo.get_by_task(task_code)
+
+    def get_cache_memory_report(self) -> pd.DataFrame:
+        """
+        Return the memory used by the tables of the repository of this
+        query manager currently held in the in memory caches.
+
+        Returns
+        -------
+        DataFrame
+            One row per cached table and task with the columns
+            TABLE_NAME, TASK_CODE (None for tables not partitioned
+            by task), NUM_ROWS and MEMORY_BYTES.
+        """
+        return cache_memory_report(self._session_context)
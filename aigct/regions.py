@@ -0,0 +1,140 @@
+"""
+Genomic regions, i.e. intervals of positions on a chromosome, used to
+limit the variants returned by a query, see VEQueryCriteria.regions,
+and the index used to find the variants in a set of regions.
+
+Regions are represented by a dataframe with the REGION_COLUMNS where
+START and END are 1-based and inclusive, as are the POSITIONs of the
+variants. Regions read from a BED file, which are 0-based and half
+open, are converted.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from .pd_util import concatenate_ranges
+
+REGION_COLUMNS = ["CHROMOSOME", "START", "END"]
+BED_EXTENSIONS = [".bed", ".bed.gz", ".bed.bgz"]
+# Positions are shifted by this many bits to combine them with the
+# chromosome into a single sort key
+POSITION_BITS = 32
+
+
+def normalize_chromosome(chromosomes: pd.Series) -> pd.Series:
+    """
+    Returns the chromosome names without a chr prefix, as they are
+    stored in the repository.
+    """
+    return chromosomes.astype(str).str.removeprefix("chr")
+
+
+def read_bed(file_name: str) -> pd.DataFrame:
+    """
+    Reads the regions of a BED file, which may be gzipped. Only the
+    first three columns are used. Header, track and browser lines
+    are skipped.
+
+    Returns
+    -------
+    DataFrame
+        Regions with the REGION_COLUMNS
+    """
+    bed_df = pd.read_csv(file_name, sep="\t", header=None, comment="#",
+                         usecols=[0, 1, 2], names=["CHROM", "START", "END"],
+                         dtype=str, compression="gzip"
+                         if file_name.endswith(".bgz") else "infer")
+    bed_df = bed_df[~bed_df["CHROM"].str.startswith(("track", "browser"))]
+    return pd.DataFrame({
+        "CHROMOSOME": normalize_chromosome(bed_df["CHROM"]),
+        "START": bed_df["START"].astype(np.int64) + 1,
+        "END": bed_df["END"].astype(np.int64)}).reset_index(drop=True)
+
+
+def parse_region(region: str) -> tuple[str, int, int]:
+    """
+    Parses a region in the chrom:start-end notation, e.g. chr7:100-200,
+    or a single position, e.g. 7:150. Positions are 1-based and
+    inclusive. Commas in the positions are ignored.
+    """
+    chromosome, _, positions = region.strip().rpartition(":")
+    if chromosome == "":
+        raise Exception(f"Invalid region {region}. Expected " +
+                        "chromosome:start-end")
+    start, _, end = positions.replace(",", "").partition("-")
+    return chromosome, int(start), int(end or start)
+
+
+def regions_data_frame(regions: pd.DataFrame | list[str] | str
+                       ) -> pd.DataFrame:
+    """
+    Returns regions as a dataframe with the REGION_COLUMNS.
+
+    Parameters
+    ----------
+    regions : DataFrame, list or str
+        A dataframe with the REGION_COLUMNS, a list of regions in the
+        chrom:start-end notation, see parse_region, or the path of a
+        BED file.
+    """
+    if isinstance(regions, str):
+        if regions.lower().endswith(tuple(BED_EXTENSIONS)) or \
+                os.path.isfile(regions):
+            return read_bed(regions)
+        regions = [regions]
+    if not isinstance(regions, pd.DataFrame):
+        regions = pd.DataFrame([parse_region(region) for region in regions],
+                               columns=REGION_COLUMNS)
+    return pd.DataFrame({
+        "CHROMOSOME": normalize_chromosome(regions["CHROMOSOME"]),
+        "START": regions["START"].astype(np.int64),
+        "END": regions["END"].astype(np.int64)})
+
+
+class RegionIndex:
+    """
+    Index of the positions of the variants of the repository. The
+    variants are sorted by chromosome and position so that the
+    variants in a region are found with two binary searches.
+    """
+
+    def __init__(self, variant_df: pd.DataFrame):
+        """
+        Parameters
+        ----------
+        variant_df : DataFrame
+            Dataframe with CHROMOSOME, POSITION and VARIANT_ID columns
+        """
+        codes, chromosomes = pd.factorize(
+            normalize_chromosome(variant_df["CHROMOSOME"]))
+        self._codes = pd.Index(chromosomes)
+        keys = (codes.astype(np.int64) << POSITION_BITS) | \
+            variant_df["POSITION"].to_numpy(np.int64)
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._ids = variant_df["VARIANT_ID"].to_numpy(np.int64)[order]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def variant_ids(self, regions_df: pd.DataFrame) -> np.ndarray:
+        """
+        Returns the sorted VARIANT_IDs of the variants in any of the
+        regions. Regions on chromosomes without variants are ignored.
+
+        Parameters
+        ----------
+        regions_df : DataFrame
+            Regions with the REGION_COLUMNS, see regions_data_frame
+        """
+        codes = self._codes.get_indexer(regions_df["CHROMOSOME"])
+        known = codes >= 0
+        codes = codes[known].astype(np.int64) << POSITION_BITS
+        max_position = (1 << POSITION_BITS) - 1
+        starts = np.searchsorted(self._keys, codes | np.clip(
+            regions_df["START"].to_numpy(np.int64)[known], 0, max_position),
+            side="left")
+        ends = np.searchsorted(self._keys, codes | np.clip(
+            regions_df["END"].to_numpy(np.int64)[known], 0, max_position),
+            side="right")
+        return np.unique(self._ids[concatenate_ranges(starts, ends)])
@@ -41,7 +41,7 @@ class VEDataValidator:
 
     def _validate_pk(self, df: pd.DataFrame, pk_columns: list[str]
                      ) -> pd.DataFrame:
-        grouped_df = df.groupby(pk_columns).size()
+        grouped_df = df.groupby(pk_columns, observed=True).size()
         dups = grouped_df[grouped_df > 1]
         return dups.reset_index()
 
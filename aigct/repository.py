@@ -5,15 +5,46 @@ details of the repository structure.
 """
 
 import os
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 from .util import ParameterizedSingleton
 import threading
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from .pd_util import (
+    concatenate_ranges,
     filter_dataframe_by_list,
-    build_dataframe_where_clause
+    filter_dataframe_by_predicates,
+    fingerprint,
+    lazy_copy,
+    RELATIONAL_OPERATORS
+)
+from .util import str_or_list_to_list
+from .regions import RegionIndex, regions_data_frame
+from .model import (
+    AlleleFrequencyFilter,
+    FilterDifference,
+    FilterExpression,
+    FilterIntersection,
+    FilterUnion,
+    GeneFilter,
+    NamedFilter,
+    RegionFilter,
+    VariantFilter,
+    VariantIdFilter,
+    VEQueryCriteria
+)
+from .mapped_cache import (
+    is_current,
+    read_mapped_table,
+    write_mapped_table
+)
+from .storage import (
+    CSV_FORMAT,
+    TableStorage,
+    file_stats,
+    get_table_storage
 )
-from .model import VariantFilter, VEQueryCriteria
 
 
 TASK_SUBFOLDER = {
@@ -21,6 +52,12 @@ TASK_SUBFOLDER = {
 }
 
 DATA_FOLDER = "data"
+# Subdirectory of the repository root directory holding the memory
+# mapped copies of the cached tables. See the mapped_cache module.
+MAPPED_CACHE_FOLDER = "mapped_cache"
+# Subdirectory of the repository root directory holding the persisted
+# analysis snapshots. See the snapshot module.
+SNAPSHOT_FOLDER = "snapshots"
 TASK_FOLDERS = [os.path.join(DATA_FOLDER, task) for task in ["CANCER", "ADRD",
                                                              "CHD", "DDD"]]
 
@@ -31,13 +68,48 @@ class TableDef:
     file_name: str
     pk_columns: list[str]
     non_pk_columns: list[str]
-    columns: list[str] = field(init=False),
+    dtypes: dict[str, str] = None
+    file_format: str = CSV_FORMAT
+    # Columns a table is sorted by when it is written, so that the
+    # row groups of a columnar file cover narrow ranges of these
+    # columns and predicate pushdown can skip most of them.
+    sort_columns: list[str] = None
+    # Compact dtypes the table is converted to when it is loaded into
+    # a cache: categoricals for low cardinality strings, narrow integers
+    # and float32 scores. They apply to the in memory copy only, the
+    # stored file keeps the dtypes above.
+    cache_dtypes: dict[str, str] = None
+    columns: list[str] = field(init=False)
     full_file_name: str = field(init=False)
 
     def __post_init__(self):
         self.columns = self.pk_columns + self.non_pk_columns
+        self.file_name = get_table_storage(self.file_format).file_name(
+            self.file_name)
         self.full_file_name = os.path.join(self.folder, self.file_name)
-    
+
+    @property
+    def storage(self) -> TableStorage:
+        return get_table_storage(self.file_format)
+
+    @property
+    def variant_keyed(self) -> bool:
+        """
+        True if the rows of the table are identified by a variant and
+        therefore carry a VARIANT_ID column.
+        """
+        return all(column in self.pk_columns for column in VARIANT_PK_COLUMNS)
+
+    def compact(self, data_frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns data_frame with the cache_dtypes applied to the
+        columns it contains.
+        """
+        if not self.cache_dtypes:
+            return data_frame
+        return data_frame.astype(
+            {column: dtype for column, dtype in self.cache_dtypes.items()
+             if column in data_frame.columns})
 
 
 VARIANT_PK_COLUMNS = [
@@ -47,6 +119,24 @@ VARIANT_PK_COLUMNS = [
     "REFERENCE_NUCLEOTIDE",
     "ALTERNATE_NUCLEOTIDE"
 ]
+# Compact integer surrogate key for the 5 VARIANT_PK_COLUMNS. Assigned by
+# the VariantKeyIndex and carried by every table keyed by a variant so
+# that joins and set filters operate on a single int64 column.
+VARIANT_KEY_COLUMN = "VARIANT_ID"
+VARIANT_PK_DTYPES = {
+    "GENOME_ASSEMBLY": "str",
+    "CHROMOSOME": "str",
+    "POSITION": "int64",
+    "REFERENCE_NUCLEOTIDE": "str",
+    "ALTERNATE_NUCLEOTIDE": "str"
+}
+VARIANT_PK_CACHE_DTYPES = {
+    "GENOME_ASSEMBLY": "category",
+    "CHROMOSOME": "category",
+    "POSITION": "int32",
+    "REFERENCE_NUCLEOTIDE": "category",
+    "ALTERNATE_NUCLEOTIDE": "category"
+}
 VARIANT_NON_PK_COLUMNS = [
     "PRIOR_GENOME_ASSEMBLY",
     "PRIOR_CHROMOSOME",
@@ -65,9 +155,31 @@ VARIANT_NON_PK_COLUMNS = [
     "ALLELE_FREQUENCY_SOURCE",
     "ALLELE_FREQUENCY"
 ]
+VARIANT_KEY_TABLE_DEF = TableDef(DATA_FOLDER, "variant_key.csv",
+                                 VARIANT_PK_COLUMNS,
+                                 [VARIANT_KEY_COLUMN],
+                                 VARIANT_PK_DTYPES | {
+                                     VARIANT_KEY_COLUMN: "int64"},
+                                 sort_columns=[VARIANT_KEY_COLUMN])
 VARIANT_TABLE_DEF = TableDef(DATA_FOLDER, "variant.csv",
                              VARIANT_PK_COLUMNS,
-                             VARIANT_NON_PK_COLUMNS)
+                             VARIANT_NON_PK_COLUMNS,
+                             VARIANT_PK_DTYPES | {
+                                 "GENE_SYMBOL": "str",
+                                 "ALLELE_FREQUENCY_SOURCE": "str",
+                                 "ALLELE_FREQUENCY": "float64"},
+                             cache_dtypes=VARIANT_PK_CACHE_DTYPES | {
+                                 "PRIOR_GENOME_ASSEMBLY": "category",
+                                 "PRIOR_CHROMOSOME": "category",
+                                 "PRIOR_PRIOR_GENOME_ASSEMBLY": "category",
+                                 "PRIOR_PRIOR_CHROMOSOME": "category",
+                                 "REFERENCE_AMINO_ACID": "category",
+                                 "ALTERNATE_AMINO_ACID": "category",
+                                 "GENE_SYMBOL": "category",
+                                 "ENSEMBL_GENE_ID": "category",
+                                 "ENSEMBL_TRANSCRIPT_ID": "category",
+                                 "ENSEMBL_PROTEIN_ID": "category",
+                                 "ALLELE_FREQUENCY_SOURCE": "category"})
 
 VARIANT_LABEL_NON_PK_COLUMNS = [
     "LABEL_SOURCE",
@@ -77,7 +189,15 @@ VARIANT_LABEL_NON_PK_COLUMNS = [
 VARIANT_EFFECT_LABEL_TABLE_DEF = TableDef(DATA_FOLDER,
                                           "variant_effect_label.csv",
                                           VARIANT_PK_COLUMNS,
-                                          VARIANT_LABEL_NON_PK_COLUMNS)
+                                          VARIANT_LABEL_NON_PK_COLUMNS,
+                                          VARIANT_PK_DTYPES | {
+                                              "LABEL_SOURCE": "str",
+                                              "RAW_LABEL": "float64",
+                                              "BINARY_LABEL": "int64"},
+                                          cache_dtypes=(
+                                              VARIANT_PK_CACHE_DTYPES | {
+                                                  "LABEL_SOURCE": "category",
+                                                  "BINARY_LABEL": "int8"}))
 
 VARIANT_EFFECT_SCORE_PK_COLUMNS = VARIANT_PK_COLUMNS + ["SCORE_SOURCE"]
 VARIANT_EFFECT_SCORE_NON_PK_COLUMNS = [
@@ -87,7 +207,19 @@ VARIANT_EFFECT_SCORE_NON_PK_COLUMNS = [
 VARIANT_EFFECT_SCORE_TABLE_DEF = TableDef(DATA_FOLDER,
                                           "variant_effect_score.csv",
                                           VARIANT_EFFECT_SCORE_PK_COLUMNS,
-                                          VARIANT_EFFECT_SCORE_NON_PK_COLUMNS)
+                                          VARIANT_EFFECT_SCORE_NON_PK_COLUMNS,
+                                          VARIANT_PK_DTYPES | {
+                                              "SCORE_SOURCE": "str",
+                                              "RAW_SCORE": "float64",
+                                              "RANK_SCORE": "float64"},
+                                          sort_columns=[
+                                              "SCORE_SOURCE"] +
+                                          VARIANT_PK_COLUMNS,
+                                          cache_dtypes=(
+                                              VARIANT_PK_CACHE_DTYPES | {
+                                                  "SCORE_SOURCE": "category",
+                                                  "RAW_SCORE": "float32",
+                                                  "RANK_SCORE": "float32"}))
 
 VARIANT_TASK_TABLE_DEF = TableDef(DATA_FOLDER,
                                   "variant_task.csv",
@@ -107,22 +239,30 @@ VARIANT_FILTER_TABLE_DEF =\
     TableDef(DATA_FOLDER,
              "variant_filter.csv", ["CODE"],
              ["NAME", "DESCRIPTION", "INCLUDE_GENES",
-              "INCLUDE_VARIANTS"])
+              "INCLUDE_VARIANTS"],
+             {"CODE": "str", "NAME": "str", "INCLUDE_GENES": "str",
+              "INCLUDE_VARIANTS": "str"})
 
 VARIANT_FILTER_GENE_TABLE_DEF =\
     TableDef(DATA_FOLDER,
              "variant_filter_gene.csv", ["FILTER_CODE", "GENE_SYMBOL"],
-             [])
+             [], {"FILTER_CODE": "str", "GENE_SYMBOL": "str"},
+             cache_dtypes={"FILTER_CODE": "category",
+                           "GENE_SYMBOL": "category"})
 
 VARIANT_FILTER_VARIANT_TABLE_DEF =\
     TableDef(DATA_FOLDER,
              "variant_filter_variant.csv",
-             ["FILTER_CODE"] + VARIANT_PK_COLUMNS, [])
+             ["FILTER_CODE"] + VARIANT_PK_COLUMNS, [],
+             {"FILTER_CODE": "str"} | VARIANT_PK_DTYPES,
+             cache_dtypes={"FILTER_CODE": "category"} |
+             VARIANT_PK_CACHE_DTYPES)
 
 TABLE_DEFS = {
     "VARIANT_TASK": VARIANT_TASK_TABLE_DEF,
     "VARIANT_EFFECT_SOURCE": VARIANT_EFFECT_SOURCE_TABLE_DEF,
     "VARIANT": VARIANT_TABLE_DEF,
+    "VARIANT_KEY": VARIANT_KEY_TABLE_DEF,
     "VARIANT_EFFECT_LABEL": VARIANT_EFFECT_LABEL_TABLE_DEF,
     "VARIANT_DATA_SOURCE": VARIANT_DATA_SOURCE_TABLE_DEF,
     "VARIANT_EFFECT_SCORE": VARIANT_EFFECT_SCORE_TABLE_DEF,
@@ -132,17 +272,75 @@ TABLE_DEFS = {
 }
 
 
+TASK_TABLE_NAMES = [
+    "VARIANT_EFFECT_LABEL",
+    "VARIANT_EFFECT_SCORE",
+    "VARIANT_FILTER",
+    "VARIANT_FILTER_GENE",
+    "VARIANT_FILTER_VARIANT"
+]
+
+
 class RepoSessionContext:
 
     def __init__(self, data_folder_root: str,
-                 table_defs: dict[str, TableDef]):
-        self._data_folder_root = data_folder_root
+                 table_defs: dict[str, TableDef],
+                 file_format: str = None, memory_map: bool = False,
+                 cache_max_bytes: int = None):
+        """
+        Parameters
+        ----------
+        data_folder_root : str
+            Root directory of the repository. The repository "data"
+            directory is a subdirectory off of this directory.
+        table_defs : dict[str, TableDef]
+            Table definitions keyed by table name.
+        file_format : str, optional
+            If specified overrides the file format of every table
+            definition, i.e. csv, parquet, arrow.
+        memory_map : bool, optional
+            If True the caches hold read only memory maps of the
+            tables rather than reading them into memory, so that
+            processes on the same host share a single copy. The maps
+            are materialized under MAPPED_CACHE_FOLDER the first time
+            a table is loaded and rebuilt when the table file changes.
+        cache_max_bytes : int, optional
+            If specified the least recently used task tables are
+            evicted from the caches when the memory they use exceeds
+            this number of bytes. See TaskCacheBudget. Only the first
+            context of a repository to create its caches sets it.
+        """
+        self._data_folder_root = os.path.expanduser(data_folder_root)
+        self._file_format = file_format
+        self._memory_map = memory_map
+        self._cache_max_bytes = cache_max_bytes
+        if file_format is not None:
+            table_defs = {name: replace(table_def, file_format=file_format)
+                          for name, table_def in table_defs.items()}
         self._table_defs = table_defs
 
     @property
     def data_folder_root(self):
         return self._data_folder_root
 
+    @property
+    def memory_map(self) -> bool:
+        return self._memory_map
+
+    @property
+    def cache_max_bytes(self) -> int:
+        return self._cache_max_bytes
+
+    @property
+    def cache_key(self) -> tuple:
+        """
+        Identifies the repository, and the form of it, that the caches
+        created with this context hold. Contexts with the same key
+        share the same caches.
+        """
+        return (os.path.abspath(self._data_folder_root), self._file_format,
+                self._memory_map)
+
     def table_def(self, table_name: str):
         return self._table_defs[table_name]
 
@@ -156,80 +354,837 @@ class RepoSessionContext:
                                 DATA_FOLDER,
                                 self._table_defs[table_name].file_name)
 
+    def mapped_table_folder(self, table_name: str, task: str = None) -> str:
+        """
+        Returns the directory holding the memory mapped copy of a table.
+        """
+        return os.path.join(self._data_folder_root, MAPPED_CACHE_FOLDER,
+                            task or "", table_name)
+
+    def snapshot_folder(self, task: str) -> str:
+        """
+        Returns the directory holding the analysis snapshots of a task.
+        """
+        return os.path.join(self._data_folder_root, SNAPSHOT_FOLDER, task)
+
+    def read_table(self, table_name: str, task: str = None,
+                   columns: list[str] = None,
+                   predicates: list[tuple] = None) -> pd.DataFrame:
+        """
+        Read a repository table into a dataframe using the storage
+        backend of its table definition. See TableStorage.read for a
+        description of columns and predicates.
+        """
+        table_def = self._table_defs[table_name]
+        return table_def.storage.read(self.table_file(table_name, task),
+                                      columns, table_def.dtypes,
+                                      predicates)
+
+    def table_columns(self, table_name: str, task: str = None) -> list[str]:
+        """
+        Returns the names of the columns stored in a table file.
+        """
+        return self._table_defs[table_name].storage.columns(
+            self.table_file(table_name, task))
+
+    def table_exists(self, table_name: str, task: str = None) -> bool:
+        return os.path.exists(self.table_file(table_name, task))
+
+    def write_table(self, data_frame: pd.DataFrame, table_name: str,
+                    task: str = None):
+        table_def = self._table_defs[table_name]
+        if table_def.sort_columns is not None:
+            data_frame = data_frame.sort_values(table_def.sort_columns,
+                                                ignore_index=True)
+        table_def.storage.write(data_frame,
+                                self.table_file(table_name, task),
+                                table_def.dtypes)
+
 
-class VariantEffectLabelCache(ParameterizedSingleton):
+def convert_repository(data_folder_root: str, file_format: str,
+                       table_defs: dict[str, TableDef] = TABLE_DEFS):
     """
-    Caches the variant csv file in a dataframe. Implements the singleton
-    pattern to ensure there is only one instance of the cached dataframe.
-    We use an _init_once method rather than the normal __init__ method
-    as required by the ParameterizedSingleton class.
+    One time conversion of the repository tables from the file format
+    of table_defs, typically csv, into file_format. The converted
+    files are written alongside the original files. Tasks are taken
+    from the VARIANT_TASK table.
+
+    The variant key dictionary is persisted as the VARIANT_KEY table
+    and the VARIANT_ID of each row is stored in every table keyed by a
+    variant. Ids already present in an existing VARIANT_KEY table are
+    preserved and new variants are appended to it.
+
+    Parameters
+    ----------
+    data_folder_root : str
+        Root directory of the repository.
+    file_format : str
+        Target file format, i.e. csv, parquet, arrow.
+    table_defs : dict[str, TableDef], optional
+        Table definitions describing the existing files.
+    """
+    source_context = RepoSessionContext(data_folder_root, table_defs)
+    target_context = RepoSessionContext(data_folder_root, table_defs,
+                                        file_format)
+    variant_df = source_context.read_table("VARIANT")
+    key_index = load_variant_key_index(source_context).extend(variant_df)
+    target_context.write_table(key_index.to_data_frame(), "VARIANT_KEY")
+
+    def convert_table(table_name: str, task_code: str = None):
+        if not source_context.table_exists(table_name, task_code):
+            return
+        data_frame = source_context.read_table(table_name, task_code)
+        if table_defs[table_name].variant_keyed:
+            data_frame = key_index.assign(data_frame)
+        target_context.write_table(data_frame, table_name, task_code)
+
+    task_codes = source_context.read_table("VARIANT_TASK")["CODE"]
+    for table_name in table_defs:
+        if table_name == "VARIANT_KEY":
+            continue
+        if table_name in TASK_TABLE_NAMES:
+            for task_code in task_codes:
+                convert_table(table_name, task_code)
+        else:
+            convert_table(table_name)
+
+
+class VariantKeyIndex:
+    """
+    Dictionary that maps the 5 column variant primary key to a compact
+    int64 VARIANT_ID. Variants that are not in the dictionary map to -1.
+    """
+
+    def __init__(self, key_df: pd.DataFrame):
+        """
+        Parameters
+        ----------
+        key_df : DataFrame
+            Dataframe with VARIANT_PK_COLUMNS and VARIANT_ID columns.
+        """
+        key_df = key_df.drop_duplicates(VARIANT_PK_COLUMNS)
+        self._pk_index = pd.MultiIndex.from_frame(key_df[VARIANT_PK_COLUMNS])
+        self._ids = key_df[VARIANT_KEY_COLUMN].to_numpy(np.int64)
+
+    @property
+    def size(self) -> int:
+        """
+        Number of ids in the key space, i.e. one more than the largest
+        VARIANT_ID.
+        """
+        return int(self._ids.max()) + 1 if len(self._ids) > 0 else 0
+
+    def lookup(self, data_frame: pd.DataFrame,
+               column_name_map: dict = None) -> np.ndarray:
+        """
+        Returns the VARIANT_ID of each row of data_frame, -1 for
+        variants not in the dictionary.
+
+        Parameters
+        ----------
+        data_frame : DataFrame
+            Dataframe containing the VARIANT_PK_COLUMNS.
+        column_name_map : dict, optional
+            Maps the VARIANT_PK_COLUMNS to the names of the
+            corresponding columns in data_frame.
+        """
+        pk_columns = VARIANT_PK_COLUMNS if column_name_map is None else \
+            [column_name_map[column] for column in VARIANT_PK_COLUMNS]
+        if len(data_frame) == 0:
+            return np.empty(0, dtype=np.int64)
+        positions = self._pk_index.get_indexer(
+            pd.MultiIndex.from_frame(data_frame[pk_columns]))
+        return np.where(positions >= 0, self._ids[positions], -1)
+
+    def assign(self, data_frame: pd.DataFrame,
+               column_name_map: dict = None) -> pd.DataFrame:
+        """
+        Returns a copy of data_frame with a VARIANT_ID column.
+        """
+        return data_frame.assign(**{VARIANT_KEY_COLUMN: self.lookup(
+            data_frame, column_name_map)})
+
+    def ids(self, variant_ids: pd.DataFrame,
+            column_name_map: dict = None) -> np.ndarray:
+        """
+        Returns the VARIANT_ID's of a dataframe of variant ids. A
+        VARIANT_ID column already present is used as is.
+        """
+        if VARIANT_KEY_COLUMN in variant_ids.columns and \
+                column_name_map is None:
+            return variant_ids[VARIANT_KEY_COLUMN].to_numpy(np.int64)
+        return self.lookup(variant_ids, column_name_map)
+
+    def filter(self, data_frame: pd.DataFrame, variant_ids: pd.DataFrame,
+               column_name_map: dict = None,
+               in_list: bool = True) -> pd.DataFrame:
+        """
+        Equivalent of filter_dataframe_by_list on the VARIANT_PK_COLUMNS
+        evaluated as a set filter on the VARIANT_ID column of data_frame.
+        """
+        mask = data_frame[VARIANT_KEY_COLUMN].isin(
+            self.ids(variant_ids, column_name_map))
+        return data_frame[mask if in_list else ~mask].reset_index(drop=True)
+
+    def extend(self, variant_df: pd.DataFrame) -> "VariantKeyIndex":
+        """
+        Returns a new index that also contains the variants in
+        variant_df missing from this one, with newly assigned ids.
+        """
+        new_df = variant_df.loc[self.lookup(variant_df) < 0,
+                                VARIANT_PK_COLUMNS].drop_duplicates()
+        new_df = new_df.assign(**{VARIANT_KEY_COLUMN: np.arange(
+            self.size, self.size + len(new_df), dtype=np.int64)})
+        return VariantKeyIndex(pd.concat([self.to_data_frame(), new_df],
+                                         ignore_index=True))
+
+    def to_data_frame(self) -> pd.DataFrame:
+        return self._pk_index.to_frame(index=False).assign(
+            **{VARIANT_KEY_COLUMN: self._ids})
+
+
+class GeneIndex:
+    """
+    Inverted index of the rows of a table by GENE_SYMBOL. The row
+    positions are grouped by gene so that the rows of a set of genes
+    are found by concatenating their ranges rather than by comparing
+    the gene of every row.
+    """
+
+    def __init__(self, gene_symbols):
+        """
+        Parameters
+        ----------
+        gene_symbols : array like
+            GENE_SYMBOL of each row of the table, possibly missing
+        """
+        codes, genes = pd.factorize(np.asarray(gene_symbols, dtype=object))
+        self._genes = pd.Index(genes)
+        self._num_rows = len(codes)
+        # Rows without a gene, code -1, sort first and are not part of
+        # the range of any gene
+        self._rows = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(genes))
+        self._ends = np.count_nonzero(codes < 0) + np.cumsum(counts)
+        self._starts = self._ends - counts
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def rows(self, gene_symbols: list[str],
+             include: bool = True) -> np.ndarray:
+        """
+        Returns the ascending positions of the rows of the genes in
+        gene_symbols or, if include is False, of all other rows,
+        including those without a gene.
+        """
+        codes = self._genes.get_indexer(pd.unique(np.asarray(
+            gene_symbols, dtype=object)))
+        codes = codes[codes >= 0]
+        rows = np.sort(self._rows[concatenate_ranges(self._starts[codes],
+                                                     self._ends[codes])])
+        if include:
+            return rows
+        excluded = np.ones(self._num_rows, dtype=bool)
+        excluded[rows] = False
+        return np.flatnonzero(excluded)
+
+
+class AlleleFrequencyIndex:
+    """
+    Index of the rows of the variant table by ALLELE_FREQUENCY. The
+    rows are sorted by allele frequency source and, within a source, by
+    allele frequency so that the rows in a range of allele frequencies
+    are found with two binary searches per source. Rows without an
+    allele frequency are not indexed.
+    """
+
+    def __init__(self, variant_df: pd.DataFrame):
+        """
+        Parameters
+        ----------
+        variant_df : DataFrame
+            Dataframe with ALLELE_FREQUENCY and ALLELE_FREQUENCY_SOURCE
+            columns
+        """
+        codes, sources = pd.factorize(np.asarray(
+            variant_df["ALLELE_FREQUENCY_SOURCE"], dtype=object))
+        self._sources = pd.Index(sources)
+        # Segment 0 holds the rows without a source
+        segments = codes + 1
+        frequencies = variant_df["ALLELE_FREQUENCY"].to_numpy(
+            np.float64, na_value=np.nan)
+        rows = np.flatnonzero(~np.isnan(frequencies))
+        self._rows = rows[np.lexsort((frequencies[rows], segments[rows]))]
+        self._frequencies = frequencies[self._rows]
+        counts = np.bincount(segments[self._rows],
+                             minlength=len(sources) + 1)
+        self._ends = np.cumsum(counts)
+        self._starts = self._ends - counts
+
+    def rows(self, minimum: float = None, maximum: float = None,
+             minimum_inclusive: bool = True, maximum_inclusive: bool = True,
+             sources: list[str] = None) -> np.ndarray:
+        """
+        Returns the ascending positions of the rows whose allele
+        frequency is in the range from minimum to maximum and, if
+        sources is specified, comes from one of sources. A missing
+        bound leaves the range open on that side.
+        """
+        if sources is None:
+            segments = np.arange(len(self._starts))
+        else:
+            segments = self._sources.get_indexer(pd.unique(np.asarray(
+                sources, dtype=object)))
+            segments = segments[segments >= 0] + 1
+        starts = self._starts[segments]
+        ends = self._ends[segments]
+        # Sources are few so each is searched in turn
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            frequencies = self._frequencies[start:end]
+            if minimum is not None:
+                starts[i] = start + np.searchsorted(
+                    frequencies, minimum,
+                    side="left" if minimum_inclusive else "right")
+            if maximum is not None:
+                ends[i] = start + np.searchsorted(
+                    frequencies, maximum,
+                    side="right" if maximum_inclusive else "left")
+        return np.sort(self._rows[concatenate_ranges(starts, ends)])
+
+
+def load_variant_key_index(
+        session_context: RepoSessionContext) -> VariantKeyIndex:
     """
+    Loads the persisted VARIANT_KEY table. If the repository does not
+    have one, the ids are taken from the VARIANT_ID column of the
+    VARIANT table or, failing that, from the row order of the VARIANT
+    table.
+    """
+    if session_context.table_exists("VARIANT_KEY"):
+        return VariantKeyIndex(session_context.read_table("VARIANT_KEY"))
+    if VARIANT_KEY_COLUMN in session_context.table_columns("VARIANT"):
+        return VariantKeyIndex(session_context.read_table(
+            "VARIANT", columns=VARIANT_PK_COLUMNS + [VARIANT_KEY_COLUMN]))
+    key_df = session_context.read_table("VARIANT",
+                                        columns=VARIANT_PK_COLUMNS)
+    return VariantKeyIndex(key_df.assign(**{
+        VARIANT_KEY_COLUMN: np.arange(len(key_df), dtype=np.int64)}))
+
+
+def variant_key_source_files(
+        session_context: RepoSessionContext) -> list[str]:
+    """
+    Returns the files the VariantKeyIndex is loaded from. See
+    load_variant_key_index.
+    """
+    if session_context.table_exists("VARIANT_KEY"):
+        return [session_context.table_file("VARIANT_KEY")]
+    return [session_context.table_file("VARIANT")]
 
-    def _init_once(self, data_folder_root: str):
-        self._data_folder_root = data_folder_root
+
+def table_source_files(session_context: RepoSessionContext,
+                       table_name: str, task: str = None) -> list[str]:
+    """
+    Returns the files the cached copy of a table is derived from, i.e.
+    the table file and, if the table does not store its VARIANT_IDs
+    but is assigned them from the VariantKeyIndex, the files of the
+    index.
+    """
+    source_files = [session_context.table_file(table_name, task)]
+    if (session_context.table_def(table_name).variant_keyed and
+            VARIANT_KEY_COLUMN not in session_context.table_columns(
+                table_name, task)):
+        source_files.extend(variant_key_source_files(session_context))
+    return source_files
+
+
+def task_source_files(session_context: RepoSessionContext,
+                      task_code: str) -> list[str]:
+    """
+    Returns the files an analysis of a task is derived from, i.e. the
+    source files of the task tables and of the variant and variant
+    effect source tables.
+    """
+    tables = [("VARIANT", None), ("VARIANT_EFFECT_SOURCE", None)] + \
+        [(table_name, task_code) for table_name in TASK_TABLE_NAMES
+         if session_context.table_exists(table_name, task_code)]
+    source_files = []
+    for table_name, task in tables:
+        source_files.extend(
+            file_name for file_name in table_source_files(
+                session_context, table_name, task)
+            if file_name not in source_files)
+    return source_files
+
+
+@dataclass
+class CacheEntry:
+    """
+    Data held by a cache together with the files it was loaded from
+    and their stats at the time, see storage.file_stats. The stats
+    identify the version of the repository files the data reflects.
+    """
+    data: object
+    source_files: list[str]
+    source_stats: list[dict]
+    # Indexes and other data derived from data, by name. Discarded with
+    # the entry when the data is reloaded.
+    derived: dict = field(default_factory=dict)
+
+    def derived_data(self, name: str, build, version=None):
+        """
+        Returns the data derived from data under name, calling
+        build(data) to derive it on first access. version identifies
+        the version of any other data the derived data depends on. It
+        is derived again if the version is different.
+        """
+        derived = self.derived.get(name)
+        if derived is None or derived[0] != version:
+            derived = (version, build(self.data))
+            self.derived[name] = derived
+        return derived[1]
+
+    def is_current(self) -> bool:
+        """
+        True if none of the source files has changed since the data
+        was loaded.
+        """
+        try:
+            return file_stats(self.source_files) == self.source_stats
+        except OSError:
+            return False
+
+
+def load_cache_entry(session_context: RepoSessionContext,
+                     source_files: list[str], load) -> CacheEntry:
+    """
+    Calls load to load the data derived from source_files and returns
+    it in a CacheEntry. The stats are taken before loading so that a
+    file modified while it is being read is reloaded on next access.
+    """
+    source_stats = file_stats(source_files)
+    return CacheEntry(load(), source_files, source_stats)
+
+
+class SessionCache(ParameterizedSingleton):
+    """
+    Base class of the repository caches. There is one instance of a
+    cache per repository, identified by the cache_key of the session
+    context, rather than a single instance, so that contexts for
+    different root directories or file formats never share data.
+    """
+
+    @classmethod
+    def _instance_key(cls, session_context: RepoSessionContext,
+                      *args, **kwargs):
+        return session_context.cache_key
+
+    @property
+    def cache_key(self) -> tuple:
+        return self._session_context.cache_key
+
+
+class VariantKeyCache(SessionCache):
+    """
+    Caches the VariantKeyIndex of the repository. The index is reloaded
+    if its source file changes.
+    """
+
+    def _init_once(self, session_context: RepoSessionContext):
+        self._session_context = session_context
         self._lock = threading.Lock()
-        self._cache = dict()
+        self._entry = None
 
-    def get_data_frame(self, task_code: str):
-        if task_code not in self._cache:
+    @property
+    def index(self) -> VariantKeyIndex:
+        entry = self._entry
+        if entry is None or not entry.is_current():
             with self._lock:
-                if task_code not in self._cache:
-                    self._cache[task_code] = pd.read_csv(
-                        os.path.join(self._data_folder_root, DATA_FOLDER,
-                                     task_code,
-                                     VARIANT_EFFECT_LABEL_TABLE_DEF.file_name))
-        return self._cache[task_code]
+                entry = self._entry
+                if entry is None or not entry.is_current():
+                    entry = load_cache_entry(
+                        self._session_context,
+                        variant_key_source_files(self._session_context),
+                        lambda: load_variant_key_index(
+                            self._session_context))
+                    self._entry = entry
+        return entry.data
+
+    def invalidate(self):
+        self._entry = None
 
 
-class DataCache(ParameterizedSingleton):
+class VariantRegionCache(SessionCache):
     """
-    Caches a repository csv file in a dataframe. Implements the singleton
-    pattern to ensure there is only one instance of the cached dataframe.
-    We use an _init_once method rather than the normal __init__ method
-    as required by the ParameterizedSingleton class.
+    Caches the RegionIndex of the variants of the repository. The index
+    is rebuilt if the VARIANT table changes.
     """
 
-    def _init_once(self, data_folder_root: str, table_def: TableDef):
-        self._data_folder_root = data_folder_root
-        self._table_def = table_def
+    def _init_once(self, session_context: RepoSessionContext):
+        self._session_context = session_context
         self._lock = threading.Lock()
-        self._data_frame = None
+        self._entry = None
 
     @property
-    def data_frame(self):
-        if self._data_frame is None:
+    def index(self) -> RegionIndex:
+        entry = self._entry
+        if entry is None or not entry.is_current():
             with self._lock:
-                if self._data_frame is None:
-                    self._data_frame = pd.read_csv(
-                        os.path.join(self._data_folder_root,
-                                     self._table_def.full_file_name))
-        return self._data_frame
+                entry = self._entry
+                if entry is None or not entry.is_current():
+                    entry = load_cache_entry(
+                        self._session_context,
+                        table_source_files(self._session_context, "VARIANT"),
+                        lambda: RegionIndex(read_keyed_table(
+                            self._session_context, "VARIANT",
+                            columns=["CHROMOSOME", "POSITION",
+                                     VARIANT_KEY_COLUMN])))
+                    self._entry = entry
+        return entry.data
+
+    def invalidate(self):
+        self._entry = None
+
+
+def read_keyed_table(session_context: RepoSessionContext, table_name: str,
+                     task: str = None, columns: list[str] = None,
+                     predicates: list[tuple] = None) -> pd.DataFrame:
+    """
+    Reads a repository table. If the table is keyed by a variant but
+    its file does not store the VARIANT_ID, the ids are assigned from
+    the VariantKeyIndex.
+    """
+    if (not session_context.table_def(table_name).variant_keyed or
+            VARIANT_KEY_COLUMN in session_context.table_columns(
+                table_name, task)):
+        return session_context.read_table(table_name, task, columns,
+                                          predicates)
+    read_columns = None
+    if columns is not None:
+        read_columns = [column for column in columns
+                        if column != VARIANT_KEY_COLUMN] + \
+            [column for column in VARIANT_PK_COLUMNS if column not in columns]
+    data_frame = VariantKeyCache(session_context).index.assign(
+        session_context.read_table(table_name, task, read_columns,
+                                   predicates))
+    return data_frame if columns is None else data_frame[columns]
+
+
+def read_cached_table(session_context: RepoSessionContext, table_name: str,
+                      task: str = None, columns: list[str] = None,
+                      predicates: list[tuple] = None) -> pd.DataFrame:
+    """
+    Reads a repository table as it is held by the caches, i.e. keyed
+    by VARIANT_ID if applicable and converted to the compact
+    cache_dtypes of its TableDef. If the session context has memory_map
+    set the table is returned from its memory mapped copy.
+    """
+    if session_context.memory_map:
+        return _project_and_filter(
+            _read_mapped_table(session_context, table_name, task),
+            columns, predicates)
+    return session_context.table_def(table_name).compact(
+        read_keyed_table(session_context, table_name, task, columns,
+                         predicates))
+
+
+def _read_mapped_table(session_context: RepoSessionContext,
+                       table_name: str, task: str = None) -> pd.DataFrame:
+    folder = session_context.mapped_table_folder(table_name, task)
+    source_files = table_source_files(session_context, table_name, task)
+    if not is_current(folder, source_files):
+        write_mapped_table(
+            session_context.table_def(table_name).compact(
+                read_keyed_table(session_context, table_name, task)),
+            folder, source_files)
+    return read_mapped_table(folder)
+
+
+def memory_usage(data_frame: pd.DataFrame) -> int:
+    """
+    Returns the number of bytes used by data_frame including the
+    memory held by its string and categorical columns. data_frame may
+    also be a ScoreMatrix.
+    """
+    if isinstance(data_frame, ScoreMatrix):
+        return data_frame.nbytes
+    return int(data_frame.memory_usage(index=True, deep=True).sum())
+
+
+def _project_and_filter(data_frame: pd.DataFrame, columns: list[str],
+                        predicates: list[tuple]) -> pd.DataFrame:
+    if predicates:
+        data_frame = filter_dataframe_by_predicates(data_frame, predicates)
+    if columns is not None:
+        data_frame = data_frame[columns]
+    return data_frame
 
 
-class TaskBasedDataCache(ParameterizedSingleton):
+class DataCache(SessionCache):
     """
-    Caches a repository csv file in a dataframe. Maintains a separate
+    Caches a repository table in a dataframe. Implements the singleton
+    pattern to ensure there is only one instance of the cached dataframe
+    per repository. We use an _init_once method rather than the normal
+    __init__ method as required by the ParameterizedSingleton class.
+    The table is reloaded when its file changes.
+    """
+
+    def _init_once(self, session_context: RepoSessionContext,
+                   table_name: str):
+        self._session_context = session_context
+        self._table_name = table_name
+        self._lock = threading.Lock()
+        self._entry = None
+
+    def _current_entry(self) -> CacheEntry:
+        entry = self._entry
+        if entry is None or not entry.is_current():
+            with self._lock:
+                entry = self._entry
+                if entry is None or not entry.is_current():
+                    entry = load_cache_entry(
+                        self._session_context,
+                        table_source_files(self._session_context,
+                                           self._table_name),
+                        lambda: read_cached_table(self._session_context,
+                                                  self._table_name))
+                    self._entry = entry
+        return entry
+
+    @property
+    def data_frame(self):
+        return self._current_entry().data
+
+    @property
+    def version(self) -> list[dict]:
+        """
+        Stats of the files the cached dataframe was loaded from.
+        """
+        return self._current_entry().source_stats
+
+    def reads_storage(self, columns: list[str] = None,
+                      predicates: list[tuple] = None) -> bool:
+        """
+        True if get_data_frame would read the rows from storage rather
+        than from the cached dataframe.
+        """
+        return (self._entry is None and
+                (columns is not None or bool(predicates)) and
+                self._session_context.table_def(
+                    self._table_name).storage.supports_pushdown)
+
+    def get_data_frame(self, columns: list[str] = None,
+                       predicates: list[tuple] = None) -> pd.DataFrame:
+        """
+        Returns the rows of the table satisfying predicates projected
+        onto columns. If the table has not been cached and its storage
+        supports pushdown, only the qualifying rows and columns are read
+        and nothing is cached.
+        """
+        if self.reads_storage(columns, predicates):
+            return read_cached_table(self._session_context, self._table_name,
+                                     columns=columns, predicates=predicates)
+        return _project_and_filter(self.data_frame, columns, predicates)
+
+    def indexed(self, name: str, build,
+                version=None) -> tuple[pd.DataFrame, object]:
+        """
+        Returns the cached dataframe together with an index of it
+        derived by build(data_frame). See CacheEntry.derived_data.
+        """
+        entry = self._current_entry()
+        return entry.data, entry.derived_data(name, build, version)
+
+    def invalidate(self):
+        """
+        Discards the cached dataframe. It is reloaded on next access.
+        """
+        self._entry = None
+
+    def reload(self):
+        """
+        Reloads the cached dataframe from the repository.
+        """
+        self.invalidate()
+        self._current_entry()
+
+    def memory_report(self) -> list[dict]:
+        """
+        Returns the size of the cached dataframe, if it has been
+        loaded, as a list of dicts with the MEMORY_REPORT_COLUMNS.
+        """
+        entry = self._entry
+        if entry is None:
+            return []
+        return [{"TABLE_NAME": self._table_name, "TASK_CODE": None,
+                 "NUM_ROWS": len(entry.data),
+                 "MEMORY_BYTES": memory_usage(entry.data)}]
+
+
+class TaskCacheBudget(SessionCache):
+    """
+    Limits the memory used by the task dataframes held by the
+    TaskBasedDataCaches of a repository to the cache_max_bytes of the
+    session context. When a task dataframe is loaded and the total size
+    exceeds the limit the least recently used task dataframes, of any
+    table, are evicted. They are reloaded if accessed again.
+    """
+
+    def _init_once(self, session_context: RepoSessionContext):
+        self._session_context = session_context
+        self._max_bytes = session_context.cache_max_bytes
+        self._lock = threading.Lock()
+        # (cache, task_code) -> bytes in least to most recently used order
+        self._entries = OrderedDict()
+
+    def touch(self, cache, task_code: str):
+        if self._max_bytes is None:
+            return
+        with self._lock:
+            if (cache, task_code) in self._entries:
+                self._entries.move_to_end((cache, task_code))
+
+    def add(self, cache, task_code: str, data_frame: pd.DataFrame):
+        if self._max_bytes is None:
+            return
+        evicted = []
+        with self._lock:
+            self._entries[(cache, task_code)] = memory_usage(data_frame)
+            self._entries.move_to_end((cache, task_code))
+            total_bytes = sum(self._entries.values())
+            # The dataframe just added is never evicted even if it
+            # exceeds the limit by itself.
+            while total_bytes > self._max_bytes and len(self._entries) > 1:
+                key, num_bytes = self._entries.popitem(last=False)
+                evicted.append(key)
+                total_bytes -= num_bytes
+        for evicted_cache, evicted_task_code in evicted:
+            evicted_cache.evict(evicted_task_code)
+
+    def remove(self, cache, task_code: str):
+        with self._lock:
+            self._entries.pop((cache, task_code), None)
+
+
+class TaskBasedDataCache(SessionCache):
+    """
+    Caches a repository table in a dataframe. Maintains a separate
     cache for each task in a dict. Implements the singleton
-    pattern to ensure there is only one instance of the cached dataframe.
-    We use an _init_once method rather than the normal __init__ method
-    as required by the ParameterizedSingleton class.
+    pattern to ensure there is only one instance of the cached dataframe
+    per repository. We use an _init_once method rather than the normal
+    __init__ method as required by the ParameterizedSingleton class.
+    A task dataframe is reloaded when its file changes and may be
+    evicted by the TaskCacheBudget of the repository.
     """
 
-    def _init_once(self, data_folder_root: str, table_def: TableDef):
-        self._data_folder_root = data_folder_root
-        self._table_def = table_def
+    def _init_once(self, session_context: RepoSessionContext,
+                   table_name: str):
+        self._session_context = session_context
+        self._table_name = table_name
         self._cache = dict()
         self._lock = threading.Lock()
+        self._budget = TaskCacheBudget(session_context)
+
+    def _current_entry(self, task_code: str) -> CacheEntry:
+        entry = self._cache.get(task_code)
+        if entry is not None and entry.is_current():
+            self._budget.touch(self, task_code)
+            return entry
+        with self._lock:
+            entry = self._cache.get(task_code)
+            loaded = entry is None or not entry.is_current()
+            if loaded:
+                entry = load_cache_entry(
+                    self._session_context, self._source_files(task_code),
+                    lambda: self._load(task_code))
+                self._cache[task_code] = entry
+        if loaded:
+            self._budget.add(self, task_code, entry.data)
+        return entry
+
+    def _source_files(self, task_code: str) -> list[str]:
+        return table_source_files(self._session_context, self._table_name,
+                                  task_code)
+
+    def _load(self, task_code: str):
+        return read_cached_table(self._session_context, self._table_name,
+                                 task_code)
+
+    def get_data_frame(self, task_code: str, columns: list[str] = None,
+                       predicates: list[tuple] = None) -> pd.DataFrame:
+        """
+        Returns the rows of the task table satisfying predicates projected
+        onto columns. If the task table has not been cached and its
+        storage supports pushdown, only the qualifying rows and columns
+        are read and nothing is cached.
+        """
+        if self.reads_storage(task_code, columns, predicates):
+            return read_cached_table(self._session_context, self._table_name,
+                                     task_code, columns, predicates)
+        return _project_and_filter(self._current_entry(task_code).data,
+                                   columns, predicates)
+
+    def reads_storage(self, task_code: str, columns: list[str] = None,
+                      predicates: list[tuple] = None) -> bool:
+        """
+        True if get_data_frame would read the rows from storage rather
+        than from the cached task dataframe.
+        """
+        return (task_code not in self._cache and
+                (columns is not None or bool(predicates)) and
+                self._session_context.table_def(
+                    self._table_name).storage.supports_pushdown)
 
-    def get_data_frame(self, task_code: str):
-        if task_code not in self._cache:
-            with self._lock:
-                if task_code not in self._cache:
-                    self._cache[task_code] = pd.read_csv(
-                        os.path.join(self._data_folder_root, DATA_FOLDER,
-                                     task_code,
-                                     self._table_def.file_name))
-        return self._cache[task_code]
+    def version(self, task_code: str) -> list[dict]:
+        """
+        Stats of the files the task dataframe was loaded from.
+        """
+        return self._current_entry(task_code).source_stats
+
+    def evict(self, task_code: str):
+        self._cache.pop(task_code, None)
+
+    def invalidate(self, task_code: str = None):
+        """
+        Discards the dataframe cached for task_code or, if not
+        specified, for all tasks. They are reloaded on next access.
+        """
+        task_codes = [task_code] if task_code else list(self._cache)
+        for code in task_codes:
+            self.evict(code)
+            self._budget.remove(self, code)
+
+    def reload(self, task_code: str = None):
+        """
+        Reloads the dataframe cached for task_code or, if not
+        specified, for all cached tasks.
+        """
+        task_codes = [task_code] if task_code else list(self._cache)
+        for code in task_codes:
+            self.invalidate(code)
+            self._current_entry(code)
+
+    def memory_report(self) -> list[dict]:
+        """
+        Returns the size of each cached task dataframe as a list of
+        dicts with the MEMORY_REPORT_COLUMNS.
+        """
+        return [{"TABLE_NAME": self._table_name, "TASK_CODE": task_code,
+                 "NUM_ROWS": len(entry.data),
+                 "MEMORY_BYTES": memory_usage(entry.data)}
+                for task_code, entry in list(self._cache.items())]
+
+
+class VariantEffectLabelCache(TaskBasedDataCache):
+    """
+    Caches the variant effect label table in a dataframe. Implements the
+    singleton pattern to ensure there is only one instance of the cached
+    dataframe.
+    """
+
+    def _init_once(self, session_context: RepoSessionContext):
+        super()._init_once(session_context, "VARIANT_EFFECT_LABEL")
 
 
 class TaskDataCache(DataCache):
@@ -240,8 +1195,8 @@ class TaskDataCache(DataCache):
     as required by the ParameterizedSingleton class.
     """
 
-    def _init_once(self, data_folder_root: str):
-        super()._init_once(data_folder_root, VARIANT_TASK_TABLE_DEF)
+    def _init_once(self, session_context: RepoSessionContext):
+        super()._init_once(session_context, "VARIANT_TASK")
 
 
 class VariantEffectScoreCache(TaskBasedDataCache):
@@ -252,8 +1207,91 @@ class VariantEffectScoreCache(TaskBasedDataCache):
     as required by the ParameterizedSingleton class.
     """
 
-    def _init_once(self, data_folder_root: str):
-        super()._init_once(data_folder_root, VARIANT_EFFECT_SCORE_TABLE_DEF)
+    def _init_once(self, session_context: RepoSessionContext):
+        super()._init_once(session_context, "VARIANT_EFFECT_SCORE")
+
+
+@dataclass
+class ScoreMatrix:
+    """
+    Dense variants x sources matrix of the system variant effect scores
+    of a task. Only variants that have a label for the task and a score
+    from at least one source have a row. Missing scores are NaN.
+
+    Attributes
+    ----------
+    variant_ids : np.ndarray
+        VARIANT_ID of each row in ascending order
+    sources : np.ndarray
+        SCORE_SOURCE of each column in ascending order
+    scores : np.ndarray
+        float32 array of scores with one row per variant and one
+        column per source
+    """
+    variant_ids: np.ndarray
+    sources: np.ndarray
+    scores: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.variant_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.variant_ids.nbytes + self.sources.nbytes +
+                self.scores.nbytes)
+
+    def row_positions(self, variant_ids) -> np.ndarray:
+        """
+        Returns the positions, in ascending order, of the rows of the
+        distinct variants in variant_ids. Variants without a row are
+        ignored.
+        """
+        variant_ids = np.unique(np.asarray(variant_ids, dtype=np.int64))
+        positions = np.searchsorted(self.variant_ids, variant_ids)
+        found = positions < len(self.variant_ids)
+        found[found] = (self.variant_ids[positions[found]] ==
+                        variant_ids[found])
+        return positions[found]
+
+    def column_positions(self, variant_effect_sources: list[str] = None,
+                         include_variant_effect_sources: bool = True
+                         ) -> np.ndarray:
+        """
+        Returns the positions of the columns of the sources selected by
+        variant_effect_sources and include_variant_effect_sources, as
+        interpreted by VariantEffectScoreRepository.get.
+        """
+        if variant_effect_sources is None or \
+                len(variant_effect_sources) == 0:
+            return np.arange(len(self.sources))
+        selected = np.isin(self.sources,
+                           str_or_list_to_list(variant_effect_sources))
+        return np.flatnonzero(selected if include_variant_effect_sources
+                              else ~selected)
+
+
+def build_score_matrix(score_df: pd.DataFrame,
+                       label_df: pd.DataFrame) -> ScoreMatrix:
+    """
+    Builds the ScoreMatrix of the scores in score_df, which has
+    VARIANT_ID, SCORE_SOURCE and RANK_SCORE columns, of the variants
+    in label_df.
+    """
+    score_ids = score_df[VARIANT_KEY_COLUMN].to_numpy(np.int64)
+    labeled = np.isin(score_ids, label_df[VARIANT_KEY_COLUMN].to_numpy(
+        np.int64))
+    variant_ids, rows = np.unique(score_ids[labeled], return_inverse=True)
+    columns, sources = pd.factorize(
+        np.asarray(score_df["SCORE_SOURCE"], dtype=object)[labeled],
+        sort=True)
+    scores = np.full((len(variant_ids), len(sources)), np.nan,
+                     dtype=np.float32)
+    scores[rows, columns] = score_df["RANK_SCORE"].to_numpy(
+        np.float32)[labeled]
+    # The matrix is shared by all callers
+    scores.flags.writeable = False
+    return ScoreMatrix(variant_ids, np.asarray(sources, dtype=object),
+                       scores)
 
 
 class VariantCache(DataCache):
@@ -264,8 +1302,8 @@ class VariantCache(DataCache):
     as required by the ParameterizedSingleton class.
     """
 
-    def _init_once(self, data_folder_root: str):
-        super()._init_once(data_folder_root, VARIANT_TABLE_DEF)
+    def _init_once(self, session_context: RepoSessionContext):
+        super()._init_once(session_context, "VARIANT")
 
 
 class VariantTaskCache(DataCache):
@@ -276,59 +1314,237 @@ class VariantTaskCache(DataCache):
     as required by the ParameterizedSingleton class.
     """
 
-    def _init_once(self, data_folder_root: str):
-        super()._init_once(data_folder_root, VARIANT_TASK_TABLE_DEF)
+    def _init_once(self, session_context: RepoSessionContext):
+        super()._init_once(session_context, "VARIANT_TASK")
+
+
+class ScoreMatrixCache(SessionCache):
+    """
+    Caches the ScoreMatrix of each task. It is derived from the score
+    and label tables rather than being a table itself, so it is keyed
+    by task and by a fingerprint of the files of those tables and
+    rebuilt when the fingerprint changes. It is not part of the memory
+    report of the tables but counts against the TaskCacheBudget.
+    """
+
+    def _init_once(self, session_context: RepoSessionContext):
+        self._session_context = session_context
+        self._lock = threading.Lock()
+        self._budget = TaskCacheBudget(session_context)
+        # task_code -> (fingerprint, ScoreMatrix)
+        self._matrices = dict()
+
+    def _source_files(self, task_code: str) -> list[str]:
+        source_files = table_source_files(
+            self._session_context, "VARIANT_EFFECT_SCORE", task_code)
+        return source_files + [
+            file_name for file_name in table_source_files(
+                self._session_context, "VARIANT_EFFECT_LABEL", task_code)
+            if file_name not in source_files]
+
+    def _build(self, task_code: str) -> ScoreMatrix:
+        return build_score_matrix(
+            VariantEffectScoreCache(self._session_context).get_data_frame(
+                task_code,
+                [VARIANT_KEY_COLUMN, "SCORE_SOURCE", "RANK_SCORE"]),
+            VariantEffectLabelCache(self._session_context).get_data_frame(
+                task_code, [VARIANT_KEY_COLUMN]))
+
+    def get_score_matrix(self, task_code: str) -> ScoreMatrix:
+        # The fingerprint is taken before building so that a file
+        # modified while the matrix is built does not match it.
+        key = fingerprint(file_stats(self._source_files(task_code)))
+        cached = self._matrices.get(task_code)
+        if cached is not None and cached[0] == key:
+            self._budget.touch(self, task_code)
+            return cached[1]
+        with self._lock:
+            cached = self._matrices.get(task_code)
+            built = cached is None or cached[0] != key
+            if built:
+                cached = (key, self._build(task_code))
+                self._matrices[task_code] = cached
+        if built:
+            self._budget.add(self, task_code, cached[1])
+        return cached[1]
+
+    def evict(self, task_code: str):
+        self._matrices.pop(task_code, None)
+
+    def invalidate(self, task_code: str = None):
+        """
+        Discards the matrix cached for task_code or, if not specified,
+        for all tasks. They are rebuilt on next access.
+        """
+        task_codes = [task_code] if task_code else list(self._matrices)
+        for code in task_codes:
+            self.evict(code)
+            self._budget.remove(self, code)
 
 
 class VariantEffectSourceCache(DataCache):
 
-    def _init_once(self, data_folder_root: str):
-        super()._init_once(data_folder_root, VARIANT_EFFECT_SOURCE_TABLE_DEF)
+    def _init_once(self, session_context: RepoSessionContext):
+        super()._init_once(session_context, "VARIANT_EFFECT_SOURCE")
+
 
+class VariantFilterCache(SessionCache):
 
-class VariantFilterCache(ParameterizedSingleton):
+    # Key of each table in the dict of dataframes cached for a task
+    TABLE_KEYS = {"filter_df": "VARIANT_FILTER",
+                  "filter_gene_df": "VARIANT_FILTER_GENE",
+                  "filter_variant_df": "VARIANT_FILTER_VARIANT"}
 
-    def _init_once(self, data_folder_root: str):
-        self._data_folder_root = data_folder_root
+    def _init_once(self, session_context: RepoSessionContext):
+        self._session_context = session_context
         self._lock = threading.Lock()
         self._cache = dict()
 
+    def _load(self, task_code: str) -> dict:
+        return {key: read_cached_table(self._session_context, table_name,
+                                       task_code)
+                for key, table_name in self.TABLE_KEYS.items()}
+
     def get_data_frames(self, task_code: str) -> dict:
-        if task_code not in self._cache:
+        return self._current_entry(task_code).data
+
+    def get_derived(self, task_code: str, name: str, build,
+                    version=None):
+        """
+        Returns the data derived by build from the dict of dataframes of
+        task_code. See CacheEntry.derived_data.
+        """
+        return self._current_entry(task_code).derived_data(name, build,
+                                                           version)
+
+    def _current_entry(self, task_code: str) -> CacheEntry:
+        entry = self._cache.get(task_code)
+        if entry is None or not entry.is_current():
             with self._lock:
-                if task_code not in self._cache:
-                    folder = os.path.join(self._data_folder_root, DATA_FOLDER,
-                                          task_code)
-                    cache_dict = dict()
-                    cache_dict["filter_df"] = pd.read_csv(
-                        os.path.join(folder,
-                                     VARIANT_FILTER_TABLE_DEF.file_name))
-                    cache_dict["filter_gene_df"] = pd.read_csv(
-                        os.path.join(folder,
-                                     VARIANT_FILTER_GENE_TABLE_DEF.file_name))
-                    cache_dict["filter_variant_df"] = pd.read_csv(
-                        os.path.join(
-                            folder,
-                            VARIANT_FILTER_VARIANT_TABLE_DEF.file_name))
-                    self._cache[task_code] = cache_dict
-        return self._cache[task_code]
+                entry = self._cache.get(task_code)
+                if entry is None or not entry.is_current():
+                    source_files = []
+                    for table_name in self.TABLE_KEYS.values():
+                        source_files.extend(
+                            file_name for file_name in table_source_files(
+                                self._session_context, table_name,
+                                task_code)
+                            if file_name not in source_files)
+                    entry = load_cache_entry(
+                        self._session_context, source_files,
+                        lambda: self._load(task_code))
+                    self._cache[task_code] = entry
+        return entry
+
+    def invalidate(self, task_code: str = None):
+        """
+        Discards the dataframes cached for task_code or, if not
+        specified, for all tasks. They are reloaded on next access.
+        """
+        if task_code:
+            self._cache.pop(task_code, None)
+        else:
+            self._cache.clear()
+
+    def reload(self, task_code: str = None):
+        """
+        Reloads the dataframes cached for task_code or, if not
+        specified, for all cached tasks.
+        """
+        task_codes = [task_code] if task_code else list(self._cache)
+        for code in task_codes:
+            self.invalidate(code)
+            self.get_data_frames(code)
+
+    def memory_report(self) -> list[dict]:
+        """
+        Returns the size of each cached task dataframe as a list of
+        dicts with the MEMORY_REPORT_COLUMNS.
+        """
+        return [{"TABLE_NAME": self.TABLE_KEYS[key], "TASK_CODE": task_code,
+                 "NUM_ROWS": len(data_frame),
+                 "MEMORY_BYTES": memory_usage(data_frame)}
+                for task_code, entry in list(self._cache.items())
+                for key, data_frame in entry.data.items()]
+
+
+MEMORY_REPORT_COLUMNS = ["TABLE_NAME", "TASK_CODE", "NUM_ROWS",
+                         "MEMORY_BYTES"]
+CACHE_CLASSES = [
+    VariantCache,
+    VariantTaskCache,
+    VariantEffectSourceCache,
+    VariantEffectLabelCache,
+    VariantEffectScoreCache,
+    VariantFilterCache
+]
+
+
+def _session_caches(session_context: RepoSessionContext = None) -> list:
+    return [cache for cache_class in CACHE_CLASSES
+            for cache in cache_class.instances()
+            if session_context is None or
+            cache.cache_key == session_context.cache_key]
+
+
+def cache_memory_report(
+        session_context: RepoSessionContext = None) -> pd.DataFrame:
+    """
+    Returns the memory used by each repository table currently loaded
+    in a cache, one row per table and task, with the
+    MEMORY_REPORT_COLUMNS. Tables that have not been loaded are not
+    reported.
+
+    Parameters
+    ----------
+    session_context : RepoSessionContext, optional
+        If specified only the caches of its repository are reported,
+        otherwise those of all repositories.
+    """
+    rows = []
+    for cache in _session_caches(session_context):
+        rows.extend(cache.memory_report())
+    return pd.DataFrame(rows, columns=MEMORY_REPORT_COLUMNS)
+
+
+def invalidate_caches(session_context: RepoSessionContext = None):
+    """
+    Discards all cached tables so that they are reloaded from the
+    repository files on next access. Used after a new release of the
+    repository has been installed in place. Changes to the files are
+    also detected on access, this forces a reload regardless.
+
+    Parameters
+    ----------
+    session_context : RepoSessionContext, optional
+        If specified only the caches of its repository are invalidated,
+        otherwise those of all repositories.
+    """
+    for cache in _session_caches(session_context):
+        cache.invalidate()
+    for cache in (VariantKeyCache.instances() +
+                  VariantRegionCache.instances() +
+                  ScoreMatrixCache.instances() +
+                  QueryPlanCache.instances()):
+        if (session_context is None or
+                cache.cache_key == session_context.cache_key):
+            cache.invalidate()
 
 
 class VariantEffectSourceRepository:
 
     def __init__(self, session_context: RepoSessionContext,
                  variant_effect_score_repo):
-        self._cache = VariantEffectSourceCache(
-            session_context.data_folder_root)
+        self._cache = VariantEffectSourceCache(session_context)
         self._variant_effect_score_repo = variant_effect_score_repo
 
     def get_all(self) -> pd.DataFrame:
-        return self._cache.data_frame.copy(deep=True)
+        return lazy_copy(self._cache.data_frame)
 
     def get_by_task(self, task_code: str) -> pd.DataFrame:
-        score_sources = self._variant_effect_score_repo.get_all_by_task(
-            task_code)['SCORE_SOURCE'].unique()
-        source_df = self._cache.data_frame.copy(deep=True)
+        score_sources = self._variant_effect_score_repo.get_score_sources(
+            task_code)
+        source_df = self._cache.data_frame
         return source_df[source_df['CODE'].isin(score_sources)]
 
     def get_by_code(self, codes: list[str]) -> pd.DataFrame:
@@ -340,16 +1556,19 @@ class VariantEffectSourceRepository:
 class VariantTaskRepository:
 
     def __init__(self, session_context: RepoSessionContext):
-        self._cache = VariantTaskCache(session_context.data_folder_root)
+        self._cache = VariantTaskCache(session_context)
 
     def get_all(self) -> pd.DataFrame:
-        return self._cache.data_frame.copy(deep=True)
+        return lazy_copy(self._cache.data_frame)
 
 
 class VariantFilterRepository:
 
-    def __init__(self, session_context: RepoSessionContext):
-        self._cache = VariantFilterCache(session_context.data_folder_root)
+    def __init__(self, session_context: RepoSessionContext,
+                 variant_repo: "VariantRepository" = None):
+        self._cache = VariantFilterCache(session_context)
+        self._variant_repo = VariantRepository(session_context) \
+            if variant_repo is None else variant_repo
 
     def get_by_task(self, task_code: str) -> dict[str, pd.DataFrame]:
         return self._cache.get_data_frames(task_code)
@@ -357,19 +1576,75 @@ class VariantFilterRepository:
     def get_by_task_filter_name(
             self, task_code: str, filter_name: str) -> VariantFilter:
         filter_dfs = self._cache.get_data_frames(task_code)
-        filter = filter_dfs["filter_df"].query(f"NAME == '{filter_name}'")
+        filter_df = filter_dfs["filter_df"]
+        filter = filter_df[(filter_df["NAME"] == filter_name).to_numpy()]
         if len(filter) == 0:
             return None
         filter = filter.iloc[0]
         filter_code = filter["CODE"]
-        filter_genes = filter_dfs["filter_gene_df"].query(
-            f"FILTER_CODE == '{filter_code}'")
-        filter_variants = filter_dfs["filter_variant_df"].query(
-            f"FILTER_CODE == '{filter_code}'")
+        filter_gene_df = filter_dfs["filter_gene_df"]
+        filter_genes = filter_gene_df[
+            (filter_gene_df["FILTER_CODE"] == filter_code).to_numpy()]
+        filter_variant_df = filter_dfs["filter_variant_df"]
+        filter_variants = filter_variant_df[
+            (filter_variant_df["FILTER_CODE"] == filter_code).to_numpy()]
         if len(filter_genes) == 0 and len(filter_variants) == 0:
             return None
         return VariantFilter(filter, filter_genes, filter_variants)
 
+    def get_bitmaps(self, task_code: str) -> "dict[str, VariantBitmap]":
+        """
+        Returns the VariantBitmap of each named filter of a task by
+        filter name. The bitmaps are built when the filters are loaded
+        and rebuilt when the filters or the variants change.
+        """
+        return self._cache.get_derived(task_code, "bitmaps",
+                                       self._build_bitmaps,
+                                       self._variant_repo.version)
+
+    def get_bitmap(self, task_code: str,
+                   filter_name: str) -> "VariantBitmap":
+        """
+        Returns the VariantBitmap of a named filter of a task, None if
+        there is no such filter.
+        """
+        return self.get_bitmaps(task_code).get(filter_name)
+
+    def _build_bitmaps(self, filter_dfs: dict) -> "dict[str, VariantBitmap]":
+        """
+        Resolves each filter into the set of variants query_by_filter
+        would keep. As in get_by_task_filter_name only the first filter
+        of a name counts and a filter without genes or variants has no
+        bitmap.
+        """
+        size = self._variant_repo.key_index.size
+        filter_gene_df = filter_dfs["filter_gene_df"]
+        filter_variant_df = filter_dfs["filter_variant_df"]
+        genes_by_filter = dict(list(filter_gene_df.groupby(
+            "FILTER_CODE", observed=True)["GENE_SYMBOL"]))
+        variants_by_filter = dict(list(filter_variant_df.groupby(
+            "FILTER_CODE", observed=True)[VARIANT_KEY_COLUMN]))
+        bitmaps = {}
+        for filter in filter_dfs["filter_df"].drop_duplicates(
+                "NAME").itertuples():
+            genes = genes_by_filter.get(filter.CODE)
+            variants = variants_by_filter.get(filter.CODE)
+            if genes is None and variants is None:
+                continue
+            bitmap = VariantBitmap(np.ones(size, dtype=bool))
+            if genes is not None:
+                bitmap = VariantBitmap.from_variant_ids(
+                    self._variant_repo.gene_variant_ids(
+                        genes, filter.INCLUDE_GENES == "Y"), size)
+            if variants is not None:
+                variant_bitmap = VariantBitmap.from_variant_ids(
+                    variants[variants >= 0], size)
+                bitmap = bitmap & variant_bitmap \
+                    if filter.INCLUDE_VARIANTS == "Y" \
+                    else bitmap - variant_bitmap
+            bitmaps[filter.NAME] = bitmap
+        return bitmaps
+
 
 def query_by_filter(query_df: pd.DataFrame,
                     filter: pd.Series,
@@ -383,40 +1658,474 @@ def query_by_filter(query_df: pd.DataFrame,
                                             'Y')
     if len(filter_variant_df) > 0:
         query_df = filter_dataframe_by_list(query_df, filter_variant_df,
-                                            VARIANT_PK_COLUMNS, None,
+                                            VARIANT_KEY_COLUMN, None,
                                             filter["INCLUDE_VARIANTS"] == 'Y')
     return query_df
 
 
+def query_gene_symbols(qry: VEQueryCriteria) -> list[str]:
+    """
+    Returns the distinct gene symbols of the gene criteria of qry.
+    """
+    gene_symbols = qry.gene_symbols
+    if isinstance(gene_symbols, pd.DataFrame):
+        gene_symbols = gene_symbols["GENE_SYMBOL"]
+    return list(set(str_or_list_to_list(gene_symbols)))
+
+
+def has_allele_frequency_criteria(qry: VEQueryCriteria) -> bool:
+    return (qry.allele_frequency is not None or
+            qry.allele_frequency_min is not None or
+            qry.allele_frequency_max is not None or
+            qry.allele_frequency_sources is not None)
+
+
+def allele_frequency_ranges(qry: VEQueryCriteria) -> list[tuple]:
+    """
+    Returns the allele frequency criteria in qry that are ranges as
+    (minimum, maximum, minimum_inclusive, maximum_inclusive) tuples,
+    see AlleleFrequencyIndex.rows. The allele_frequency criterion is a
+    range unless its operator is "!=".
+    """
+    ranges = []
+    if (qry.allele_frequency_min is not None or
+            qry.allele_frequency_max is not None):
+        ranges.append((qry.allele_frequency_min, qry.allele_frequency_max,
+                       qry.allele_frequency_min_inclusive,
+                       qry.allele_frequency_max_inclusive))
+    if qry.allele_frequency is not None and \
+            qry.allele_frequency_operator != "!=":
+        operator = qry.allele_frequency_operator
+        inclusive = "=" in operator
+        ranges.append((qry.allele_frequency if operator[0] in "=>" else None,
+                       qry.allele_frequency if operator[0] in "=<" else None,
+                       inclusive, inclusive))
+    return ranges
+
+
+def variant_query_predicates(qry: VEQueryCriteria,
+                             include_indexed: bool = True) -> list[tuple]:
+    """
+    Translates the gene and allele frequency criteria in qry into
+    predicates against the VARIANT table. If include_indexed is False
+    the criteria resolved through the GeneIndex and AlleleFrequencyIndex
+    are left out.
+    """
+    predicates = []
+    if qry.allele_frequency is not None:
+        if qry.allele_frequency_operator not in RELATIONAL_OPERATORS + ["="]:
+            raise Exception(
+                f"{qry.allele_frequency_operator} is not a legal query " +
+                "relational operator. It must be one of " +
+                f"{RELATIONAL_OPERATORS}")
+        if qry.allele_frequency_operator == "!=":
+            predicates.append(("ALLELE_FREQUENCY", "!=",
+                               qry.allele_frequency))
+    if not include_indexed:
+        return predicates
+    for minimum, maximum, minimum_inclusive, maximum_inclusive in \
+            allele_frequency_ranges(qry):
+        if minimum is not None:
+            predicates.append(("ALLELE_FREQUENCY",
+                               ">=" if minimum_inclusive else ">", minimum))
+        if maximum is not None:
+            predicates.append(("ALLELE_FREQUENCY",
+                               "<=" if maximum_inclusive else "<", maximum))
+    if qry.allele_frequency_sources is not None:
+        predicates.append(("ALLELE_FREQUENCY_SOURCE", "in",
+                           str_or_list_to_list(qry.allele_frequency_sources)))
+    if qry.gene_symbols is not None:
+        predicates.append(("GENE_SYMBOL",
+                           "in" if qry.include_genes else "not in",
+                           query_gene_symbols(qry)))
+    return predicates
+
+
+def merge_variants(data_frame: pd.DataFrame,
+                   variant_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Inner join of a variant keyed dataframe with variants on VARIANT_ID.
+    The VARIANT_PK_COLUMNS are taken from data_frame.
+    """
+    return data_frame.merge(
+        variant_df.drop(columns=[column for column in VARIANT_PK_COLUMNS
+                                 if column in variant_df.columns]),
+        how="inner", on=VARIANT_KEY_COLUMN)
+
+
 class VariantRepository:
 
     def __init__(self, session_context: RepoSessionContext):
-        self._cache = VariantCache(session_context.data_folder_root)
+        self._cache = VariantCache(session_context)
+        self._key_cache = VariantKeyCache(session_context)
+        self._region_cache = VariantRegionCache(session_context)
+
+    @property
+    def key_index(self) -> VariantKeyIndex:
+        return self._key_cache.index
+
+    @property
+    def region_index(self) -> RegionIndex:
+        return self._region_cache.index
 
     def get_all(self) -> pd.DataFrame:
-        return self._cache.data_frame.copy(deep=True)
+        return lazy_copy(self._cache.data_frame)
 
-    def get(self, qry: VEQueryCriteria) -> pd.DataFrame:
+    @property
+    def version(self) -> list[dict]:
         """
-        Fetches variants. The optional parameters are filter criteria used to
-        limit the set of variants returned.
-        """
-        where_clause = build_dataframe_where_clause(
-            {"ALLELE_FREQUENCY": [qry.allele_frequency_operator,
-                                  qry.allele_frequency]})
-        variant_df = self._cache.data_frame
-        if where_clause != "":
-            variant_df = variant_df.query(where_clause)
+        Stats of the files the cached variants were loaded from.
+        """
+        return self._cache.version
+
+    def _gene_index(self) -> tuple[pd.DataFrame, GeneIndex]:
+        return self._cache.indexed(
+            "GENE_SYMBOL",
+            lambda variant_df: GeneIndex(variant_df["GENE_SYMBOL"]))
+
+    def gene_variant_ids(self, gene_symbols: list[str],
+                         include: bool = True) -> np.ndarray:
+        """
+        Returns the VARIANT_IDs of the variants of the genes in
+        gene_symbols or, if include is False, of all other variants.
+        """
+        variant_df, gene_index = self._gene_index()
+        return variant_df[VARIANT_KEY_COLUMN].to_numpy(np.int64)[
+            gene_index.rows(list(gene_symbols), include)]
+
+    def allele_frequency_variant_ids(
+            self, minimum: float = None, maximum: float = None,
+            minimum_inclusive: bool = True, maximum_inclusive: bool = True,
+            sources: list[str] = None) -> np.ndarray:
+        """
+        Returns the VARIANT_IDs of the variants whose allele frequency
+        is in a range. See AlleleFrequencyIndex.rows.
+        """
+        variant_df, frequency_index = self._cache.indexed(
+            "ALLELE_FREQUENCY", AlleleFrequencyIndex)
+        return variant_df[VARIANT_KEY_COLUMN].to_numpy(np.int64)[
+            frequency_index.rows(minimum, maximum, minimum_inclusive,
+                                 maximum_inclusive, sources)]
+
+    def _indexed_rows(self, qry: VEQueryCriteria
+                      ) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Returns the cached variants and the ascending positions of those
+        satisfying the gene criteria and the allele frequency range and
+        source criteria of qry, or None if there are no such criteria.
+        """
+        variant_df, rows = self._cache.data_frame, None
         if qry.gene_symbols is not None:
-            variant_df = filter_dataframe_by_list(variant_df, qry.gene_symbols,
-                                                  ['GENE_SYMBOL'],
-                                                  in_list=qry.include_genes)
+            variant_df, gene_index = self._gene_index()
+            rows = gene_index.rows(query_gene_symbols(qry), qry.include_genes)
+        ranges = allele_frequency_ranges(qry)
+        sources = None if qry.allele_frequency_sources is None else \
+            str_or_list_to_list(qry.allele_frequency_sources)
+        if ranges:
+            variant_df, frequency_index = self._cache.indexed(
+                "ALLELE_FREQUENCY", AlleleFrequencyIndex)
+            for range_rows in [frequency_index.rows(*bounds, sources=sources)
+                               for bounds in ranges]:
+                rows = range_rows if rows is None else np.intersect1d(
+                    rows, range_rows, assume_unique=True)
+        elif sources is not None:
+            # The index leaves out the rows without an allele frequency
+            # which a criterion on the source alone must keep
+            source_rows = np.flatnonzero(variant_df[
+                "ALLELE_FREQUENCY_SOURCE"].isin(sources).to_numpy())
+            rows = source_rows if rows is None else np.intersect1d(
+                rows, source_rows, assume_unique=True)
+        return variant_df, rows
+
+    def get(self, qry: VEQueryCriteria,
+            columns: list[str] = None) -> pd.DataFrame:
+        """
+        Fetches variants. The optional parameters are filter criteria used to
+        limit the set of variants returned. The gene and allele frequency
+        criteria are pushed down to the storage read. Once the variants are
+        cached they are resolved through a GeneIndex and an
+        AlleleFrequencyIndex instead. The variants in the regions of the
+        region criteria are looked up in the RegionIndex. If columns is
+        specified the variants are projected onto those columns.
+        """
+        predicates = variant_query_predicates(qry)
+        read_columns = None
+        if columns is not None:
+            read_columns = columns + [VARIANT_KEY_COLUMN] \
+                if VARIANT_KEY_COLUMN not in columns else columns
+        if ((qry.gene_symbols is not None or
+                has_allele_frequency_criteria(qry)) and
+                not self._cache.reads_storage(read_columns, predicates)):
+            variant_df, rows = self._indexed_rows(qry)
+            variant_df = _project_and_filter(
+                variant_df if rows is None else variant_df.iloc[rows],
+                read_columns,
+                variant_query_predicates(qry, include_indexed=False))
+        else:
+            variant_df = self._cache.get_data_frame(read_columns, predicates)
         if qry.variant_ids is not None:
-            variant_df = filter_dataframe_by_list(variant_df, qry.variant_ids,
-                                                  VARIANT_PK_COLUMNS,
-                                                  qry.column_name_map,
-                                                  qry.include_variant_ids)
-        return variant_df
+            variant_df = self.key_index.filter(variant_df, qry.variant_ids,
+                                               qry.column_name_map,
+                                               qry.include_variant_ids)
+        if qry.regions is not None:
+            in_regions = variant_df[VARIANT_KEY_COLUMN].isin(
+                self.region_index.variant_ids(
+                    regions_data_frame(qry.regions))).to_numpy()
+            variant_df = variant_df[in_regions if qry.include_regions
+                                    else ~in_regions].reset_index(drop=True)
+        return variant_df if columns is None else variant_df[columns]
+
+
+@dataclass
+class VariantBitmap:
+    """
+    Set of variants as a bitmap over the VARIANT_ID key space. Bitmaps
+    combine with & (and), | (or), - (and not) and ~ (not). Bitmaps of
+    different sizes are combined as if the shorter were padded with
+    unset bits, i.e. VARIANT_IDs beyond the end of a bitmap are not in
+    it.
+    """
+
+    mask: np.ndarray
+
+    @classmethod
+    def from_variant_ids(cls, variant_ids, size: int):
+        """
+        Returns the bitmap of size bits with the bits of variant_ids set.
+        """
+        mask = np.zeros(size, dtype=bool)
+        mask[np.asarray(variant_ids, dtype=np.int64)] = True
+        return cls(mask)
+
+    @property
+    def variant_ids(self) -> np.ndarray:
+        """
+        Sorted VARIANT_IDs of the variants in the set.
+        """
+        return np.flatnonzero(self.mask)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.mask))
+
+    def _aligned(self, other: "VariantBitmap"
+                 ) -> tuple[np.ndarray, np.ndarray]:
+        size = max(len(self.mask), len(other.mask))
+        return (np.pad(self.mask, (0, size - len(self.mask))),
+                np.pad(other.mask, (0, size - len(other.mask))))
+
+    def __and__(self, other: "VariantBitmap"):
+        mask, other_mask = self._aligned(other)
+        return type(self)(mask & other_mask)
+
+    def __or__(self, other: "VariantBitmap"):
+        mask, other_mask = self._aligned(other)
+        return type(self)(mask | other_mask)
+
+    def __sub__(self, other: "VariantBitmap"):
+        mask, other_mask = self._aligned(other)
+        return type(self)(mask & ~other_mask)
+
+    def __invert__(self):
+        return type(self)(~self.mask)
+
+    def matches(self, variant_ids) -> np.ndarray:
+        """
+        Returns whether each of variant_ids is in the set. Unknown
+        variants, i.e. -1, are not.
+        """
+        variant_ids = np.asarray(variant_ids, dtype=np.int64)
+        known = (variant_ids >= 0) & (variant_ids < len(self.mask))
+        matches = np.zeros(len(variant_ids), dtype=bool)
+        matches[known] = self.mask[variant_ids[known]]
+        return matches
+
+    def apply(self, data_frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the rows of a variant keyed dataframe whose variants are
+        in the set.
+        """
+        return data_frame[self.matches(
+            data_frame[VARIANT_KEY_COLUMN])].reset_index(drop=True)
+
+
+class VariantQueryPlan(VariantBitmap):
+    """
+    Query criteria of a task compiled into a VariantBitmap. A variant
+    satisfies the criteria, including those of the named filter, if its
+    bit is set. See VariantQueryPlanner.
+    """
+
+
+class QueryPlanCache(SessionCache):
+    """
+    Least recently used cache of the VariantQueryPlans of a repository
+    keyed by task and a fingerprint of the query criteria. A plan is
+    compiled again when the files it was compiled from change.
+    """
+
+    MAX_PLANS = 32
+
+    def _init_once(self, session_context: RepoSessionContext):
+        self._session_context = session_context
+        self._lock = threading.Lock()
+        self._plans = OrderedDict()
+
+    def get_or_compile(self, task_code: str, qry: VEQueryCriteria,
+                       source_files: list[str],
+                       compile) -> VariantQueryPlan:
+        """
+        Returns the cached plan of qry for task_code. If there is none,
+        or source_files changed since it was compiled, calls compile to
+        compile it.
+        """
+        key = (task_code, fingerprint(qry))
+        with self._lock:
+            entry = self._plans.get(key)
+            if entry is not None:
+                self._plans.move_to_end(key)
+        if entry is None or not entry.is_current():
+            entry = load_cache_entry(self._session_context, source_files,
+                                     compile)
+            with self._lock:
+                self._plans[key] = entry
+                self._plans.move_to_end(key)
+                while len(self._plans) > self.MAX_PLANS:
+                    self._plans.popitem(last=False)
+        return entry.data
+
+    def invalidate(self):
+        with self._lock:
+            self._plans.clear()
+
+
+def filter_expression_leaves(expression: FilterExpression):
+    """
+    Yields the named filter, gene, region, allele frequency and variant
+    id filters of expression.
+    """
+    if isinstance(expression, (FilterUnion, FilterIntersection)):
+        for operand in expression.operands:
+            yield from filter_expression_leaves(operand)
+    elif isinstance(expression, FilterDifference):
+        yield from filter_expression_leaves(expression.left)
+        yield from filter_expression_leaves(expression.right)
+    else:
+        yield expression
+
+
+def query_region_files(qry: VEQueryCriteria) -> list[str]:
+    """
+    Returns the BED files referenced by the region criteria of qry and
+    the region filters of its filter expression.
+    """
+    regions = [qry.regions]
+    if qry.filter_expression is not None:
+        regions.extend(leaf.regions for leaf in
+                       filter_expression_leaves(qry.filter_expression)
+                       if isinstance(leaf, RegionFilter))
+    return [region for region in regions
+            if isinstance(region, str) and os.path.isfile(region)]
+
+
+class VariantQueryPlanner:
+    """
+    Compiles query criteria into VariantQueryPlans. The variant, gene,
+    allele frequency, region and named filter criteria and the filter
+    expression are evaluated once against the variant table and the
+    resulting plan is cached so that the label and score repositories
+    of a task apply the same criteria as a mask.
+    """
+
+    def __init__(self, session_context: RepoSessionContext,
+                 variant_repo: VariantRepository,
+                 filter_repo: VariantFilterRepository):
+        self._session_context = session_context
+        self._variant_repo = variant_repo
+        self._filter_repo = filter_repo
+        self._cache = QueryPlanCache(session_context)
+
+    def plan(self, task_code: str, qry: VEQueryCriteria) -> VariantQueryPlan:
+        """
+        Returns the plan of qry for task_code.
+        """
+        source_files = table_source_files(self._session_context, "VARIANT")
+        source_files.extend(query_region_files(qry))
+        named_filters = qry.filter_name is not None
+        if qry.filter_expression is not None:
+            named_filters |= any(
+                isinstance(leaf, NamedFilter) for leaf in
+                filter_expression_leaves(qry.filter_expression))
+        if named_filters:
+            for table_name in VariantFilterCache.TABLE_KEYS.values():
+                source_files.extend(table_source_files(
+                    self._session_context, table_name, task_code))
+        return self._cache.get_or_compile(
+            task_code, qry, source_files,
+            lambda: self._compile(task_code, qry))
+
+    def evaluate(self, task_code: str,
+                 expression: FilterExpression) -> VariantBitmap:
+        """
+        Returns the set of variants described by a filter expression.
+        Named filters are taken from the bitmaps of the filters of the
+        task and the other filters are looked up in the indexes of the
+        variant table.
+        """
+        size = self._variant_repo.key_index.size
+        if isinstance(expression, FilterUnion):
+            bitmap = VariantBitmap(np.zeros(size, dtype=bool))
+            for operand in expression.operands:
+                bitmap = bitmap | self.evaluate(task_code, operand)
+            return bitmap
+        if isinstance(expression, FilterIntersection):
+            bitmap = VariantBitmap(np.ones(size, dtype=bool))
+            for operand in expression.operands:
+                bitmap = bitmap & self.evaluate(task_code, operand)
+            return bitmap
+        if isinstance(expression, FilterDifference):
+            return self.evaluate(task_code, expression.left) - \
+                self.evaluate(task_code, expression.right)
+        if isinstance(expression, NamedFilter):
+            bitmap = self._filter_repo.get_bitmap(task_code,
+                                                  expression.filter_name)
+            if bitmap is None:
+                raise Exception("Invalid filter name: " +
+                                expression.filter_name)
+            return bitmap
+        if isinstance(expression, GeneFilter):
+            variant_ids = self._variant_repo.gene_variant_ids(
+                str_or_list_to_list(expression.gene_symbols))
+        elif isinstance(expression, RegionFilter):
+            variant_ids = self._variant_repo.region_index.variant_ids(
+                regions_data_frame(expression.regions))
+        elif isinstance(expression, AlleleFrequencyFilter):
+            variant_ids = self._variant_repo.allele_frequency_variant_ids(
+                expression.minimum, expression.maximum,
+                expression.minimum_inclusive, expression.maximum_inclusive,
+                None if expression.sources is None
+                else str_or_list_to_list(expression.sources))
+        elif isinstance(expression, VariantIdFilter):
+            variant_ids = self._variant_repo.key_index.ids(
+                expression.variant_ids, expression.column_name_map)
+            variant_ids = variant_ids[variant_ids >= 0]
+        else:
+            raise Exception(f"Invalid filter expression: {expression!r}")
+        return VariantBitmap.from_variant_ids(variant_ids, size)
+
+    def _compile(self, task_code: str,
+                 qry: VEQueryCriteria) -> VariantQueryPlan:
+        plan = VariantQueryPlan.from_variant_ids(
+            self._variant_repo.get(qry, [VARIANT_KEY_COLUMN])[
+                VARIANT_KEY_COLUMN], self._variant_repo.key_index.size)
+        if qry.filter_name is not None:
+            filter_bitmap = self._filter_repo.get_bitmap(task_code,
+                                                         qry.filter_name)
+            if filter_bitmap is None:
+                raise Exception("Invalid filter name: " + qry.filter_name)
+            plan = plan & filter_bitmap
+        if qry.filter_expression is not None:
+            plan = plan & self.evaluate(task_code, qry.filter_expression)
+        return plan
 
 
 class VariantEffectLabelRepository:
@@ -424,44 +2133,26 @@ class VariantEffectLabelRepository:
     def __init__(self, session_context: RepoSessionContext,
                  variant_repo: VariantRepository,
                  filter_repo: VariantFilterRepository):
-        self._cache = VariantEffectLabelCache(session_context.data_folder_root)
+        self._cache = VariantEffectLabelCache(session_context)
         self._filter_repo = filter_repo
         self._variant_repo = variant_repo
+        self._planner = VariantQueryPlanner(session_context, variant_repo,
+                                            filter_repo)
 
     def get_all_by_task(self, task_code: str) -> pd.DataFrame:
         label_df = self._cache.get_data_frame(task_code)
-        variant_df = self._variant_repo.get(
-            VEQueryCriteria(variant_ids=label_df[VARIANT_PK_COLUMNS]))
-        return label_df.merge(variant_df, on=VARIANT_PK_COLUMNS,
-                              how="inner")
+        return merge_variants(label_df, self._variant_repo.get_all())
 
     def get(self, task_code: str,
             qry: VEQueryCriteria = None) -> pd.DataFrame:
         """
-        Fetches variant effect labels.
+        Fetches variant effect labels. The criteria in qry are applied
+        through its VariantQueryPlan.
         """
         label_df = self._cache.get_data_frame(task_code)
         if qry is not None:
-            if qry.variant_ids is not None and len(qry.variant_ids) > 0:
-                label_df = filter_dataframe_by_list(
-                    label_df, qry.variant_ids,
-                    VARIANT_PK_COLUMNS,
-                    in_list=qry.include_variant_ids)
-            variant_df = self._variant_repo.get(qry)
-        else:
-            variant_df = self._variant_repo.get_all()
-        merge_df = label_df.merge(variant_df, how="inner",
-                                  on=VARIANT_PK_COLUMNS)
-        if qry is not None and qry.filter_name is not None:
-            filter_dfs = \
-                self._filter_repo.get_by_task_filter_name(task_code,
-                                                          qry.filter_name)
-            if filter_dfs is None:
-                raise Exception("Invalid filter name: " + qry.filter_name)
-            merge_df = query_by_filter(merge_df, filter_dfs.filter,
-                                       filter_dfs.filter_genes,
-                                       filter_dfs.filter_variants)
-        return merge_df
+            label_df = self._planner.plan(task_code, qry).apply(label_df)
+        return merge_variants(label_df, self._variant_repo.get_all())
 
 
 class VariantEffectScoreRepository:
@@ -469,51 +2160,58 @@ class VariantEffectScoreRepository:
     def __init__(self, session_context: RepoSessionContext,
                  variant_repo: VariantRepository,
                  filter_repo: VariantFilterRepository):
-        self._cache = VariantEffectScoreCache(session_context.data_folder_root)
+        self._cache = VariantEffectScoreCache(session_context)
+        self._matrix_cache = ScoreMatrixCache(session_context)
         self._filter_repo = filter_repo
         self._variant_repo = variant_repo
+        self._planner = VariantQueryPlanner(session_context, variant_repo,
+                                            filter_repo)
 
     def get_all_by_task(self, task_code: str) -> pd.DataFrame:
         score_df = self._cache.get_data_frame(task_code)
-        query_criteria = VEQueryCriteria(variant_ids=score_df[
-            VARIANT_PK_COLUMNS].drop_duplicates(),
-            include_variant_ids=True)
-        variant_df = self._variant_repo.get(query_criteria)
-        return score_df.merge(variant_df, on=VARIANT_PK_COLUMNS,
-                              how="inner")
+        return merge_variants(score_df, self._variant_repo.get_all())
+
+    def get_score_matrix(self, task_code: str) -> ScoreMatrix:
+        """
+        Returns the scores of the labeled variants of a task as a dense
+        variants x sources ScoreMatrix. The matrix is cached and must
+        not be modified.
+        """
+        return self._matrix_cache.get_score_matrix(task_code)
+
+    def get_score_sources(self, task_code: str) -> list[str]:
+        """
+        Returns the codes of the system variant effect sources that
+        have scores for a task.
+        """
+        return list(self._cache.get_data_frame(
+            task_code, ["SCORE_SOURCE"])["SCORE_SOURCE"].unique())
 
     def get(self, task_code: str,
             variant_effect_sources: list[str] | str = None,
             include_variant_effect_sources: bool = True,
-            qry: VEQueryCriteria = None) -> pd.DataFrame:
+            qry: VEQueryCriteria = None,
+            columns: list[str] = None) -> pd.DataFrame:
+        """
+        Fetches variant effect scores. The variant effect source criteria
+        are pushed down to the score table read and the criteria in qry
+        are applied through its VariantQueryPlan. If columns is specified
+        only those score table columns are materialized.
+        """
 
-        score_df = self._cache.get_data_frame(task_code)
+        predicates = None
         if (variant_effect_sources is not None and
                 len(variant_effect_sources) > 0):
-            score_df = filter_dataframe_by_list(score_df,
-                                                variant_effect_sources,
-                                                "SCORE_SOURCE",
-                                                None,
-                                                include_variant_effect_sources)
+            predicates = [("SCORE_SOURCE",
+                           "in" if include_variant_effect_sources
+                           else "not in",
+                           str_or_list_to_list(variant_effect_sources))]
+        if columns is None:
+            columns = VARIANT_EFFECT_SCORE_TABLE_DEF.columns
+        read_columns = columns + [VARIANT_KEY_COLUMN] \
+            if VARIANT_KEY_COLUMN not in columns else columns
+        score_df = self._cache.get_data_frame(task_code, read_columns,
+                                              predicates)
         if qry is None:
-            return score_df
-        if qry.variant_ids is not None:
-            score_df = filter_dataframe_by_list(score_df, qry.variant_ids,
-                                                VARIANT_PK_COLUMNS,
-                                                qry.column_name_map,
-                                                qry.include_variant_ids)
-        variant_df = self._variant_repo.get(qry)
-        merge_df = score_df.merge(variant_df, how="inner",
-                                  on=VARIANT_PK_COLUMNS)
-        if qry.filter_name is not None:
-            filter_dfs = \
-                self._filter_repo.get_by_task_filter_name(task_code,
-                                                          qry.filter_name)
-            if filter_dfs is None:
-                raise Exception("Invalid filter name: " + qry.filter_name)
-            merge_df = query_by_filter(merge_df, filter_dfs.filter,
-                                       filter_dfs.filter_genes,
-                                       filter_dfs.filter_variants)
-        return merge_df[VARIANT_EFFECT_SCORE_TABLE_DEF.columns]
-
-
+            return score_df[columns]
+        return self._planner.plan(task_code, qry).apply(score_df)[columns]
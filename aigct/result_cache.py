@@ -0,0 +1,199 @@
+"""
+Cache of the results of analyses keyed by a fingerprint of their
+inputs. Running compute_metrics again with the same user scores,
+query criteria and parameters against the same version of the
+repository returns the cached result rather than recomputing it.
+
+Results are held in memory, up to a maximum number of them, and
+optionally also written to a directory so that they survive the
+process. Both tiers evict the least recently used results.
+"""
+
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import fields, replace
+import pandas as pd
+from .model import VEAnalysisResult
+from .pd_util import fingerprint, lazy_copy
+from .repository import (
+    RepoSessionContext,
+    task_source_files
+)
+from .storage import file_stats
+
+# Incremented whenever the content of the cache files changes so
+# that files written by an older version are ignored.
+RESULT_CACHE_VERSION = 1
+DEFAULT_MAX_ENTRIES = 16
+
+
+def copy_result(result: VEAnalysisResult) -> VEAnalysisResult:
+    """
+    Returns a copy of result whose dataframes, including those of its
+    user_analysis, the caller may modify without affecting the cached
+    result. See pd_util.lazy_copy.
+    """
+    changes = {field.name: lazy_copy(getattr(result, field.name))
+               for field in fields(result)
+               if isinstance(getattr(result, field.name), pd.DataFrame)}
+    if result.user_analysis is not None:
+        user_analysis = result.user_analysis
+        changes["user_analysis"] = replace(
+            user_analysis,
+            label_variant_ids=user_analysis.label_variant_ids.copy(),
+            **{field.name: lazy_copy(getattr(user_analysis, field.name))
+               for field in fields(user_analysis)
+               if isinstance(getattr(user_analysis, field.name),
+                             pd.DataFrame)})
+    return replace(result, **changes)
+
+
+class AnalysisResultCache:
+    """
+    Least recently used cache of analysis results with an in memory
+    tier and an optional on disk tier.
+    """
+
+    def __init__(self, session_context: RepoSessionContext,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 cache_dir: str = None,
+                 max_disk_bytes: int = None):
+        """
+        Parameters
+        ----------
+        session_context : RepoSessionContext
+            Context of the repository the analyses are run against.
+            The stats of its files are part of the fingerprint of an
+            analysis so that results computed from an older version of
+            the repository are not returned.
+        max_entries : int, optional
+            Maximum number of results held in memory. 0 disables the
+            in memory tier.
+        cache_dir : str, optional
+            If specified results are also written to this directory.
+        max_disk_bytes : int, optional
+            If specified the least recently used files are deleted from
+            cache_dir when their total size exceeds this number of
+            bytes.
+        """
+        self._session_context = session_context
+        self._max_entries = max_entries
+        self._cache_dir = None if cache_dir is None else \
+            os.path.expanduser(cache_dir)
+        self._max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        # fingerprint -> result in least to most recently used order
+        self._entries = OrderedDict()
+
+    def key(self, task_code: str, params: dict) -> str:
+        """
+        Returns the fingerprint of the analysis of task_code with
+        params in the current version of the repository.
+        """
+        source_stats = file_stats(task_source_files(self._session_context,
+                                                    task_code))
+        return fingerprint({"version": RESULT_CACHE_VERSION,
+                            "task_code": task_code,
+                            "sources": source_stats,
+                            "params": params})
+
+    def get_or_compute(self, task_code: str, params: dict,
+                       compute) -> VEAnalysisResult:
+        """
+        Returns the cached result of the analysis of task_code with
+        params. If there is none calls compute to run the analysis and
+        caches its result.
+        """
+        # The key is computed before the analysis so that a file
+        # modified during the analysis does not match the result.
+        key = self.key(task_code, params)
+        result = self._get_memory(key)
+        if result is None:
+            result = self._get_disk(key)
+            if result is None:
+                result = compute()
+                self._put_disk(key, result)
+            self._put_memory(key, result)
+        return copy_result(result)
+
+    def _get_memory(self, key: str) -> VEAnalysisResult:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def _put_memory(self, key: str, result: VEAnalysisResult):
+        if not self._max_entries:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def _cache_file(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key + ".pkl")
+
+    def _get_disk(self, key: str) -> VEAnalysisResult:
+        if self._cache_dir is None:
+            return None
+        cache_file = self._cache_file(key)
+        try:
+            with open(cache_file, "rb") as file:
+                result = pickle.load(file)
+            # The modification time records the last use for eviction
+            os.utime(cache_file)
+            return result
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _put_disk(self, key: str, result: VEAnalysisResult):
+        if self._cache_dir is None:
+            return
+        os.makedirs(self._cache_dir, exist_ok=True)
+        cache_file = self._cache_file(key)
+        # Written to a private file which is then renamed into place
+        # so that other processes never read a partially written file.
+        temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file, "wb") as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        if self._max_disk_bytes is None:
+            return
+        entries = []
+        for entry in os.scandir(self._cache_dir):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self._max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes -= size
+
+    def clear(self):
+        """
+        Discards all cached results, including those on disk.
+        """
+        with self._lock:
+            self._entries.clear()
+        if self._cache_dir is not None and os.path.isdir(self._cache_dir):
+            for entry in os.scandir(self._cache_dir):
+                if entry.name.endswith(".pkl"):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
@@ -0,0 +1,96 @@
+"""
+Persisted snapshots of the results of analyses of the system variant
+effect sources. An analysis that does not include user scores gives
+the same result every time it is run against the same version of the
+repository, so its result is stored under the repository root
+directory the first time it is computed and read back on subsequent
+runs in any process.
+
+A snapshot is keyed by the task and the parameters of the analysis
+and records the size and modification time of the repository files
+the analysis is derived from. A snapshot taken from an older version
+of the files is ignored and replaced.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import shutil
+from .model import VEAnalysisResult
+from .repository import (
+    RepoSessionContext,
+    task_source_files
+)
+from .storage import file_stats
+
+# Incremented whenever the content of the snapshot files changes so
+# that snapshots written by an older version are recomputed.
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_key(params: dict) -> str:
+    """
+    Returns a digest of the analysis parameters that is used as the
+    file name of the snapshot. params must be json serializable.
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()
+                          ).hexdigest()
+
+
+class AnalysisSnapshotStore:
+    """
+    Reads and writes the snapshots of a repository.
+    """
+
+    def __init__(self, session_context: RepoSessionContext):
+        self._session_context = session_context
+
+    def _snapshot_file(self, task_code: str, params: dict) -> str:
+        return os.path.join(self._session_context.snapshot_folder(task_code),
+                            snapshot_key(params) + ".pkl")
+
+    def get_or_compute(self, task_code: str, params: dict,
+                       compute) -> VEAnalysisResult:
+        """
+        Returns the snapshot of the analysis of task_code with params.
+        If there is none for the current version of the repository,
+        calls compute to run the analysis and stores its result as the
+        snapshot, replacing any existing one.
+        """
+        # The stats are taken before computing so that a file modified
+        # during the analysis invalidates the snapshot.
+        source_stats = file_stats(task_source_files(self._session_context,
+                                                    task_code))
+        snapshot_file = self._snapshot_file(task_code, params)
+        try:
+            with open(snapshot_file, "rb") as file:
+                snapshot = pickle.load(file)
+            if (snapshot["version"] == SNAPSHOT_VERSION and
+                    snapshot["params"] == params and
+                    snapshot["sources"] == source_stats):
+                return snapshot["result"]
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        result = compute()
+        os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+        # Written to a private file which is then renamed into place
+        # so that other processes never read a partially written
+        # snapshot.
+        temp_file = f"{snapshot_file}.{os.getpid()}.tmp"
+        with open(temp_file, "wb") as file:
+            pickle.dump({"version": SNAPSHOT_VERSION,
+                         "params": params,
+                         "sources": source_stats,
+                         "result": result}, file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, snapshot_file)
+        return result
+
+    def clear(self, task_code: str = None):
+        """
+        Deletes the snapshots of task_code or, if not specified, of
+        all tasks.
+        """
+        folder = self._session_context.snapshot_folder(task_code or "")
+        shutil.rmtree(folder, ignore_errors=True)
@@ -0,0 +1,283 @@
+"""
+Storage backends for the repository tables. A backend encapsulates
+how a table is read from and written to disk in one particular file
+format. The format used for a table is selected by the file_format
+attribute of its TableDef. The columnar formats (parquet and arrow)
+require the optional pyarrow package.
+"""
+
+import os
+import pandas as pd
+from .pd_util import filter_dataframe_by_predicates
+
+CSV_FORMAT = "csv"
+PARQUET_FORMAT = "parquet"
+ARROW_FORMAT = "arrow"
+
+# Number of rows per parquet row group. Smaller row groups allow
+# predicate pushdown to skip more data at the expense of a larger file.
+PARQUET_ROW_GROUP_SIZE = 64 * 1024
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute  # noqa: F401
+        import pyarrow.feather  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise Exception("The pyarrow package is required to use the " +
+                        f"{PARQUET_FORMAT} and {ARROW_FORMAT} repository " +
+                        "file formats. Install it with: pip install pyarrow")
+    return pyarrow
+
+
+def _read_columns(columns: list[str], predicates: list[tuple]) -> list[str]:
+    """
+    Returns the columns that must be read to evaluate predicates and
+    project columns.
+    """
+    if columns is None:
+        return None
+    return columns + [predicate[0] for predicate in predicates or []
+                      if predicate[0] not in columns]
+
+
+def _to_pandas(table, columns: list[str], predicates: list[tuple],
+               dtypes: dict) -> pd.DataFrame:
+    """
+    Applies predicates to an arrow table and converts the surviving rows
+    of the projected columns to a dataframe.
+    """
+    if predicates:
+        table = table.filter(_arrow_filter(predicates))
+    if columns is not None:
+        table = table.select(columns)
+    data_frame = table.to_pandas()
+    return data_frame.astype(_arrow_dtypes(dtypes, data_frame.columns))
+
+
+def _arrow_predicate(predicate: tuple) -> tuple:
+    column, operator, value = predicate
+    if operator == "=":
+        operator = "=="
+    if operator in ["in", "not in"]:
+        value = list(value)
+    return column, operator, value
+
+
+def _arrow_filter(predicates: list[tuple]):
+    """
+    Translates predicates into an arrow filter expression. Arrow
+    comparisons with null are null, so "!=" is extended to keep the
+    rows with missing values as pd_util.filter_dataframe_by_predicates
+    does.
+    """
+    pa = _import_pyarrow()
+    expression = None
+    for predicate in predicates:
+        column, operator, value = _arrow_predicate(predicate)
+        if operator == "!=":
+            field = pa.compute.field(column)
+            term = field.is_null() | (field != value)
+        else:
+            term = pa.parquet.filters_to_expression(
+                [(column, operator, value)])
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def _arrow_dtypes(dtypes: dict, columns) -> dict:
+    """
+    Returns the subset of dtypes that need to be applied to a dataframe
+    converted to or from arrow. String columns are skipped as arrow
+    already stores them as strings and an astype(str) would turn missing
+    values into literal strings.
+    """
+    if dtypes is None:
+        return {}
+    return {column: dtype for column, dtype in dtypes.items()
+            if column in columns and dtype != "str"}
+
+
+def file_stats(file_names: list[str]) -> list[dict]:
+    """
+    Returns the absolute path, size and modification time of each file.
+    Used to detect that a file a cached copy was made from has changed.
+    """
+    stats = []
+    for file_name in file_names:
+        stat = os.stat(file_name)
+        stats.append({"file": os.path.abspath(file_name),
+                      "size": stat.st_size,
+                      "mtime_ns": stat.st_mtime_ns})
+    return stats
+
+
+class TableStorage:
+    """
+    Base class for a repository table storage backend.
+    Subclasses implement read and write for a specific file format.
+    """
+
+    file_format: str = None
+    extension: str = None
+
+    def file_name(self, file_name: str) -> str:
+        """
+        Returns file_name with its extension replaced by the
+        extension of this storage format.
+        """
+        return os.path.splitext(file_name)[0] + self.extension
+
+    supports_pushdown: bool = False
+
+    def read(self, file_name: str, columns: list[str] = None,
+             dtypes: dict = None,
+             predicates: list[tuple] = None) -> pd.DataFrame:
+        """
+        Read a table into a dataframe.
+
+        Parameters
+        ----------
+        file_name : str
+            Full path of the table file
+        columns : list[str], optional
+            If specified only these columns are read.
+        dtypes : dict, optional
+            Maps column names to the dtype the column is to have
+            in the returned dataframe.
+        predicates : list[tuple], optional
+            List of (column, operator, value) tuples. Only rows
+            satisfying all of the predicates are returned. See
+            pd_util.filter_dataframe_by_predicates for the operators
+            supported. Backends where supports_pushdown is True
+            evaluate them while reading so that rows that do not
+            qualify are never materialized.
+        """
+        raise NotImplementedError()
+
+    def write(self, data_frame: pd.DataFrame, file_name: str,
+              dtypes: dict = None):
+        """
+        Write a dataframe to a table file, replacing the file if it
+        already exists.
+        """
+        raise NotImplementedError()
+
+    def columns(self, file_name: str) -> list[str]:
+        """
+        Returns the names of the columns stored in a table file
+        without reading its data.
+        """
+        raise NotImplementedError()
+
+
+class CsvTableStorage(TableStorage):
+
+    file_format = CSV_FORMAT
+    extension = ".csv"
+
+    def read(self, file_name: str, columns: list[str] = None,
+             dtypes: dict = None,
+             predicates: list[tuple] = None) -> pd.DataFrame:
+        data_frame = pd.read_csv(file_name,
+                                 usecols=_read_columns(columns, predicates),
+                                 dtype=dtypes)
+        if predicates:
+            data_frame = filter_dataframe_by_predicates(data_frame,
+                                                        predicates)
+        return data_frame if columns is None else data_frame[columns]
+
+    def write(self, data_frame: pd.DataFrame, file_name: str,
+              dtypes: dict = None):
+        data_frame.to_csv(file_name, index=False)
+
+    def columns(self, file_name: str) -> list[str]:
+        return list(pd.read_csv(file_name, nrows=0).columns)
+
+
+class ParquetTableStorage(TableStorage):
+
+    file_format = PARQUET_FORMAT
+    extension = ".parquet"
+    supports_pushdown = True
+
+    def read(self, file_name: str, columns: list[str] = None,
+             dtypes: dict = None,
+             predicates: list[tuple] = None) -> pd.DataFrame:
+        pa = _import_pyarrow()
+        # Passing the predicates as filters lets parquet skip whole row
+        # groups using the column statistics stored in the file.
+        table = pa.parquet.read_table(
+            file_name, columns=_read_columns(columns, predicates),
+            filters=_arrow_filter(predicates) if predicates else None)
+        return _to_pandas(table, columns, None, dtypes)
+
+    def write(self, data_frame: pd.DataFrame, file_name: str,
+              dtypes: dict = None):
+        pa = _import_pyarrow()
+        data_frame = data_frame.astype(
+            _arrow_dtypes(dtypes, data_frame.columns))
+        table = pa.Table.from_pandas(data_frame, preserve_index=False)
+        pa.parquet.write_table(table, file_name,
+                               row_group_size=PARQUET_ROW_GROUP_SIZE)
+
+    def columns(self, file_name: str) -> list[str]:
+        pa = _import_pyarrow()
+        return pa.parquet.read_schema(file_name).names
+
+
+class ArrowTableStorage(TableStorage):
+    """
+    Stores tables in the Arrow IPC (feather v2) file format. Files
+    are read through a memory map and predicates are evaluated on the
+    arrow table before it is converted to a dataframe.
+    """
+
+    file_format = ARROW_FORMAT
+    extension = ".arrow"
+    supports_pushdown = True
+
+    def read(self, file_name: str, columns: list[str] = None,
+             dtypes: dict = None,
+             predicates: list[tuple] = None) -> pd.DataFrame:
+        pa = _import_pyarrow()
+        # Read through the IPC reader rather than feather.read_table,
+        # which copies the buffers it selects out of the memory map.
+        table = pa.ipc.open_file(pa.memory_map(file_name)).read_all()
+        read_columns = _read_columns(columns, predicates)
+        if read_columns is not None:
+            table = table.select(read_columns)
+        return _to_pandas(table, columns, predicates, dtypes)
+
+    def write(self, data_frame: pd.DataFrame, file_name: str,
+              dtypes: dict = None):
+        pa = _import_pyarrow()
+        data_frame = data_frame.astype(
+            _arrow_dtypes(dtypes, data_frame.columns))
+        table = pa.Table.from_pandas(data_frame, preserve_index=False)
+        # Written uncompressed as compressed buffers would have to be
+        # decompressed into memory, defeating the memory map on read.
+        pa.feather.write_feather(table, file_name,
+                                 compression="uncompressed")
+
+    def columns(self, file_name: str) -> list[str]:
+        pa = _import_pyarrow()
+        with pa.memory_map(file_name) as source:
+            return pa.ipc.open_file(source).schema.names
+
+
+TABLE_STORAGE_CLASSES = {
+    CSV_FORMAT: CsvTableStorage,
+    PARQUET_FORMAT: ParquetTableStorage,
+    ARROW_FORMAT: ArrowTableStorage
+}
+
+
+def get_table_storage(file_format: str) -> TableStorage:
+    if file_format not in TABLE_STORAGE_CLASSES:
+        raise Exception(
+            f"{file_format} is not a supported repository file format. " +
+            f"It must be one of {list(TABLE_STORAGE_CLASSES.keys())}")
+    return TABLE_STORAGE_CLASSES[file_format]()
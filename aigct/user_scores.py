@@ -0,0 +1,353 @@
+"""
+Readers of user variant effect score files. A file is read in chunks
+of rows so that a file that is too large to be held in memory can be
+filtered down to the variants of an analysis as it is read, see
+VEAnalyzer.read_user_scores. The format of a file is determined by
+its extension: .csv, .tsv (or .txt), .parquet and .vcf, where .csv,
+.tsv and .vcf files may be compressed, e.g. .csv.gz or .vcf.gz.
+Parquet files require the optional pyarrow package.
+
+The score of a variant in a VCF file is the value of a key of its
+INFO field. VCF files compressed with bgzip, i.e. made of independent
+BGZF blocks, are decompressed by a pool of threads.
+"""
+
+import os
+import io
+import csv
+import gzip
+import re
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+import numpy as np
+import pandas as pd
+from .repository import (
+    VARIANT_PK_COLUMNS,
+    VARIANT_PK_DTYPES
+)
+from .storage import (
+    CSV_FORMAT,
+    PARQUET_FORMAT
+)
+
+TSV_FORMAT = "tsv"
+VCF_FORMAT = "vcf"
+USER_SCORE_COLUMNS = VARIANT_PK_COLUMNS + ["RANK_SCORE"]
+USER_SCORE_DTYPES = VARIANT_PK_DTYPES | {"RANK_SCORE": "float64"}
+# Number of rows read at a time. Bounds the memory used by the rows
+# of a file that are not part of the analysis.
+DEFAULT_CHUNK_SIZE = 1000000
+
+FILE_EXTENSION_FORMATS = {
+    ".csv": CSV_FORMAT,
+    ".tsv": TSV_FORMAT,
+    ".txt": TSV_FORMAT,
+    ".parquet": PARQUET_FORMAT,
+    ".vcf": VCF_FORMAT
+}
+# Compression of a file by extension. None lets pandas infer it.
+COMPRESSION_EXTENSIONS = {
+    ".gz": None,
+    ".bz2": None,
+    ".xz": None,
+    ".zst": None,
+    # bgzip files are gzip files made of independent blocks
+    ".bgz": "gzip"
+}
+# VCF files do not record the genome assembly. It must be hg38 in the
+# current release.
+VCF_GENOME_ASSEMBLY = "hg38"
+# Columns of a VCF record read: CHROM, POS, REF, ALT, INFO
+VCF_COLUMNS = [0, 1, 3, 4, 7]
+# Number of BGZF blocks, of at most 64KB each, being decompressed
+# ahead of the reader per thread
+BGZF_BLOCKS_PER_THREAD = 8
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise Exception("The pyarrow package is required to read " +
+                        f"{PARQUET_FORMAT} user score files. Install it " +
+                        "with: pip install pyarrow")
+    return pyarrow
+
+
+def user_scores_file_format(file_name: str) -> tuple[str, str]:
+    """
+    Returns the format of a user score file and its compression, see
+    pandas.read_csv, based on its extension.
+    """
+    base_name, extension = os.path.splitext(file_name.lower())
+    compression = "infer"
+    if extension in COMPRESSION_EXTENSIONS:
+        compression = COMPRESSION_EXTENSIONS[extension] or "infer"
+        extension = os.path.splitext(base_name)[1]
+    if extension not in FILE_EXTENSION_FORMATS:
+        raise Exception(
+            f"The format of {file_name} is not supported. Its extension " +
+            f"must be one of {list(FILE_EXTENSION_FORMATS.keys())}")
+    return FILE_EXTENSION_FORMATS[extension], compression
+
+
+def read_user_score_chunks(
+        file_name: str, column_name_map: dict = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE, vcf_info_key: str = None,
+        threads: int = None) -> Iterator[pd.DataFrame]:
+    """
+    Reads a user score file in chunks of rows.
+
+    Parameters
+    ----------
+    file_name : str
+        Path of the file
+    column_name_map : dict, optional
+        If the column names in the file are not the expected names,
+        maps them to the expected names. Not used for VCF files.
+    chunk_size : int, optional
+        Maximum number of rows of a chunk. For VCF files the number of
+        records, a chunk having more rows if records are split.
+    vcf_info_key : str, optional
+        Key of the INFO field holding the score in a VCF file.
+        Required for VCF files, see read_vcf_score_chunks.
+    threads : int, optional
+        Number of threads decompressing a bgzipped VCF file
+
+    Returns
+    -------
+    Iterator[DataFrame]
+        Chunks with the columns GENOME_ASSEMBLY, CHROMOSOME, POSITION,
+        REFERENCE_NUCLEOTIDE, ALTERNATE_NUCLEOTIDE, RANK_SCORE. Only
+        these columns are read from the file.
+    """
+    file_format, compression = user_scores_file_format(file_name)
+    if file_format == VCF_FORMAT:
+        if vcf_info_key is None:
+            raise Exception("The INFO key of the scores must be " +
+                            f"specified to read VCF file {file_name}")
+        yield from read_vcf_score_chunks(file_name, vcf_info_key,
+                                         chunk_size, threads)
+        return
+    file_columns = {column: column for column in USER_SCORE_COLUMNS}
+    for file_column, column in (column_name_map or {}).items():
+        if column in file_columns:
+            file_columns[column] = file_column
+    to_expected = {file_column: column for column, file_column
+                   in file_columns.items()}
+    dtypes = {file_columns[column]: dtype for column, dtype
+              in USER_SCORE_DTYPES.items()}
+    if file_format == PARQUET_FORMAT:
+        pa = _import_pyarrow()
+        parquet_file = pa.parquet.ParquetFile(file_name)
+        for batch in parquet_file.iter_batches(
+                batch_size=chunk_size, columns=list(to_expected.keys())):
+            yield batch.to_pandas().astype(dtypes).rename(
+                columns=to_expected)[USER_SCORE_COLUMNS]
+    else:
+        with pd.read_csv(file_name,
+                         sep="\t" if file_format == TSV_FORMAT else ",",
+                         usecols=list(to_expected.keys()), dtype=dtypes,
+                         compression=compression,
+                         chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield chunk.rename(columns=to_expected)[USER_SCORE_COLUMNS]
+
+
+def _bgzf_block_size(header: bytes, extra: bytes) -> int:
+    """
+    Returns the total size of a BGZF block from its gzip header and
+    extra field, which holds it in a BC subfield, or None if the block
+    has no BC subfield, i.e. the file is a plain gzip file.
+    """
+    position = 0
+    while position + 4 <= len(extra):
+        subfield_id = extra[position:position + 2]
+        length, = struct.unpack("<H", extra[position + 2:position + 4])
+        if subfield_id == b"BC" and length == 2:
+            block_size, = struct.unpack(
+                "<H", extra[position + 4:position + 6])
+            return block_size + 1
+        position += 4 + length
+    return None
+
+
+def _inflate_bgzf_block(block: bytes) -> bytes:
+    data = zlib.decompress(block[:-8], wbits=-zlib.MAX_WBITS)
+    crc, size = struct.unpack("<II", block[-8:])
+    if size != len(data) or crc != zlib.crc32(data):
+        raise Exception("Corrupt BGZF block")
+    return data
+
+
+def is_bgzf_file(file_name: str) -> bool:
+    """True if file_name is compressed with bgzip"""
+    with open(file_name, "rb") as file:
+        header = file.read(12)
+        if len(header) < 12 or header[:4] != BGZF_MAGIC:
+            return False
+        extra_length, = struct.unpack("<H", header[10:12])
+        return _bgzf_block_size(header, file.read(extra_length)) is not None
+
+
+class BgzfReader(io.RawIOBase):
+    """
+    Binary stream of the decompressed content of a bgzipped file. The
+    compressed blocks are read in order and decompressed ahead of the
+    reader by a pool of threads, zlib releasing the GIL while it
+    inflates a block.
+    """
+
+    def __init__(self, file_name: str, threads: int = None):
+        super().__init__()
+        self._file = open(file_name, "rb")
+        self._threads = threads or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(self._threads)
+        self._pending = deque()
+        self._buffer = b""
+        self._offset = 0
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _read_block(self) -> bytes:
+        header = self._file.read(12)
+        if len(header) == 0:
+            return None
+        extra_length, = struct.unpack("<H", header[10:12])
+        extra = self._file.read(extra_length)
+        block_size = _bgzf_block_size(header, extra)
+        if header[:4] != BGZF_MAGIC or block_size is None:
+            raise Exception("Not a BGZF block")
+        # Deflate data followed by the CRC32 and uncompressed size
+        return self._file.read(block_size - 12 - extra_length)
+
+    def _fill(self):
+        while (not self._eof and len(self._pending) <
+               self._threads * BGZF_BLOCKS_PER_THREAD):
+            block = self._read_block()
+            if block is None:
+                self._eof = True
+            else:
+                self._pending.append(
+                    self._executor.submit(_inflate_bgzf_block, block))
+        if self._pending:
+            self._buffer = self._pending.popleft().result()
+            self._offset = 0
+
+    def readinto(self, buffer) -> int:
+        if self._offset >= len(self._buffer):
+            self._fill()
+            # Skip the empty blocks, e.g. the end of file marker
+            while (self._offset >= len(self._buffer) and
+                   (self._pending or not self._eof)):
+                self._fill()
+        size = min(len(buffer), len(self._buffer) - self._offset)
+        buffer[:size] = self._buffer[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._executor.shutdown(cancel_futures=True)
+            self._file.close()
+        super().close()
+
+
+def open_vcf(file_name: str, threads: int = None) -> io.BufferedIOBase:
+    """
+    Opens a plain, gzipped or bgzipped VCF file for binary reading
+    positioned after its header lines.
+    """
+    with open(file_name, "rb") as file:
+        gzipped = file.read(2) == b"\x1f\x8b"
+    if gzipped and is_bgzf_file(file_name):
+        stream = io.BufferedReader(BgzfReader(file_name, threads),
+                                   1024 * 1024)
+    elif gzipped:
+        stream = gzip.open(file_name, "rb")
+    else:
+        stream = open(file_name, "rb", buffering=1024 * 1024)
+    while stream.peek(1)[:1] == b"#":
+        stream.readline()
+    return stream
+
+
+def _split_alleles(vcf_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Splits the records of multi-allelic variants into one row per
+    alternate allele. A score with one value per allele, i.e. an INFO
+    key with Number=A, is split with them, any other score is given to
+    every allele.
+    """
+    multi_allelic = vcf_df["ALTERNATE_NUCLEOTIDE"].str.contains(
+        ",", regex=False).to_numpy()
+    if not multi_allelic.any():
+        return vcf_df
+    multi_df = vcf_df[multi_allelic]
+    alleles = multi_df["ALTERNATE_NUCLEOTIDE"].str.split(",")
+    scores = [values if len(values) == len(allele_list)
+              else [values[0]] * len(allele_list)
+              for allele_list, values in zip(
+                  alleles, multi_df["RANK_SCORE"].fillna("").str.split(","))]
+    multi_df = multi_df.assign(ALTERNATE_NUCLEOTIDE=alleles,
+                               RANK_SCORE=scores).explode(
+        ["ALTERNATE_NUCLEOTIDE", "RANK_SCORE"])
+    return pd.concat([vcf_df[~multi_allelic], multi_df]).sort_index(
+        kind="stable")
+
+
+def read_vcf_score_chunks(
+        file_name: str, info_key: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        threads: int = None) -> Iterator[pd.DataFrame]:
+    """
+    Reads the scores of the variants of a VCF file in chunks of
+    records.
+
+    Parameters
+    ----------
+    file_name : str
+        Path of a plain, gzipped or bgzipped VCF file
+    info_key : str
+        Key of the INFO field holding the score, e.g. REVEL for
+        REVEL=0.53. It may have one value per alternate allele.
+    chunk_size : int, optional
+        Number of records read at a time
+    threads : int, optional
+        Number of threads decompressing a bgzipped file. Defaults to
+        the number of cpus.
+
+    Returns
+    -------
+    Iterator[DataFrame]
+        Chunks with the columns GENOME_ASSEMBLY, CHROMOSOME, POSITION,
+        REFERENCE_NUCLEOTIDE, ALTERNATE_NUCLEOTIDE, RANK_SCORE, one row
+        per alternate allele. A chr prefix of the chromosome is
+        removed. Alleles without a numeric score are left out.
+    """
+    info_pattern = f"(?:^|;){re.escape(info_key)}=([^;]*)"
+    with open_vcf(file_name, threads) as stream, pd.read_csv(
+            stream, sep="\t", header=None, usecols=VCF_COLUMNS, dtype=str,
+            na_filter=False, quoting=csv.QUOTE_NONE,
+            chunksize=chunk_size) as reader:
+        for chunk in reader:
+            vcf_df = pd.DataFrame({
+                "CHROMOSOME": chunk[0].str.removeprefix("chr"),
+                "POSITION": chunk[1].astype(np.int64),
+                "REFERENCE_NUCLEOTIDE": chunk[3],
+                "ALTERNATE_NUCLEOTIDE": chunk[4],
+                "RANK_SCORE": chunk[7].str.extract(info_pattern,
+                                                   expand=False)})
+            vcf_df = _split_alleles(vcf_df)
+            vcf_df["RANK_SCORE"] = pd.to_numeric(vcf_df["RANK_SCORE"],
+                                                 errors="coerce")
+            vcf_df = vcf_df[vcf_df["RANK_SCORE"].notna()]
+            vcf_df.insert(0, "GENOME_ASSEMBLY", VCF_GENOME_ASSEMBLY)
+            yield vcf_df[USER_SCORE_COLUMNS].reset_index(drop=True)
@@ -13,18 +13,50 @@ class ParameterizedSingleton:
     method instead of the normal __init__ method for initialization.
     It takes same parameters as __init__ method. By inheriting from this
     class all instantiations of the subclass will return the same instance.
+
+    A subclass may override _instance_key to maintain one instance per
+    distinct key computed from the initialization parameters rather than
+    a single instance.
     """
-    _instance = None
-    _lock = threading.Lock()
+    # Reentrant as the _init_once of one singleton may create another
+    _lock = threading.RLock()
 
     def __new__(cls, *args, **kwargs):
-        if cls._instance is None:
+        key = cls._instance_key(*args, **kwargs)
+        instances = cls._class_instances()
+        if key not in instances:
             with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super(ParameterizedSingleton,
-                                          cls).__new__(cls)
-                    cls._instance._init_once(*args, **kwargs)
-        return cls._instance
+                if key not in instances:
+                    instance = super(ParameterizedSingleton,
+                                     cls).__new__(cls)
+                    instance._init_once(*args, **kwargs)
+                    instances[key] = instance
+        return instances[key]
+
+    @classmethod
+    def _instance_key(cls, *args, **kwargs):
+        """
+        Returns the key identifying the instance to be returned for
+        the initialization parameters. By default there is a single
+        instance.
+        """
+        return None
+
+    @classmethod
+    def _class_instances(cls) -> dict:
+        # Each subclass has its own dict of instances
+        if "_instances" not in cls.__dict__:
+            with cls._lock:
+                if "_instances" not in cls.__dict__:
+                    cls._instances = dict()
+        return cls.__dict__["_instances"]
+
+    @classmethod
+    def instances(cls) -> list:
+        """
+        Returns the instances of the class created so far.
+        """
+        return list(cls._class_instances().values())
 
 
 class Config:
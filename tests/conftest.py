@@ -1,11 +1,27 @@
+import os
+import shutil
 import pytest
 import random
 import context  # noqa: F401
 from aigct.container import VEBenchmarkContainer
 from aigct.repository import (
-    VARIANT_PK_COLUMNS
+    VARIANT_PK_COLUMNS,
+    invalidate_caches
 )
 
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+@pytest.fixture
+def repo_copy(tmp_path):
+    """Copy of the repository data directory that tests may modify"""
+    shutil.copytree(os.path.join(REPO_ROOT, "data"),
+                    os.path.join(tmp_path, "data"))
+    yield str(tmp_path)
+    # Drop the tables cached from the copy so that they do not show up
+    # in the memory reports of later tests
+    invalidate_caches()
+
 
 @pytest.fixture
 def ve_bm_container():
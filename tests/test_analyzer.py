@@ -1,9 +1,14 @@
+import pandas as pd
+import pytest
 import context  # noqa: F401
 from aigct.analyzer import VEAnalyzer
 from aigct.model import VEQueryCriteria
 from aigct.query import VEBenchmarkQueryMgr
 from aigct.reporter import VEAnalysisReporter
 from aigct.pd_util import filter_dataframe_by_list
+from aigct.metrics import sort_scores, partition_sources
+from aigct.repository import VARIANT_KEY_COLUMN
+from sklearn.metrics import roc_auc_score
 
 # from aigct.model import VariantId  # noqa: F401
 
@@ -205,3 +210,122 @@ def test_compute_metrics_sys_veps_only(
     ve_reporter.write_summary(metrics)
 
 
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_compute_metrics_executor(ve_bm_container, ve_analyzer,
+                                  sample_user_scores, executor):
+    parallel_analyzer = VEAnalyzer(
+        ve_bm_container._score_repo, ve_bm_container._label_repo,
+        ve_bm_container._variant_effect_source_repo,
+        ve_bm_container._variant_repo, executor, 3)
+    metrics = ve_analyzer.compute_metrics("CANCER", sample_user_scores)
+    parallel_metrics = parallel_analyzer.compute_metrics(
+        "CANCER", sample_user_scores)
+    for attr in ["general_metrics", "roc_metrics", "pr_metrics",
+                 "mwu_metrics", "roc_curve_coordinates",
+                 "pr_curve_coordinates"]:
+        pd.testing.assert_frame_equal(getattr(parallel_metrics, attr),
+                                      getattr(metrics, attr))
+
+
+def test_compute_metrics_bootstrap(ve_bm_container, ve_analyzer,
+                                   sample_user_scores):
+    metrics = ve_analyzer.compute_metrics(
+        "CANCER", sample_user_scores, bootstrap_resamples=200)
+    roc_metrics = metrics.roc_metrics.dropna(subset="ROC_AUC")
+    assert (roc_metrics["ROC_AUC_CI_LOWER"] <= roc_metrics["ROC_AUC"]).all()
+    assert (roc_metrics["ROC_AUC_CI_UPPER"] >= roc_metrics["ROC_AUC"]).all()
+    pr_metrics = metrics.pr_metrics
+    assert (pr_metrics["PR_AUC_CI_LOWER"] <
+            pr_metrics["PR_AUC_CI_UPPER"]).all()
+    # The resamples of a vep do not depend on how the veps are split
+    # between the workers
+    parallel_analyzer = VEAnalyzer(
+        ve_bm_container._score_repo, ve_bm_container._label_repo,
+        ve_bm_container._variant_effect_source_repo,
+        ve_bm_container._variant_repo, "thread", 3)
+    parallel_metrics = parallel_analyzer.compute_metrics(
+        "CANCER", sample_user_scores, bootstrap_resamples=200)
+    pd.testing.assert_frame_equal(parallel_metrics.roc_metrics,
+                                  metrics.roc_metrics)
+    pd.testing.assert_frame_equal(parallel_metrics.pr_metrics,
+                                  metrics.pr_metrics)
+
+
+def test_compare_veps(ve_analyzer, sample_user_scores):
+    sources = ["REVEL", "ALPHAM", "EVE"]
+    comparison_df = ve_analyzer.compare_veps(
+        "CANCER", sample_user_scores, variant_effect_sources=sources)
+    assert len(comparison_df) == 6
+    assert (comparison_df["SCORE_SOURCE_2"] != "USER").all()
+    assert comparison_df["DELONG_PVAL"].between(0, 1).all()
+    # AUCs are those of the variants scored by every vep
+    scores_labels_df = ve_analyzer.get_analysis_scores_and_labels(
+        "CANCER", sample_user_scores, variant_effect_sources=sources,
+        include_variant_effect_sources=True)
+    wide_df = scores_labels_df.pivot(
+        index=VARIANT_KEY_COLUMN, columns="SCORE_SOURCE",
+        values="RANK_SCORE").dropna()
+    labels = scores_labels_df.groupby(VARIANT_KEY_COLUMN)[
+        "BINARY_LABEL"].first()[wide_df.index]
+    assert (comparison_df["NUM_VARIANTS"] == len(wide_df)).all()
+    for _, row in comparison_df.iterrows():
+        for suffix in ["_1", "_2"]:
+            assert row["ROC_AUC" + suffix] == pytest.approx(roc_auc_score(
+                labels, wide_df[row["SCORE_SOURCE" + suffix]]))
+
+
+def test_partition_sources(ve_analyzer, sample_user_scores):
+    scores_labels_df = ve_analyzer.get_analysis_scores_and_labels(
+        "CANCER", sample_user_scores, include_variant_effect_sources=True)
+    sorted_scores = sort_scores(scores_labels_df["SCORE_SOURCE"],
+                                scores_labels_df["RANK_SCORE"],
+                                scores_labels_df["BINARY_LABEL"])
+    parts = partition_sources(sorted_scores, 4)
+    assert len(parts) <= 4
+    assert parts[0][0] == 0 and parts[-1][1] == sorted_scores.num_sources
+    for (_, last), (first, _) in zip(parts[:-1], parts[1:]):
+        assert last == first
+    subset = sorted_scores.subset(*parts[-1])
+    assert subset.sources == sorted_scores.sources[parts[-1][0]:]
+    assert subset.starts[0] == 0
+    assert subset.ends[-1] == len(subset.codes)
+
+
+METRIC_RESULT_ATTRS = ["general_metrics", "roc_metrics", "pr_metrics",
+                       "mwu_metrics", "roc_curve_coordinates",
+                       "pr_curve_coordinates", "variants_included"]
+
+
+def test_update_user_metrics(ve_analyzer, sample_user_scores, monkeypatch):
+    params = dict(metrics=["roc", "pr", "mwu"], vep_min_overlap_percent=50,
+                  list_variants=True, bootstrap_resamples=100)
+    previous = ve_analyzer.compute_metrics("CANCER", sample_user_scores,
+                                           **params)
+    changed_scores = sample_user_scores.iloc[:20].assign(
+        RANK_SCORE=lambda df: 1 - df["RANK_SCORE"])
+    expected = ve_analyzer.compute_metrics(
+        "CANCER", pd.concat([changed_scores, sample_user_scores.iloc[20:]]),
+        **params)
+
+    def fail(*args):
+        raise AssertionError("scores and labels joined again")
+    # Only the user vep metrics are recomputed
+    monkeypatch.setattr(ve_analyzer, "_join_scores_and_labels", fail)
+    updated = ve_analyzer.update_user_metrics(previous, changed_scores)
+    for attr in METRIC_RESULT_ATTRS:
+        pd.testing.assert_frame_equal(getattr(updated, attr),
+                                      getattr(expected, attr))
+    assert updated.num_variants_included == expected.num_variants_included
+
+
+def test_update_user_metrics_new_variants(ve_analyzer, sample_user_scores):
+    previous = ve_analyzer.compute_metrics(
+        "CANCER", sample_user_scores.iloc[100:], list_variants=True)
+    new_scores = sample_user_scores.iloc[:100]
+    expected = ve_analyzer.compute_metrics(
+        "CANCER", pd.concat([sample_user_scores.iloc[100:], new_scores]),
+        list_variants=True)
+    updated = ve_analyzer.update_user_metrics(previous, new_scores)
+    for attr in METRIC_RESULT_ATTRS:
+        pd.testing.assert_frame_equal(getattr(updated, attr),
+                                      getattr(expected, attr))
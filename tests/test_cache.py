@@ -0,0 +1,275 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import context  # noqa: F401
+from aigct.model import VEQueryCriteria
+from aigct.repository import (
+    AlleleFrequencyIndex,
+    GeneIndex,
+    VariantBitmap,
+    RepoSessionContext,
+    TABLE_DEFS,
+    VARIANT_KEY_COLUMN,
+    ScoreMatrixCache,
+    VariantEffectLabelCache,
+    VariantEffectScoreCache,
+    VariantTaskCache,
+    VariantTaskRepository,
+    VariantFilterRepository,
+    VariantRepository,
+    VariantEffectLabelRepository,
+    VariantEffectScoreRepository,
+    VariantQueryPlanner,
+    cache_memory_report,
+    convert_repository,
+    invalidate_caches,
+    query_by_filter
+)
+
+NEW_TASK_ROW = "NEW,New task,New task\n"
+
+
+def test_cache_per_repository(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    other_context = RepoSessionContext(repo_copy, TABLE_DEFS, "parquet")
+    assert VariantTaskCache(session_context) is VariantTaskCache(
+        RepoSessionContext(repo_copy, TABLE_DEFS))
+    assert VariantTaskCache(session_context) is not VariantTaskCache(
+        other_context)
+
+
+def test_cache_reloaded_when_file_changes(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    cache = VariantTaskCache(session_context)
+    num_tasks = len(cache.data_frame)
+    version = cache.version
+    with open(session_context.table_file("VARIANT_TASK"), "a") as task_file:
+        task_file.write(NEW_TASK_ROW)
+    assert len(cache.data_frame) == num_tasks + 1
+    assert cache.version != version
+
+
+def test_invalidate_caches(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    cache = VariantEffectLabelCache(session_context)
+    cache.get_data_frame("CANCER")
+    report_df = cache_memory_report(session_context)
+    assert list(report_df["TABLE_NAME"]) == ["VARIANT_EFFECT_LABEL"]
+    invalidate_caches(session_context)
+    assert len(cache_memory_report(session_context)) == 0
+    assert len(cache.get_data_frame("CANCER")) > 0
+
+
+def test_cache_budget_evicts_least_recently_used(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS,
+                                         cache_max_bytes=1)
+    label_cache = VariantEffectLabelCache(session_context)
+    score_cache = VariantEffectScoreCache(session_context)
+    label_cache.get_data_frame("CANCER")
+    score_cache.get_data_frame("CANCER")
+    report_df = cache_memory_report(session_context)
+    assert list(report_df["TABLE_NAME"]) == ["VARIANT_EFFECT_SCORE"]
+    assert len(label_cache.get_data_frame("CANCER")) > 0
+    report_df = cache_memory_report(session_context)
+    assert list(report_df["TABLE_NAME"]) == ["VARIANT_EFFECT_LABEL"]
+
+
+def test_get_all_result_independent_of_cache(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    task_repo = VariantTaskRepository(session_context)
+    task_df = task_repo.get_all()
+    task_df.loc[0, "NAME"] = "Modified"
+    task_df["NEW_COLUMN"] = 1
+    cached_df = VariantTaskCache(session_context).data_frame
+    assert cached_df.loc[0, "NAME"] != "Modified"
+    assert "NEW_COLUMN" not in cached_df.columns
+
+
+def test_score_matrix(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    score_df = VariantEffectScoreCache(session_context).get_data_frame(
+        "CANCER")
+    label_ids = VariantEffectLabelCache(session_context).get_data_frame(
+        "CANCER")[VARIANT_KEY_COLUMN]
+    score_df = score_df[score_df[VARIANT_KEY_COLUMN].isin(label_ids)]
+    cache = ScoreMatrixCache(session_context)
+    matrix = cache.get_score_matrix("CANCER")
+    assert list(matrix.sources) == sorted(score_df["SCORE_SOURCE"].unique())
+    assert (~np.isnan(matrix.scores)).sum() == len(score_df)
+    row = matrix.row_positions(score_df[VARIANT_KEY_COLUMN].iloc[:1])
+    column = matrix.column_positions([score_df["SCORE_SOURCE"].iloc[0]])
+    assert matrix.scores[row[0], column[0]] == score_df["RANK_SCORE"].iloc[0]
+    assert len(matrix.column_positions(
+        [score_df["SCORE_SOURCE"].iloc[0]], False)) == \
+        len(matrix.sources) - 1
+    assert len(matrix.row_positions([-1])) == 0
+    assert cache.get_score_matrix("CANCER") is matrix
+    # Not reported as a table
+    assert set(cache_memory_report(session_context)["TABLE_NAME"]) <= \
+        set(TABLE_DEFS)
+    # Rebuilt when the label table changes
+    label_file = session_context.table_file("VARIANT_EFFECT_LABEL",
+                                            "CANCER")
+    with open(label_file) as file:
+        lines = file.readlines()
+    with open(label_file, "w") as file:
+        file.writelines(lines[:len(lines) // 2])
+    assert len(cache.get_score_matrix("CANCER")) < len(matrix)
+
+
+def test_gene_index():
+    gene_index = GeneIndex(["B", "A", None, "B", "C", np.nan, "A"])
+    assert list(gene_index.rows(["A", "B"])) == [0, 1, 3, 6]
+    assert list(gene_index.rows(["B", "X"], include=False)) == [1, 2, 4, 5,
+                                                                6]
+    assert len(gene_index.rows([])) == 0
+    assert len(gene_index.rows([], include=False)) == len(gene_index)
+
+
+def test_gene_criteria_indexed(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    variant_repo = VariantRepository(session_context)
+    label_repo = VariantEffectLabelRepository(
+        session_context, variant_repo, VariantFilterRepository(
+            session_context))
+    for include_genes in [True, False]:
+        qry = VEQueryCriteria(gene_symbols=["MTOR", "PTEN", "TP53"],
+                              include_genes=include_genes,
+                              allele_frequency=0.001,
+                              allele_frequency_operator="<")
+        variant_df = variant_repo.get_all()
+        expected_df = variant_df[
+            variant_df["GENE_SYMBOL"].isin(qry.gene_symbols) ==
+            include_genes].query("ALLELE_FREQUENCY < 0.001")
+        pd.testing.assert_frame_equal(variant_repo.get(qry), expected_df)
+        label_df = label_repo.get("CANCER", qry)
+        assert (label_df["GENE_SYMBOL"].isin(qry.gene_symbols) ==
+                include_genes).all()
+        assert label_df[VARIANT_KEY_COLUMN].isin(
+            expected_df[VARIANT_KEY_COLUMN]).all()
+
+
+def test_allele_frequency_index():
+    frequency_index = AlleleFrequencyIndex(pd.DataFrame({
+        "ALLELE_FREQUENCY": [0.5, 1e-5, np.nan, 1e-4, 0.01, 1e-5],
+        "ALLELE_FREQUENCY_SOURCE": ["A", "B", "A", "A", None, "A"]}))
+    assert list(frequency_index.rows(maximum=1e-4,
+                                     maximum_inclusive=False)) == [1, 5]
+    assert list(frequency_index.rows(1e-4, 0.5)) == [0, 3, 4]
+    assert list(frequency_index.rows(1e-4, 0.5, False, False)) == [4]
+    assert list(frequency_index.rows(sources=["A", "X"])) == [0, 3, 5]
+    assert list(frequency_index.rows(maximum=1e-4, sources=["B"])) == [1]
+
+
+@pytest.mark.parametrize("criteria,condition", [
+    ({"allele_frequency_max": 1e-4, "allele_frequency_max_inclusive": False},
+     "ALLELE_FREQUENCY < 1e-4"),
+    ({"allele_frequency_min": 1e-6, "allele_frequency_max": 1e-3},
+     "ALLELE_FREQUENCY >= 1e-6 and ALLELE_FREQUENCY <= 1e-3"),
+    ({"allele_frequency": 1e-5, "allele_frequency_operator": ">",
+      "allele_frequency_max": 1e-2},
+     "ALLELE_FREQUENCY > 1e-5 and ALLELE_FREQUENCY <= 1e-2"),
+    ({"allele_frequency": 1e-5, "allele_frequency_operator": "!=",
+      "gene_symbols": ["MTOR", "PTEN"]},
+     "ALLELE_FREQUENCY != 1e-5 and GENE_SYMBOL in ['MTOR', 'PTEN']"),
+    ({"allele_frequency": 0, "allele_frequency_operator": "!="},
+     "ALLELE_FREQUENCY != 0")])
+def test_allele_frequency_criteria_indexed(repo_copy, criteria, condition):
+    variant_repo = VariantRepository(RepoSessionContext(repo_copy,
+                                                        TABLE_DEFS))
+    variant_df = variant_repo.get_all()
+    sources = list(variant_df["ALLELE_FREQUENCY_SOURCE"].dropna().unique())
+    for qry in [VEQueryCriteria(**criteria),
+                VEQueryCriteria(**criteria,
+                                allele_frequency_sources=sources[:1])]:
+        expected_df = variant_df.query(condition)
+        if qry.allele_frequency_sources is not None:
+            expected_df = expected_df[expected_df[
+                "ALLELE_FREQUENCY_SOURCE"].isin(sources[:1])]
+        pd.testing.assert_frame_equal(variant_repo.get(qry), expected_df)
+
+
+def test_allele_frequency_source_criteria(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    variant_file = session_context.table_file("VARIANT")
+    variant_df = pd.read_csv(variant_file)
+    # A variant with an allele frequency source but no allele frequency
+    sourced = variant_df["ALLELE_FREQUENCY_SOURCE"].notna()
+    variant_df.loc[sourced.idxmax(), "ALLELE_FREQUENCY"] = np.nan
+    variant_df.to_csv(variant_file, index=False)
+    source = variant_df.loc[sourced.idxmax(), "ALLELE_FREQUENCY_SOURCE"]
+    qry = VEQueryCriteria(allele_frequency_sources=[source])
+    convert_repository(repo_copy, "parquet")
+    variant_repo = VariantRepository(RepoSessionContext(
+        repo_copy, TABLE_DEFS, "parquet"))
+    # Pushed down to the storage read until the variants are cached
+    stored_df = variant_repo.get(qry)
+    variant_repo.get_all()
+    indexed_df = variant_repo.get(qry)
+    assert list(stored_df[VARIANT_KEY_COLUMN]) == \
+        list(indexed_df[VARIANT_KEY_COLUMN])
+    assert indexed_df["ALLELE_FREQUENCY"].isna().any()
+    assert len(indexed_df) == (variant_df["ALLELE_FREQUENCY_SOURCE"] ==
+                               source).sum()
+
+
+def test_query_plan(repo_copy, monkeypatch):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    variant_repo = VariantRepository(session_context)
+    filter_repo = VariantFilterRepository(session_context)
+    planner = VariantQueryPlanner(session_context, variant_repo, filter_repo)
+    qry = VEQueryCriteria(filter_name="Oncogene",
+                          gene_symbols=["MTOR", "PTEN"], include_genes=False)
+    plan = planner.plan("CANCER", qry)
+    label_df = VariantEffectLabelRepository(
+        session_context, variant_repo, filter_repo).get("CANCER", qry)
+    assert plan.matches(label_df[VARIANT_KEY_COLUMN]).all()
+    assert not label_df["GENE_SYMBOL"].isin(["MTOR", "PTEN"]).any()
+    score_df = VariantEffectScoreRepository(
+        session_context, variant_repo, filter_repo).get(
+            "CANCER", qry=qry, columns=[VARIANT_KEY_COLUMN, "RANK_SCORE"])
+    assert plan.matches(score_df[VARIANT_KEY_COLUMN]).all()
+    assert not plan.matches([-1, len(plan.mask)]).any()
+    # Compiled once for equal criteria, whichever repository asks
+    monkeypatch.setattr(variant_repo, "get", None)
+    assert planner.plan("CANCER", VEQueryCriteria(
+        filter_name="Oncogene", gene_symbols=["MTOR", "PTEN"],
+        include_genes=False)) is plan
+    monkeypatch.undo()
+    # Compiled again when the filter changes
+    filter_gene_file = session_context.table_file("VARIANT_FILTER_GENE",
+                                                  "CANCER")
+    mtime_ns = os.stat(filter_gene_file).st_mtime_ns + 1000000000
+    os.utime(filter_gene_file, ns=(mtime_ns, mtime_ns))
+    assert planner.plan("CANCER", qry) is not plan
+
+
+def test_variant_bitmap():
+    a = VariantBitmap.from_variant_ids([0, 2, 4], 5)
+    b = VariantBitmap.from_variant_ids([2, 3, 6], 7)
+    assert list((a & b).variant_ids) == [2]
+    assert list((a | b).variant_ids) == [0, 2, 3, 4, 6]
+    assert list((a - b).variant_ids) == [0, 4]
+    assert list((~a).variant_ids) == [1, 3]
+    assert len(a) == 3
+    assert list(b.matches([-1, 3, 6, 7])) == [False, True, True, False]
+
+
+def test_filter_bitmaps(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    variant_repo = VariantRepository(session_context)
+    filter_repo = VariantFilterRepository(session_context, variant_repo)
+    variant_df = variant_repo.get_all()
+    bitmaps = filter_repo.get_bitmaps("CANCER")
+    assert "Oncogene" in bitmaps
+    for filter_name, bitmap in bitmaps.items():
+        filter_dfs = filter_repo.get_by_task_filter_name("CANCER",
+                                                         filter_name)
+        expected_ids = query_by_filter(
+            variant_df, filter_dfs.filter, filter_dfs.filter_genes,
+            filter_dfs.filter_variants)[VARIANT_KEY_COLUMN]
+        assert list(bitmap.apply(variant_df)[VARIANT_KEY_COLUMN]) == \
+            list(expected_ids)
+    assert filter_repo.get_bitmap("CANCER", "No such filter") is None
+    assert filter_repo.get_bitmaps("CANCER") is bitmaps
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pandas as pd
+import context  # noqa: F401
+from aigct import mapped_cache
+from aigct.mapped_cache import (
+    is_current,
+    read_mapped_table,
+    write_mapped_table
+)
+from aigct.repository import (
+    RepoSessionContext,
+    TABLE_DEFS,
+    read_cached_table
+)
+
+
+def is_memory_mapped(values: np.ndarray) -> bool:
+    """True if values is a view of a memory mapped file, not a copy"""
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = values.base
+    return False
+
+
+def test_memory_mapped_table(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    mapped_context = RepoSessionContext(repo_copy, TABLE_DEFS,
+                                        memory_map=True)
+    score_df = read_cached_table(session_context, "VARIANT_EFFECT_SCORE",
+                                 "CANCER")
+    mapped_df = read_cached_table(mapped_context, "VARIANT_EFFECT_SCORE",
+                                  "CANCER")
+    folder = mapped_context.mapped_table_folder("VARIANT_EFFECT_SCORE",
+                                                "CANCER")
+    assert os.path.exists(os.path.join(folder, "manifest.json"))
+    assert is_memory_mapped(mapped_df["RANK_SCORE"].to_numpy())
+    assert list(mapped_df.columns) == list(score_df.columns)
+    for column in score_df.columns:
+        assert mapped_df[column].dtype == score_df[column].dtype
+        assert (mapped_df[column].astype(object).fillna(-1) ==
+                score_df[column].astype(object).fillna(-1)).all()
+    predicate_df = read_cached_table(
+        mapped_context, "VARIANT_EFFECT_SCORE", "CANCER",
+        ["SCORE_SOURCE", "RANK_SCORE"], [("SCORE_SOURCE", "=", "REVEL")])
+    assert len(predicate_df) == (score_df["SCORE_SOURCE"] == "REVEL").sum()
+
+
+def test_memory_mapped_table_rebuilt(repo_copy):
+    mapped_context = RepoSessionContext(repo_copy, TABLE_DEFS,
+                                        memory_map=True)
+    variant_df = read_cached_table(mapped_context, "VARIANT_TASK")
+    table_file = mapped_context.table_file("VARIANT_TASK")
+    with open(table_file, "a") as task_file:
+        task_file.write("NEW,New task,New task\n")
+    assert len(read_cached_table(mapped_context, "VARIANT_TASK")) == \
+        len(variant_df) + 1
+
+
+def test_write_mapped_table_race(tmp_path, monkeypatch):
+    source_file = os.path.join(tmp_path, "source.csv")
+    with open(source_file, "w") as file:
+        file.write("A\n1\n")
+    folder = os.path.join(tmp_path, "mapped", "table")
+    data_frame = pd.DataFrame({"A": [1, 2], "B": ["x", "y"]})
+    write_mapped_table(data_frame, folder, [source_file])
+    # Replacing an existing table
+    write_mapped_table(data_frame.assign(A=[3, 4]), folder, [source_file])
+    assert list(read_mapped_table(folder)["A"]) == [3, 4]
+
+    # Another process materializes a current table while this one writes
+    def replace_folder(new_folder, target_folder, old_folder):
+        raise OSError("Directory not empty")
+
+    monkeypatch.setattr(mapped_cache, "_replace_folder", replace_folder)
+    write_mapped_table(data_frame, folder, [source_file])
+    assert is_current(folder, [source_file])
+    assert sorted(os.listdir(os.path.dirname(folder))) == ["table"]
@@ -0,0 +1,161 @@
+import zlib
+import numpy as np
+import pytest
+import context  # noqa: F401
+from sklearn.metrics import (
+    roc_curve,
+    roc_auc_score,
+    precision_recall_curve,
+    auc
+)
+from scipy import stats
+from aigct.metrics import (
+    SAME_LABEL_ROC_EXCEPTION,
+    SAME_LABEL_MWU_EXCEPTION,
+    sort_scores,
+    roc_curves,
+    pr_curves,
+    mann_whitney_u,
+    BootstrapOptions,
+    bootstrap_auc_intervals,
+    delong_covariance,
+    delong_pairwise_tests
+)
+
+
+@pytest.fixture
+def scores_labels():
+    rng = np.random.default_rng(0)
+    num_scores = 3000
+    sources = rng.choice(["A", "B", "C", "D"], num_scores)
+    # Rounding creates ties
+    scores = np.round(rng.uniform(size=num_scores), 2)
+    labels = rng.integers(0, 2, num_scores)
+    labels[sources == "D"] = 1
+    return sources, scores, labels
+
+
+def test_roc_curves(scores_labels):
+    sources, scores, labels = scores_labels
+    sorted_scores = sort_scores(sources, scores, labels)
+    aucs, exceptions, codes, fprs, tprs, thresholds = roc_curves(
+        sorted_scores)
+    for code, source in enumerate(sorted_scores.sources):
+        mask = sources == source
+        if source == "D":
+            assert np.isnan(aucs[code])
+            assert exceptions[code] == SAME_LABEL_ROC_EXCEPTION
+            assert not (codes == code).any()
+            continue
+        fpr, tpr, threshold = roc_curve(labels[mask], scores[mask])
+        np.testing.assert_array_equal(fprs[codes == code], fpr)
+        np.testing.assert_array_equal(tprs[codes == code], tpr)
+        np.testing.assert_array_equal(thresholds[codes == code], threshold)
+        assert aucs[code] == pytest.approx(
+            roc_auc_score(labels[mask], scores[mask]), abs=1e-12)
+
+
+def test_pr_curves(scores_labels):
+    sources, scores, labels = scores_labels
+    sorted_scores = sort_scores(sources, scores, labels)
+    aucs, codes, precisions, recalls, thresholds = pr_curves(sorted_scores)
+    for code, source in enumerate(sorted_scores.sources):
+        mask = sources == source
+        precision, recall, threshold = precision_recall_curve(
+            labels[mask], scores[mask])
+        np.testing.assert_allclose(precisions[codes == code],
+                                   precision[:-1])
+        np.testing.assert_allclose(recalls[codes == code], recall[:-1])
+        np.testing.assert_array_equal(thresholds[codes == code], threshold)
+        assert aucs[code] == pytest.approx(auc(recall, precision),
+                                           abs=1e-12)
+
+
+def test_mann_whitney_u(scores_labels):
+    sources, scores, labels = scores_labels
+    # Source E has no ties and few positives, which scipy computes
+    # exactly rather than with the normal approximation.
+    sources = np.concatenate([sources, ["E"] * 40])
+    scores = np.concatenate([scores, np.linspace(0, 1, 40)])
+    labels = np.concatenate([labels, [1] * 5 + [0] * 35])
+    sorted_scores = sort_scores(sources, scores, labels)
+    u_statistics, pvalues, exceptions = mann_whitney_u(sorted_scores)
+    for code, source in enumerate(sorted_scores.sources):
+        mask = sources == source
+        if source == "D":
+            assert np.isnan(pvalues[code])
+            assert exceptions[code] == SAME_LABEL_MWU_EXCEPTION
+            continue
+        expected = stats.mannwhitneyu(scores[mask & (labels == 0)],
+                                      scores[mask & (labels == 1)])
+        assert u_statistics[code] == pytest.approx(expected.statistic)
+        assert pvalues[code] == pytest.approx(expected.pvalue, rel=1e-9)
+
+
+def test_bootstrap_auc_intervals(scores_labels):
+    sources, scores, labels = scores_labels
+    sorted_scores = sort_scores(sources, scores, labels)
+    options = BootstrapOptions(200, 0.9, seed=7)
+    roc_lower, roc_upper, pr_lower, pr_upper = bootstrap_auc_intervals(
+        sorted_scores, options)
+    for code, source in enumerate(sorted_scores.sources):
+        if source == "D":
+            assert np.isnan([roc_lower[code], roc_upper[code],
+                             pr_lower[code], pr_upper[code]]).all()
+            continue
+        # Same resamples computed one at a time with sklearn
+        source_slice = slice(sorted_scores.starts[code],
+                             sorted_scores.ends[code])
+        source_scores = sorted_scores.scores[source_slice]
+        source_labels = sorted_scores.labels[source_slice]
+        rng = np.random.default_rng([7, zlib.crc32(source.encode())])
+        draws = rng.integers(0, len(source_scores),
+                             size=(200, len(source_scores)))
+        roc_aucs = []
+        pr_aucs = []
+        for draw in draws:
+            precision, recall, _ = precision_recall_curve(
+                source_labels[draw], source_scores[draw])
+            roc_aucs.append(roc_auc_score(source_labels[draw],
+                                          source_scores[draw]))
+            pr_aucs.append(auc(recall, precision))
+        np.testing.assert_allclose(
+            [roc_lower[code], roc_upper[code]],
+            np.quantile(roc_aucs, [0.05, 0.95]), atol=1e-12)
+        np.testing.assert_allclose(
+            [pr_lower[code], pr_upper[code]],
+            np.quantile(pr_aucs, [0.05, 0.95]), atol=1e-12)
+
+
+def test_delong():
+    rng = np.random.default_rng(1)
+    labels = rng.integers(0, 2, 300)
+    scores = np.round(rng.normal(size=(4, 300)) +
+                      labels * np.array([[0.2], [0.5], [0.5], [1.0]]), 1)
+    aucs, covariance = delong_covariance(scores, labels)
+    # Covariance of the structural components computed pairwise
+    positives = scores[:, labels == 1]
+    negatives = scores[:, labels == 0]
+    comparisons = ((positives[:, :, None] > negatives[:, None, :]) +
+                   0.5 * (positives[:, :, None] == negatives[:, None, :]))
+    expected = (np.cov(comparisons.mean(axis=2)) / positives.shape[1] +
+                np.cov(comparisons.mean(axis=1)) / negatives.shape[1])
+    np.testing.assert_allclose(covariance, expected, atol=1e-15)
+    np.testing.assert_allclose(
+        aucs, [roc_auc_score(labels, source_scores)
+               for source_scores in scores])
+    first, second, differences, z_scores, pvalues = delong_pairwise_tests(
+        aucs, covariance)
+    assert list(zip(first, second)) == [(0, 1), (0, 2), (0, 3), (1, 2),
+                                        (1, 3), (2, 3)]
+    np.testing.assert_allclose(differences, aucs[first] - aucs[second])
+    assert pvalues[2] < 0.001 and pvalues[0] > 0.05
+
+
+def test_empty_scores():
+    sorted_scores = sort_scores([], [], [])
+    assert len(roc_curves(sorted_scores)[0]) == 0
+    assert len(pr_curves(sorted_scores)[0]) == 0
+    assert len(mann_whitney_u(sorted_scores)[0]) == 0
+    assert len(bootstrap_auc_intervals(sorted_scores,
+                                       BootstrapOptions(10))[0]) == 0
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+import context  # noqa: F401
+from aigct.pd_util import (
+    concatenate_ranges,
+    filter_dataframe_by_list,
+    filter_dataframe_by_predicates
+)
+
+
+def merge_filter(data_frame, filter_df, columns, filter_columns, in_list):
+    """Reference implementation of filter_dataframe_by_list as a merge"""
+    filter_df = filter_df[filter_columns].drop_duplicates()
+    if in_list:
+        return data_frame.merge(filter_df, left_on=columns,
+                                right_on=filter_columns,
+                                how="inner")[data_frame.columns]
+    merged_df = data_frame.merge(filter_df, left_on=columns,
+                                 right_on=filter_columns, how="left",
+                                 indicator=True)
+    return merged_df.query("_merge == 'left_only'")[data_frame.columns]
+
+
+@pytest.fixture
+def data_frame():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "CHROMOSOME": rng.choice(["1", "2", "X", None], 500),
+        "POSITION": rng.integers(0, 20, 500),
+        "SCORE": rng.uniform(size=500)})
+
+
+@pytest.mark.parametrize("in_list", [True, False])
+def test_filter_by_dataframe(data_frame, in_list):
+    filter_df = pd.DataFrame({
+        "CHROM": ["1", "X", None, "1", "Y"],
+        "POS": [3, 5, 7, 3, 1]})
+    column_map = {"CHROMOSOME": "CHROM", "POSITION": "POS"}
+    filtered_df = filter_dataframe_by_list(
+        data_frame, filter_df, ["CHROMOSOME", "POSITION"], column_map,
+        in_list)
+    expected_df = merge_filter(data_frame, filter_df,
+                               ["CHROMOSOME", "POSITION"], ["CHROM", "POS"],
+                               in_list)
+    pd.testing.assert_frame_equal(filtered_df, expected_df)
+
+
+@pytest.mark.parametrize("in_list", [True, False])
+def test_filter_by_list(data_frame, in_list):
+    filtered_df = filter_dataframe_by_list(
+        data_frame, ["2", None], "CHROMOSOME", in_list=in_list)
+    expected_df = merge_filter(
+        data_frame, pd.DataFrame({"CHROMOSOME": ["2", None]}),
+        ["CHROMOSOME"], ["CHROMOSOME"], in_list)
+    pd.testing.assert_frame_equal(filtered_df, expected_df)
+    assert len(filter_dataframe_by_list(data_frame, "X", "CHROMOSOME")) == \
+        (data_frame["CHROMOSOME"] == "X").sum()
+
+
+def test_concatenate_ranges():
+    assert list(concatenate_ranges([5, 0, 3, 9], [7, 2, 3, 8])) == [
+        5, 6, 0, 1]
+    assert len(concatenate_ranges([], [])) == 0
+
+
+@pytest.mark.parametrize("operator", ["==", "!=", ">", "<", ">=", "<="])
+def test_filter_by_predicates_missing_values(operator):
+    data_frame = pd.DataFrame({"ALLELE_FREQUENCY": [0, 0.5, np.nan, 0,
+                                                    np.nan, 1]})
+    filtered_df = filter_dataframe_by_predicates(
+        data_frame, [("ALLELE_FREQUENCY", operator, 0)])
+    pd.testing.assert_frame_equal(
+        filtered_df, data_frame.query(f"ALLELE_FREQUENCY {operator} 0"))
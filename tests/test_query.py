@@ -1,6 +1,20 @@
 import context  # noqa: F401
-from aigct.model import VEQueryCriteria
+from aigct.model import (
+    AlleleFrequencyFilter,
+    GeneFilter,
+    NamedFilter,
+    RegionFilter,
+    VariantIdFilter,
+    VEQueryCriteria
+)
 from aigct.query import VEBenchmarkQueryMgr
+from aigct.repository import (
+    RepoSessionContext,
+    TABLE_DEFS,
+    VariantEffectScoreRepository,
+    VariantFilterRepository,
+    VariantRepository
+)
 
 
 def test_query_criteria(ve_bm_query_mgr: VEBenchmarkQueryMgr,
@@ -64,3 +78,79 @@ def test_query_dist(ve_bm_query_mgr: VEBenchmarkQueryMgr,
                                                         qry=qry)
     assert len(dist_qry) > 0 and len(dist_qry) < len(dist_gene)
 
+
+def test_cache_memory_report(ve_bm_query_mgr: VEBenchmarkQueryMgr,
+                             repo_copy):
+    # Tables cached from another repository are not reported
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    variant_repo = VariantRepository(session_context)
+    VariantEffectScoreRepository(
+        session_context, variant_repo,
+        VariantFilterRepository(session_context, variant_repo)).get("CANCER")
+    scores_df = ve_bm_query_mgr.get_variant_effect_scores("CANCER")
+    assert scores_df["SCORE_SOURCE"].dtype == "category"
+    assert scores_df["RANK_SCORE"].dtype == "float32"
+    report_df = ve_bm_query_mgr.get_cache_memory_report()
+    score_report = report_df[
+        (report_df["TABLE_NAME"] == "VARIANT_EFFECT_SCORE") &
+        (report_df["TASK_CODE"] == "CANCER")]
+    assert len(score_report) == 1
+    assert score_report["MEMORY_BYTES"].iloc[0] > 0
+
+
+def test_query_regions(ve_bm_query_mgr: VEBenchmarkQueryMgr, tmp_path):
+    variants_df = ve_bm_query_mgr.get_all_variants()
+    chr1_df = variants_df[variants_df["CHROMOSOME"] == "1"]
+    start, end = chr1_df["POSITION"].quantile([0.25, 0.75]).astype(int)
+    expected = set(chr1_df.loc[chr1_df["POSITION"].between(start, end),
+                               "VARIANT_ID"])
+    region_df = ve_bm_query_mgr.get_variants_in_regions(
+        [f"chr1:{start}-{end}"])
+    assert set(region_df["VARIANT_ID"]) == expected
+    # BED regions are 0-based and half open
+    bed_file = tmp_path / "panel.bed"
+    bed_file.write_text(f"track name=panel\nchr1\t{start - 1}\t{end}\n")
+    region_df = ve_bm_query_mgr.get_variants(
+        VEQueryCriteria(regions=str(bed_file)))
+    assert set(region_df["VARIANT_ID"]) == expected
+    outside_df = ve_bm_query_mgr.get_variants(
+        VEQueryCriteria(regions=[f"1:{start}-{end}"], include_regions=False))
+    assert len(outside_df) == len(variants_df) - len(expected)
+    label_df = ve_bm_query_mgr.get_variants_in_regions(
+        [f"1:{start}-{end}"], "CANCER")
+    assert set(label_df["VARIANT_ID"]) <= expected
+    assert "BINARY_LABEL" in label_df.columns
+
+
+def test_query_filter_expression(ve_bm_query_mgr: VEBenchmarkQueryMgr):
+    def variant_ids(qry):
+        return set(ve_bm_query_mgr.get_variants_by_task("CANCER", qry)[
+            "VARIANT_ID"])
+
+    oncogene = variant_ids(VEQueryCriteria(filter_name="Oncogene"))
+    tsg = variant_ids(VEQueryCriteria(filter_name="TSG"))
+    genes = variant_ids(VEQueryCriteria(gene_symbols=["MTOR", "PTEN"]))
+    rare = variant_ids(VEQueryCriteria(allele_frequency_max=1.0e-4,
+                                       allele_frequency_max_inclusive=False))
+    training_df = ve_bm_query_mgr.get_variants_by_task("CANCER").iloc[:200]
+    training = set(training_df["VARIANT_ID"])
+    expression = ((NamedFilter("Oncogene") | NamedFilter("TSG") |
+                   GeneFilter(["MTOR", "PTEN"])) &
+                  AlleleFrequencyFilter(maximum=1.0e-4,
+                                        maximum_inclusive=False)) - \
+        VariantIdFilter(training_df[["GENOME_ASSEMBLY", "CHROMOSOME",
+                                     "POSITION", "REFERENCE_NUCLEOTIDE",
+                                     "ALTERNATE_NUCLEOTIDE"]])
+    expected = ((oncogene | tsg | genes) & rare) - training
+    assert set(ve_bm_query_mgr.get_variants_by_filter_expression(
+        "CANCER", expression)["VARIANT_ID"]) == expected
+    # Combined with the other criteria by intersection
+    assert variant_ids(VEQueryCriteria(
+        filter_name="Oncogene", filter_expression=expression)) == \
+        expected & oncogene
+    variants_df = ve_bm_query_mgr.get_variants_by_task("CANCER")
+    chromosome = variants_df["CHROMOSOME"].iloc[0]
+    assert set(ve_bm_query_mgr.get_variants_by_filter_expression(
+        "CANCER", RegionFilter([f"chr{chromosome}:1-300000000"]))[
+            "VARIANT_ID"]) == set(variants_df.loc[
+                variants_df["CHROMOSOME"] == chromosome, "VARIANT_ID"])
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+import context  # noqa: F401
+from aigct.regions import (
+    RegionIndex,
+    parse_region,
+    regions_data_frame
+)
+
+
+def test_parse_region():
+    assert parse_region("chr7:1,000-2,000") == ("chr7", 1000, 2000)
+    assert parse_region("X:150") == ("X", 150, 150)
+    with pytest.raises(Exception):
+        parse_region("150-200")
+
+
+def test_region_index():
+    variant_df = pd.DataFrame({
+        "CHROMOSOME": ["1", "1", "2", "1", "X", "2"],
+        "POSITION": [500, 100, 100, 300, 50, 900],
+        "VARIANT_ID": [0, 1, 2, 3, 4, 5]})
+    index = RegionIndex(variant_df)
+    regions_df = regions_data_frame(["chr1:100-300", "2:800-1000",
+                                     "1:400-450", "Y:1-1000",
+                                     "chr1:300-300"])
+    assert list(index.variant_ids(regions_df)) == [1, 3, 5]
+    assert len(index.variant_ids(regions_data_frame(["3:1-10"]))) == 0
+    assert list(index.variant_ids(pd.DataFrame(
+        {"CHROMOSOME": ["X"], "START": [-5], "END": [np.int64(1) << 40]}))
+                ) == [4]
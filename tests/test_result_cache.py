@@ -0,0 +1,138 @@
+import os
+import pandas as pd
+import pytest
+import context  # noqa: F401
+from aigct.analyzer import VEAnalyzer
+from aigct.model import VEQueryCriteria
+from aigct.repository import (
+    RepoSessionContext,
+    TABLE_DEFS,
+    VariantRepository,
+    VariantFilterRepository,
+    VariantEffectLabelRepository,
+    VariantEffectScoreRepository,
+    VariantEffectSourceRepository
+)
+from aigct.result_cache import AnalysisResultCache, fingerprint
+
+
+def cache_analyzer(session_context, result_cache):
+    variant_repo = VariantRepository(session_context)
+    filter_repo = VariantFilterRepository(session_context)
+    score_repo = VariantEffectScoreRepository(session_context, variant_repo,
+                                              filter_repo)
+    return VEAnalyzer(
+        score_repo,
+        VariantEffectLabelRepository(session_context, variant_repo,
+                                     filter_repo),
+        VariantEffectSourceRepository(session_context, score_repo),
+        variant_repo,
+        result_cache=result_cache)
+
+
+def fail(*args):
+    raise AssertionError("analysis recomputed")
+
+
+def test_fingerprint():
+    df = pd.DataFrame({"A": [1, 2], "B": ["x", "y"]})
+    criteria = VEQueryCriteria(gene_symbols=["MTOR"], filter_name="Oncogene")
+    assert fingerprint([df, criteria]) == fingerprint(
+        [df.copy(), VEQueryCriteria(gene_symbols=["MTOR"],
+                                    filter_name="Oncogene")])
+    assert fingerprint(df) != fingerprint(df.assign(A=[1, 3]))
+    assert fingerprint(df) != fingerprint(df.astype({"A": "float64"}))
+    assert fingerprint(criteria) != fingerprint(
+        VEQueryCriteria(gene_symbols=["MTOR"], include_genes=False,
+                        filter_name="Oncogene"))
+    assert fingerprint(1) != fingerprint("1")
+
+
+def test_result_cache_memory(repo_copy, sample_user_scores, monkeypatch):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    analyzer = cache_analyzer(session_context,
+                              AnalysisResultCache(session_context,
+                                                  max_entries=1))
+    criteria = VEQueryCriteria(gene_symbols=["MTOR", "PTEN"])
+    metrics = analyzer.compute_metrics("CANCER", sample_user_scores,
+                                       variant_query_criteria=criteria)
+    monkeypatch.setattr(analyzer, "_analyze", fail)
+    cached = analyzer.compute_metrics(
+        "CANCER", sample_user_scores.copy(),
+        variant_query_criteria=VEQueryCriteria(
+            gene_symbols=["MTOR", "PTEN"]))
+    pd.testing.assert_frame_equal(cached.roc_metrics, metrics.roc_metrics)
+    # The cached result is not affected by changes to a returned one
+    cached.roc_metrics["ROC_AUC"] = 0
+    cached = analyzer.compute_metrics("CANCER", sample_user_scores,
+                                      variant_query_criteria=criteria)
+    pd.testing.assert_frame_equal(cached.roc_metrics, metrics.roc_metrics)
+    user_ve_scores = metrics.user_analysis.user_ve_scores.copy()
+    cached.user_analysis.user_ve_scores["RANK_SCORE"] = 0
+    cached.user_analysis.user_ve_scores_labels["RANK_SCORE"] = 0
+    cached = analyzer.compute_metrics("CANCER", sample_user_scores,
+                                      variant_query_criteria=criteria)
+    pd.testing.assert_frame_equal(cached.user_analysis.user_ve_scores,
+                                  user_ve_scores)
+    assert (cached.user_analysis.user_ve_scores_labels["RANK_SCORE"] !=
+            0).any()
+    changed_scores = sample_user_scores.assign(
+        RANK_SCORE=sample_user_scores["RANK_SCORE"] * 0.5)
+    with pytest.raises(AssertionError):
+        analyzer.compute_metrics("CANCER", changed_scores,
+                                 variant_query_criteria=criteria)
+
+
+def test_result_cache_disk(repo_copy, tmp_path, monkeypatch):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    cache_dir = os.path.join(tmp_path, "result_cache")
+    analyzer = cache_analyzer(session_context, AnalysisResultCache(
+        session_context, max_entries=0, cache_dir=cache_dir))
+    metrics = analyzer.compute_metrics("CANCER", metrics="roc")
+    assert len(os.listdir(cache_dir)) == 1
+    monkeypatch.setattr(analyzer, "_analyze", fail)
+    # A new cache on the same directory, as in a later session
+    analyzer._result_cache = AnalysisResultCache(
+        session_context, max_entries=0, cache_dir=cache_dir,
+        max_disk_bytes=0)
+    cached = analyzer.compute_metrics("CANCER", metrics="roc")
+    pd.testing.assert_frame_equal(cached.roc_metrics, metrics.roc_metrics)
+    monkeypatch.undo()
+    # Files are evicted once over max_disk_bytes
+    analyzer.compute_metrics("CANCER", metrics="pr")
+    assert len(os.listdir(cache_dir)) == 0
+
+
+def test_result_cache_repository_changes(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    analyzer = cache_analyzer(session_context,
+                              AnalysisResultCache(session_context))
+    metrics = analyzer.compute_metrics("CANCER", metrics="roc")
+    score_file = session_context.table_file("VARIANT_EFFECT_SCORE",
+                                            "CANCER")
+    score_df = pd.read_csv(score_file)
+    score_df[score_df["SCORE_SOURCE"] != "REVEL"].to_csv(score_file,
+                                                         index=False)
+    changed_metrics = analyzer.compute_metrics("CANCER", metrics="roc")
+    assert "REVEL" in list(metrics.roc_metrics["SCORE_SOURCE"])
+    assert "REVEL" not in list(changed_metrics.roc_metrics["SCORE_SOURCE"])
+
+
+def test_result_cache_region_file_changes(repo_copy, tmp_path):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    analyzer = cache_analyzer(session_context,
+                              AnalysisResultCache(session_context))
+    bed_file = tmp_path / "panel.bed"
+    bed_file.write_text("chr1\t0\t248956422\nchr2\t0\t242193529\n")
+    criteria = VEQueryCriteria(regions=str(bed_file))
+    metrics = analyzer.compute_metrics("CANCER", metrics="roc",
+                                       variant_query_criteria=criteria)
+    bed_file.write_text("chr1\t0\t248956422\n")
+    changed_metrics = analyzer.compute_metrics(
+        "CANCER", metrics="roc", variant_query_criteria=criteria)
+    assert changed_metrics.num_variants_included < \
+        metrics.num_variants_included
+    assert changed_metrics.num_variants_included == cache_analyzer(
+        session_context, None).compute_metrics(
+            "CANCER", metrics="roc",
+            variant_query_criteria=criteria).num_variants_included
@@ -0,0 +1,71 @@
+import os
+import pandas as pd
+import pytest
+import context  # noqa: F401
+from aigct.analyzer import VEAnalyzer
+from aigct.model import VEQueryCriteria
+from aigct.repository import (
+    RepoSessionContext,
+    TABLE_DEFS,
+    VariantRepository,
+    VariantFilterRepository,
+    VariantEffectLabelRepository,
+    VariantEffectScoreRepository,
+    VariantEffectSourceRepository
+)
+from aigct.snapshot import AnalysisSnapshotStore
+
+
+@pytest.fixture
+def snapshot_analyzer(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    variant_repo = VariantRepository(session_context)
+    filter_repo = VariantFilterRepository(session_context)
+    score_repo = VariantEffectScoreRepository(session_context, variant_repo,
+                                              filter_repo)
+    return session_context, VEAnalyzer(
+        score_repo,
+        VariantEffectLabelRepository(session_context, variant_repo,
+                                     filter_repo),
+        VariantEffectSourceRepository(session_context, score_repo),
+        variant_repo,
+        snapshot_store=AnalysisSnapshotStore(session_context))
+
+
+def test_snapshot_served(snapshot_analyzer, monkeypatch):
+    session_context, analyzer = snapshot_analyzer
+    criteria = VEQueryCriteria(filter_name="Oncogene")
+    metrics = analyzer.compute_metrics("CANCER",
+                                       variant_query_criteria=criteria,
+                                       vep_min_overlap_percent=50)
+    assert len(os.listdir(session_context.snapshot_folder("CANCER"))) == 1
+
+    def fail(*args):
+        raise AssertionError("analysis recomputed")
+    monkeypatch.setattr(analyzer, "_analyze", fail)
+    snapshot = analyzer.compute_metrics("CANCER",
+                                        variant_query_criteria=criteria,
+                                        vep_min_overlap_percent=50)
+    pd.testing.assert_frame_equal(snapshot.roc_metrics, metrics.roc_metrics)
+    pd.testing.assert_frame_equal(snapshot.pr_curve_coordinates,
+                                  metrics.pr_curve_coordinates)
+    # Different parameters or query criteria other than a filter name
+    # are not served from the snapshot
+    with pytest.raises(AssertionError):
+        analyzer.compute_metrics("CANCER", vep_min_overlap_percent=50)
+    with pytest.raises(AssertionError):
+        analyzer.compute_metrics("CANCER", variant_query_criteria=(
+            VEQueryCriteria(filter_name="Oncogene", gene_symbols=["MTOR"])))
+
+
+def test_snapshot_recomputed_when_repository_changes(snapshot_analyzer):
+    session_context, analyzer = snapshot_analyzer
+    metrics = analyzer.compute_metrics("CANCER", metrics="roc")
+    score_file = session_context.table_file("VARIANT_EFFECT_SCORE",
+                                            "CANCER")
+    score_df = pd.read_csv(score_file)
+    score_df[score_df["SCORE_SOURCE"] != "REVEL"].to_csv(score_file,
+                                                         index=False)
+    changed_metrics = analyzer.compute_metrics("CANCER", metrics="roc")
+    assert "REVEL" in list(metrics.roc_metrics["SCORE_SOURCE"])
+    assert "REVEL" not in list(changed_metrics.roc_metrics["SCORE_SOURCE"])
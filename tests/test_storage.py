@@ -0,0 +1,97 @@
+import os
+import pytest
+import context  # noqa: F401
+from aigct.repository import (
+    RepoSessionContext,
+    TABLE_DEFS,
+    VARIANT_KEY_COLUMN,
+    VARIANT_PK_COLUMNS,
+    convert_repository,
+    read_keyed_table
+)
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_convert_repository(repo_copy, file_format):
+    convert_repository(repo_copy, file_format)
+    csv_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    converted_context = RepoSessionContext(repo_copy, TABLE_DEFS,
+                                           file_format)
+    assert os.path.exists(converted_context.table_file(
+        "VARIANT_EFFECT_SCORE", "CANCER"))
+    for table_name, task in [("VARIANT", None),
+                             ("VARIANT_EFFECT_LABEL", "CANCER"),
+                             ("VARIANT_EFFECT_SCORE", "CANCER"),
+                             ("VARIANT_FILTER_VARIANT", "CANCER")]:
+        csv_df = read_keyed_table(csv_context, table_name, task)
+        converted_df = converted_context.read_table(table_name, task)
+        assert VARIANT_KEY_COLUMN in converted_context.table_columns(
+            table_name, task)
+        assert list(csv_df.columns) == list(converted_df.columns)
+        assert len(csv_df) == len(converted_df)
+        assert (csv_df.dtypes == converted_df.dtypes).all()
+    score_df = converted_context.read_table(
+        "VARIANT_EFFECT_SCORE", "CANCER", columns=["SCORE_SOURCE",
+                                                   "RANK_SCORE"])
+    assert list(score_df.columns) == ["SCORE_SOURCE", "RANK_SCORE"]
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_read_table_predicates(repo_copy, file_format):
+    convert_repository(repo_copy, file_format)
+    csv_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    converted_context = RepoSessionContext(repo_copy, TABLE_DEFS,
+                                           file_format)
+    predicates = [("SCORE_SOURCE", "in", ["REVEL", "EVE"]),
+                  ("RANK_SCORE", ">", 0.5)]
+    columns = ["SCORE_SOURCE", "POSITION", "RANK_SCORE"]
+    csv_df = csv_context.read_table("VARIANT_EFFECT_SCORE", "CANCER",
+                                    columns, predicates)
+    converted_df = converted_context.read_table(
+        "VARIANT_EFFECT_SCORE", "CANCER", columns, predicates)
+    assert list(converted_df.columns) == columns
+    assert set(converted_df["SCORE_SOURCE"]) == {"REVEL", "EVE"}
+    assert (converted_df["RANK_SCORE"] > 0.5).all()
+    assert len(csv_df) == len(converted_df)
+    variant_df = converted_context.read_table(
+        "VARIANT", columns=["GENE_SYMBOL"],
+        predicates=[("GENE_SYMBOL", "not in", ["MTOR"])])
+    assert len(variant_df) == len(csv_context.read_table(
+        "VARIANT", predicates=[("GENE_SYMBOL", "not in", ["MTOR"])]))
+    # "!=" keeps the variants without an allele frequency
+    predicates = [("ALLELE_FREQUENCY", "!=", 0)]
+    csv_df = csv_context.read_table("VARIANT", predicates=predicates)
+    assert len(csv_df) == len(csv_context.read_table("VARIANT").query(
+        "ALLELE_FREQUENCY != 0"))
+    assert csv_df["ALLELE_FREQUENCY"].isna().any()
+    assert len(converted_context.read_table(
+        "VARIANT", columns=["GENE_SYMBOL"], predicates=predicates)) == \
+        len(csv_df)
+
+
+def test_variant_key_index(repo_copy):
+    session_context = RepoSessionContext(repo_copy, TABLE_DEFS)
+    variant_df = read_keyed_table(session_context, "VARIANT")
+    assert variant_df[VARIANT_KEY_COLUMN].is_unique
+    assert (variant_df[VARIANT_KEY_COLUMN] >= 0).all()
+    convert_repository(repo_copy, "csv")
+    label_df = session_context.read_table("VARIANT_EFFECT_LABEL", "CANCER")
+    merged_df = label_df.merge(variant_df, on=VARIANT_PK_COLUMNS,
+                               suffixes=(None, "_VARIANT"))
+    assert len(merged_df) == len(label_df)
+    assert (merged_df[VARIANT_KEY_COLUMN] ==
+            merged_df[VARIANT_KEY_COLUMN + "_VARIANT"]).all()
+
+
+def test_arrow_files_memory_mappable(repo_copy):
+    import pyarrow as pa
+    convert_repository(repo_copy, "arrow")
+    arrow_context = RepoSessionContext(repo_copy, TABLE_DEFS, "arrow")
+    allocated_bytes = pa.total_allocated_bytes()
+    table = pa.ipc.open_file(pa.memory_map(arrow_context.table_file(
+        "VARIANT_EFFECT_SCORE", "CANCER"))).read_all()
+    # Uncompressed buffers are used in place rather than decompressed
+    assert table.nbytes > 0
+    assert pa.total_allocated_bytes() == allocated_bytes
@@ -0,0 +1,131 @@
+import os
+import struct
+import zlib
+import pandas as pd
+import pytest
+import context  # noqa: F401
+from aigct.repository import VARIANT_PK_COLUMNS, VARIANT_KEY_COLUMN
+from aigct.user_scores import (
+    read_user_score_chunks,
+    read_vcf_score_chunks,
+    is_bgzf_file,
+    user_scores_file_format
+)
+
+VCF_HEADER = ("##fileformat=VCFv4.2\n"
+              "##INFO=<ID=SC,Number=A,Type=Float,Description=\"Score\">\n"
+              "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+
+
+def write_bgzf(file_name: str, text: str, block_size: int = 1000):
+    """Writes text compressed as BGZF blocks followed by an EOF block"""
+    data = text.encode()
+    with open(file_name, "wb") as file:
+        for start in range(0, len(data) + 1, block_size):
+            piece = data[start:start + block_size] if start < len(data) \
+                else b""
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+            deflated = compressor.compress(piece) + compressor.flush()
+            file.write(b"\x1f\x8b\x08\x04" + bytes(6) +
+                       struct.pack("<H2sHH", 6, b"BC", 2,
+                                   len(deflated) + 25) +
+                       deflated +
+                       struct.pack("<II", zlib.crc32(piece), len(piece)))
+
+
+def to_vcf(user_scores_df: pd.DataFrame) -> str:
+    return VCF_HEADER + "".join(
+        f"chr{row.CHROMOSOME}\t{row.POSITION}\t.\t"
+        f"{row.REFERENCE_NUCLEOTIDE}\t{row.ALTERNATE_NUCLEOTIDE}\t.\t."
+        f"\tDP=10;SC={row.RANK_SCORE!r}\n"
+        for row in user_scores_df.itertuples())
+
+
+@pytest.fixture
+def user_scores_with_unlabeled(sample_user_scores):
+    """User scores plus scores of variants unknown to the repository"""
+    unknown_df = sample_user_scores.iloc[:500].assign(
+        POSITION=lambda df: df["POSITION"] + 1000000000)
+    return pd.concat([sample_user_scores, unknown_df])[
+        VARIANT_PK_COLUMNS + ["RANK_SCORE"]]
+
+
+def test_user_scores_file_format():
+    assert user_scores_file_format("a/scores.csv") == ("csv", "infer")
+    assert user_scores_file_format("scores.TSV.gz") == ("tsv", "infer")
+    assert user_scores_file_format("scores.txt.bgz") == ("tsv", "gzip")
+    assert user_scores_file_format("scores.parquet")[0] == "parquet"
+    assert user_scores_file_format("scores.vcf.gz")[0] == "vcf"
+    with pytest.raises(Exception):
+        user_scores_file_format("scores.xlsx")
+
+
+def test_read_user_score_chunks(tmp_path, user_scores_with_unlabeled):
+    file_name = os.path.join(tmp_path, "scores.tsv.gz")
+    user_scores_with_unlabeled.rename(columns={"RANK_SCORE": "SCORE"}).to_csv(
+        file_name, sep="\t", index=False)
+    chunks = list(read_user_score_chunks(file_name, {"SCORE": "RANK_SCORE"},
+                                         chunk_size=1000))
+    assert len(chunks) == 3
+    scores_df = pd.concat(chunks, ignore_index=True)
+    assert list(scores_df.columns) == VARIANT_PK_COLUMNS + ["RANK_SCORE"]
+    assert len(scores_df) == len(user_scores_with_unlabeled)
+
+
+@pytest.mark.parametrize("file_name", ["scores.csv", "scores.parquet"])
+def test_compute_metrics_from_file(tmp_path, ve_analyzer, sample_user_scores,
+                                   user_scores_with_unlabeled, file_name):
+    file_name = os.path.join(tmp_path, file_name)
+    if file_name.endswith(".parquet"):
+        pytest.importorskip("pyarrow")
+        user_scores_with_unlabeled.to_parquet(file_name, index=False)
+    else:
+        user_scores_with_unlabeled.to_csv(file_name, index=False)
+    user_scores_df = ve_analyzer.read_user_scores("CANCER", file_name,
+                                                  chunk_size=700)
+    assert (user_scores_df[VARIANT_KEY_COLUMN] >= 0).all()
+    assert len(user_scores_df) <= len(sample_user_scores)
+    metrics = ve_analyzer.compute_metrics("CANCER", sample_user_scores)
+    file_metrics = ve_analyzer.compute_metrics_from_file(
+        "CANCER", file_name, chunk_size=700)
+    for attr in ["general_metrics", "roc_metrics", "pr_metrics",
+                 "roc_curve_coordinates", "pr_curve_coordinates"]:
+        pd.testing.assert_frame_equal(getattr(file_metrics, attr),
+                                      getattr(metrics, attr))
+
+
+@pytest.mark.parametrize("file_name", ["scores.vcf", "scores.vcf.gz"])
+def test_read_vcf_score_chunks(tmp_path, file_name):
+    text = VCF_HEADER + (
+        "chr1\t100\trs1\tA\tG,T\t.\tPASS\tSC=0.1,0.2;DP=3\n"
+        "2\t200\t.\tC\tA,G\t.\t.\tXSC=0.9;SC=0.3\n"
+        "chrX\t300\t.\tG\tC\t.\t.\tDP=4\n"
+        "chr3\t400\t.\tT\tA\t.\t.\tSC=.\n"
+        "chr4\t500\t.\tT\tC\t.\t.\tSC=0.5\n")
+    file_name = os.path.join(tmp_path, file_name)
+    if file_name.endswith(".gz"):
+        write_bgzf(file_name, text, 50)
+        assert is_bgzf_file(file_name)
+    else:
+        with open(file_name, "w") as file:
+            file.write(text)
+    scores_df = pd.concat(read_vcf_score_chunks(file_name, "SC", 2,
+                                                threads=2))
+    assert list(scores_df.columns) == VARIANT_PK_COLUMNS + ["RANK_SCORE"]
+    assert (scores_df["GENOME_ASSEMBLY"] == "hg38").all()
+    assert list(scores_df["CHROMOSOME"]) == ["1", "1", "2", "2", "4"]
+    assert list(scores_df["ALTERNATE_NUCLEOTIDE"]) == ["G", "T", "A", "G",
+                                                       "C"]
+    assert list(scores_df["RANK_SCORE"]) == [0.1, 0.2, 0.3, 0.3, 0.5]
+
+
+def test_compute_metrics_from_vcf(tmp_path, ve_analyzer, sample_user_scores,
+                                  user_scores_with_unlabeled):
+    file_name = os.path.join(tmp_path, "scores.vcf.bgz")
+    write_bgzf(file_name, to_vcf(user_scores_with_unlabeled), 64000)
+    metrics = ve_analyzer.compute_metrics("CANCER", sample_user_scores)
+    file_metrics = ve_analyzer.compute_metrics_from_file(
+        "CANCER", file_name, vcf_info_key="SC", chunk_size=700)
+    for attr in ["general_metrics", "roc_metrics", "pr_metrics"]:
+        pd.testing.assert_frame_equal(getattr(file_metrics, attr),
+                                      getattr(metrics, attr))